@@ -0,0 +1,135 @@
+"""
+Single-flight execution of expensive admin actions.
+
+Streamlit runs every browser session's script in its own thread of one server process, so a
+double-click, or two admins clicking at once, would otherwise run the same heavy operation twice.
+Requests for an action that is already running join it: they wait for the one execution in flight
+and get its result. A finished action can't be run again until its minimum interval has passed,
+and only MAX_CONCURRENT_ACTIONS different actions run at a time, so heavy work never stacks up
+behind page rendering. Joined requests wait at most ACTION_WAIT_SECONDS, so a hung action can't pin
+every session that clicked its button. The state of every action (running since, last result) is kept for the
+admin page to show.
+
+Actions return (success, message) like the database helpers; a rejected request gets
+(False, reason) without running anything.
+"""
+
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as WaitTimeout
+from datetime import datetime
+
+MAX_CONCURRENT_ACTIONS = 1
+# Action -> seconds after it finishes before it may run again
+ACTION_MIN_INTERVALS = {
+    "clear_database": 10,
+    "populate_config": 10,
+    "populate_yaml": 10,
+    "recompute_scores": 30,
+}
+DEFAULT_MIN_INTERVAL = 10
+ACTION_WAIT_SECONDS = 120
+
+
+class ActionState:
+    """What an action is doing now and how its last run went"""
+
+    def __init__(self, action: str):
+        self.action = action
+        self.future = None  # Set while a run is in flight
+        self.key = None  # What the run in flight was asked to do; requests with the same key join it
+        self.started_at = None
+        self.waiters = 0  # Requests that joined the run in flight
+        self.finished_at = None
+        self.finished_monotonic = None
+        self.result = None
+
+    @property
+    def running(self) -> bool:
+        return self.future is not None
+
+
+class SingleFlight:
+    """Coalesces, rate limits and caps the concurrency of named actions"""
+
+    def __init__(self, min_intervals=None, max_concurrent: int = MAX_CONCURRENT_ACTIONS,
+                 wait_seconds: float = ACTION_WAIT_SECONDS):
+        self.min_intervals = dict(min_intervals or {})
+        self.max_concurrent = max_concurrent
+        self.wait_seconds = wait_seconds
+        self._states = {}
+        self._lock = threading.Lock()
+
+    def state(self, action: str) -> ActionState:
+        with self._lock:
+            return self._states.setdefault(action, ActionState(action))
+
+    def running(self):
+        """States of the actions in flight"""
+        with self._lock:
+            return [state for state in self._states.values() if state.running]
+
+    def _rejection(self, state, key, now):
+        """Why a new run of the action can't start now, or None"""
+        interval = self.min_intervals.get(state.action, DEFAULT_MIN_INTERVAL)
+        if state.running:
+            return f"{state.action} is already running with different input; try again when it finishes"
+        if state.finished_monotonic is not None and now - state.finished_monotonic < interval:
+            wait = interval - (now - state.finished_monotonic)
+            return f"{state.action} just ran; try again in {wait:.0f}s"
+        busy = [other.action for other in self._states.values() if other.running]
+        if len(busy) >= self.max_concurrent:
+            return f"Busy with {', '.join(busy)}; try again when it finishes"
+        return None
+
+    def run(self, action: str, func, *args, key=None):
+        """Run func(*args) as action, or join the identical run already in flight; returns its result"""
+        key = action if key is None else key
+        with self._lock:
+            state = self._states.setdefault(action, ActionState(action))
+            if state.running and state.key == key:
+                state.waiters += 1
+                future, leader = state.future, False
+            else:
+                reason = self._rejection(state, key, time.monotonic())
+                if reason is not None:
+                    return False, reason
+                future, leader = Future(), True
+                state.future, state.key = future, key
+                state.started_at, state.waiters = datetime.now(), 0
+
+        if not leader:
+            try:
+                return future.result(timeout=self.wait_seconds)
+            except WaitTimeout:
+                return False, f"{action} is still running after {self.wait_seconds:.0f}s; check back later"
+
+        # Stays the result if func is interrupted by a BaseException, which is re-raised after cleanup
+        result = False, f"{action} was interrupted"
+        try:
+            result = func(*args)
+        except Exception as e:
+            result = False, f"Error running {action}: {str(e)}"
+        finally:
+            with self._lock:
+                state.future = state.key = None
+                state.result = result
+                state.finished_at = datetime.now()
+                state.finished_monotonic = time.monotonic()
+            future.set_result(result)
+        return result
+
+
+# Shared by every admin session in this server process
+ADMIN_ACTIONS = SingleFlight(ACTION_MIN_INTERVALS)
+
+
+def recompute_scores():
+    """Run a scoring tick now"""
+    from scoring import run_scoring_tick
+
+    try:
+        scorecards = run_scoring_tick()
+        return True, f"Scored {len(scorecards)} teams"
+    except Exception as e:
+        return False, f"Error computing scores: {str(e)}"
@@ -0,0 +1,168 @@
+"""
+Database metrics for the admin page.
+
+Row counts for every table, the database size (page count times page size), each team's last upload
+and the last scoring tick are read in a single SELECT built from scalar subqueries; the per-team
+uploads come back as one JSON array. Only the WAL size comes from the file system. The result is
+cached for a few seconds, so Streamlit reruns don't re-query.
+Each collection is also kept as a sample in a bounded history, which gives per-table growth rates
+so storage pressure can be seen building during the event.
+"""
+
+import json
+import os
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from sqlalchemy import func, literal_column, select
+
+METRICS_CACHE_SECONDS = 5
+# Growth is measured against the oldest sample in this window
+GROWTH_WINDOW_SECONDS = 15 * 60
+MAX_SAMPLES = 256
+
+# Count key -> model name
+METRIC_TABLES = {
+    "teams": "Team",
+    "challenges": "Challenge",
+    "modifiers": "Modifier",
+    "offsets": "Offset",
+    "gpx_uploads": "GpxUpload",
+    "gpx_cleanups": "GpxCleanup",
+    "gpx_routes": "GpxRoute",
+    "scorecards": "Scorecard",
+    "jobs": "Job",
+}
+
+
+@dataclass(frozen=True)
+class AdminMetrics:
+    counts: Dict[str, int]
+    growth_per_hour: Dict[str, Optional[float]]  # None until there is an earlier sample to compare with
+    database_bytes: int
+    wal_bytes: int
+    last_uploads: List[dict]  # team_id, team_name, uploaded_at (None if the team never uploaded)
+    last_scoring_tick: Optional[datetime]
+    collected_at: datetime
+
+
+def counts_statement(keys):
+    """One SELECT returning the row count of each named table as a column"""
+    import models
+
+    return select(*(
+        select(func.count()).select_from(getattr(models, METRIC_TABLES[key])).scalar_subquery().label(key)
+        for key in keys
+    ))
+
+
+def metrics_statement():
+    """Every metric as one row: table counts, page count and size, last uploads (JSON) and last tick"""
+    from models import GpxUpload, StateVersion, Team
+    from scoring import SCOREBOARD_VERSION
+
+    last_upload = (
+        select(func.max(GpxUpload.uploaded_at)).where(GpxUpload.team_id == Team.id).scalar_subquery()
+    )
+    last_uploads = select(
+        func.json_group_array(func.json_array(Team.id, Team.name, last_upload))
+    ).scalar_subquery()
+    last_tick = select(StateVersion.updated_at).where(StateVersion.name == SCOREBOARD_VERSION).scalar_subquery()
+    return counts_statement(METRIC_TABLES).add_columns(
+        literal_column("(SELECT page_count FROM pragma_page_count())").label("page_count"),
+        literal_column("(SELECT page_size FROM pragma_page_size())").label("page_size"),
+        last_uploads.label("last_uploads"),
+        last_tick.label("last_scoring_tick"),
+    )
+
+
+def _file_size(path) -> int:
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+def _parse_time(value):
+    if value is None or isinstance(value, datetime):
+        return value
+    return datetime.fromisoformat(value)
+
+
+_samples = deque(maxlen=MAX_SAMPLES)  # (monotonic time, counts)
+_cache = None  # (AdminMetrics, monotonic time collected)
+_lock = threading.Lock()
+
+
+def growth_rates(counts, now, samples=_samples, window=GROWTH_WINDOW_SECONDS):
+    """Rows per hour for each table since the oldest sample within the window"""
+    baseline = next(((t, c) for t, c in samples if 0 < now - t <= window), None)
+    if baseline is None:
+        return {key: None for key in counts}
+    elapsed_hours = (now - baseline[0]) / 3600
+    return {key: (count - baseline[1].get(key, 0)) / elapsed_hours for key, count in counts.items()}
+
+
+def collect_metrics(db, now=None) -> AdminMetrics:
+    """Read every metric in one round trip and record it as a growth sample"""
+    now = time.monotonic() if now is None else now
+    row = db.execute(metrics_statement()).one()._mapping
+    counts = {key: row[key] for key in METRIC_TABLES}
+
+    path = db.get_bind().engine.url.database
+    last_uploads = [
+        {"team_id": team_id, "team_name": name, "uploaded_at": _parse_time(uploaded_at)}
+        for team_id, name, uploaded_at in json.loads(row["last_uploads"] or "[]")
+    ]
+
+    with _lock:
+        growth = growth_rates(counts, now)
+        _samples.append((now, counts))
+    return AdminMetrics(
+        counts=counts,
+        growth_per_hour=growth,
+        database_bytes=row["page_count"] * row["page_size"],
+        wal_bytes=_file_size(f"{path}-wal") if path not in (None, "", ":memory:") else 0,
+        last_uploads=sorted(last_uploads, key=lambda upload: upload["team_name"]),
+        last_scoring_tick=_parse_time(row["last_scoring_tick"]),
+        collected_at=datetime.now(),
+    )
+
+
+def get_admin_metrics(max_age: float = METRICS_CACHE_SECONDS) -> AdminMetrics:
+    """Metrics, collected at most once every max_age seconds in this process"""
+    global _cache
+    with _lock:
+        cached = _cache
+    if cached is not None and time.monotonic() - cached[1] < max_age:
+        return cached[0]
+
+    from database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        metrics = collect_metrics(db)
+    finally:
+        db.close()
+    with _lock:
+        _cache = (metrics, time.monotonic())
+    return metrics
+
+
+def invalidate():
+    """Drop the cached metrics (keeping the growth history) so the next read is current"""
+    global _cache
+    with _lock:
+        _cache = None
+
+
+def clear_cache():
+    """Forget the cached metrics and the growth history"""
+    global _cache
+    with _lock:
+        _cache = None
+        _samples.clear()
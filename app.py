@@ -3,8 +3,9 @@ import streamlit as st
 home = st.Page("pages/home.py")
 rules = st.Page("pages/rules.py")
 scoreboard = st.Page("pages/scoreboard.py")
+route_map = st.Page("pages/map.py")
 admin = st.Page("pages/admin.py")
 
-pg = st.navigation([home,rules,scoreboard,admin])
+pg = st.navigation([home,rules,scoreboard,route_map,admin])
 
 pg.run()
\ No newline at end of file
@@ -0,0 +1,106 @@
+"""
+Asyncio variant of the data-access layer in database.py.
+
+Background jobs (GPX ingest, the scoring tick, bulk exports) mostly wait on I/O, so they can use
+these coroutines to keep many operations in flight in one event loop. Validation and row building
+are shared with database.py; only the session handling differs.
+"""
+
+import asyncio
+import weakref
+from datetime import datetime
+
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.pool import NullPool
+
+from database import (
+    DATABASE_URL,
+    add_event_config,
+    bump_version_statement,
+    clean_gpx_data,
+    gpx_upload_message,
+    store_gpx_upload,
+)
+
+# Async database setup (aiosqlite for the local SQLite file)
+ASYNC_DATABASE_URL = DATABASE_URL.replace("sqlite://", "sqlite+aiosqlite://", 1)
+# Connections are cheap to open for a local file and must not outlive the event loop that made them
+async_engine = create_async_engine(ASYNC_DATABASE_URL, poolclass=NullPool)
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+# SQLite allows a single writer, so writes queue on a per-loop lock instead of failing with "database is locked"
+_write_locks = weakref.WeakKeyDictionary()
+
+
+def _write_lock():
+    loop = asyncio.get_running_loop()
+    lock = _write_locks.get(loop)
+    if lock is None:
+        lock = _write_locks[loop] = asyncio.Lock()
+    return lock
+
+
+async def get_database_status():
+    """Get current database status with counts of all entities"""
+    try:
+        from admin_metrics import counts_statement
+
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(counts_statement(["teams", "challenges", "modifiers", "offsets"]))
+        return dict(result.one()._mapping)
+
+    except Exception as e:
+        raise Exception(f"Error reading database status: {str(e)}")
+
+
+async def populate_from_yaml_data(config, source="YAML"):
+    """Populate database from parsed YAML data"""
+    from config import ConfigError, compile_config
+
+    try:
+        compiled = compile_config(config, source)
+
+        async with _write_lock(), AsyncSessionLocal() as db:
+            teams, challenges_created = await db.run_sync(add_event_config, compiled)
+            await db.commit()
+
+        return True, f"Successfully created {len(teams)} teams and {challenges_created} challenges from {source}"
+
+    except ConfigError as e:
+        return False, str(e)
+    except Exception as e:
+        return False, f"Error populating from {source}: {str(e)}"
+
+
+async def write_scorecards(scorecards):
+    """Store a batch of scorecards and publish a new scoreboard version in the same transaction"""
+    from scoring import SCOREBOARD_VERSION
+
+    async with _write_lock(), AsyncSessionLocal() as db:
+        db.add_all(scorecards)
+        await db.execute(bump_version_statement(SCOREBOARD_VERSION))
+        await db.commit()
+
+
+async def ingest_gpx_upload(team_id, gpx_data, uploaded_at=None):
+    """Store a team's GPX submission together with its cleanup summary"""
+    try:
+        uploaded_at = uploaded_at or datetime.now()
+        # Parsing is CPU work; keep it off the event loop so other uploads keep moving
+        cleaned = await asyncio.to_thread(clean_gpx_data, gpx_data)
+
+        async with _write_lock(), AsyncSessionLocal() as db:
+            upload = await db.run_sync(store_gpx_upload, team_id, gpx_data, cleaned, uploaded_at)
+            await db.commit()
+
+        return True, gpx_upload_message(upload, cleaned)
+
+    except ValueError as e:
+        return False, str(e)
+    except Exception as e:
+        return False, f"Error storing GPX upload: {str(e)}"
+
+
+async def ingest_gpx_uploads(uploads):
+    """Ingest many (team_id, gpx_data) submissions concurrently; results are in input order"""
+    return await asyncio.gather(*(ingest_gpx_upload(team_id, gpx_data) for team_id, gpx_data in uploads))
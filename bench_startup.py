@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Import-time benchmark for Floatpack Rideathon.
+
+Runs the top-level imports of each page (and the main library modules) in a fresh interpreter with
+`-X importtime` and reports the total import time, which is what a cold start or the first run of a
+page pays. Streamlit reruns of a page only re-execute the page script, so a page whose imports are
+light stays cheap to rerun too.
+
+Engines and models load on first use, but importing database still imports SQLAlchemy itself for the
+declarative Base and the sessionmaker. That cost remains on every page's startup path and is
+reported in its own column, so it isn't mistaken for having been removed.
+
+    python bench_startup.py              # every page and module
+    python bench_startup.py --top 10 pages/home.py
+"""
+
+import argparse
+import ast
+import os
+import subprocess
+import sys
+
+PAGES = ["pages/home.py", "pages/rules.py", "pages/scoreboard.py", "pages/map.py", "pages/admin.py"]
+MODULES = ["database", "models", "scoring", "penalties", "routes"]
+# Already loaded by the Streamlit server before any page runs
+PRELOADED = "import streamlit"
+# Imported by database at module level; reported separately
+REMAINING = "sqlalchemy"
+
+
+def page_imports(path):
+    """Source of the top-level import statements of a page script"""
+    with open(path, "r") as f:
+        tree = ast.parse(f.read(), path)
+    return "\n".join(ast.unparse(node) for node in tree.body if isinstance(node, (ast.Import, ast.ImportFrom)))
+
+
+def import_times(code, preload=""):
+    """(total microseconds, {module: cumulative microseconds}) for running code in a fresh interpreter"""
+    script = f"{preload}\nimport sys\nprint('-- measure --', file=sys.stderr)\n{code}"
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", script],
+        capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__))
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+
+    # Only count imports after the marker, i.e. not the interpreter's or the preload's
+    lines = result.stderr.split("-- measure --", 1)[-1].splitlines()
+    total = 0
+    modules = {}
+    for line in lines:
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = (part.strip() for part in line[len("import time:"):].split("|"))
+        total += int(self_us)
+        modules[name.strip()] = int(cumulative_us)
+    return total, modules
+
+
+def benchmark(target, runs):
+    """Median total import time in milliseconds, and the module timings of the median run"""
+    if target.endswith(".py"):
+        code, preload = page_imports(target), PRELOADED
+    else:
+        code, preload = f"import {target}", ""
+    samples = sorted((import_times(code, preload) for _ in range(runs)), key=lambda sample: sample[0])
+    total, modules = samples[len(samples) // 2]
+    return total / 1000, modules
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure page and module import times with -X importtime")
+    parser.add_argument("targets", nargs="*", help="Page scripts or module names (default: all)")
+    parser.add_argument("--runs", type=int, default=5, help="Runs per target; the median is reported")
+    parser.add_argument("--top", type=int, default=0, help="Also list the N slowest imports per target")
+    args = parser.parse_args()
+
+    targets = args.targets or PAGES + MODULES
+    width = max(len(target) for target in targets)
+    print(f"{'':<{width}}  {'total':>11}  {'of which ' + REMAINING:>20}")
+    for target in targets:
+        total_ms, modules = benchmark(target, args.runs)
+        remaining_ms = modules.get(REMAINING, 0) / 1000
+        print(f"{target:<{width}}  {total_ms:8.1f} ms  {remaining_ms:17.1f} ms")
+        slowest = sorted(modules.items(), key=lambda item: item[1], reverse=True)[:args.top]
+        for name, cumulative_us in slowest:
+            print(f"{'':<{width}}    {cumulative_us / 1000:8.1f} ms  {name}")
+
+
+if __name__ == "__main__":
+    main()
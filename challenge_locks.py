@@ -0,0 +1,154 @@
+"""
+Global lockout of charge challenges.
+
+A charge challenge can be completed by only one team; after that it is locked for everyone. Every
+team has its own row per challenge, so instead of scanning those rows the locked challenges are kept
+as a bitmap over their template index (Challenge.template_index: the config position, numbered on
+from earlier populations so re-populating never reuses a locked challenge's bit). The bitmap is
+stored in a single StateVersion row and cached in process, so an availability check is a bit test.
+Claims update the row with a compare-and-swap on its version, so only one team can win a challenge. The same
+transaction locks every other team's row for that challenge in one UPDATE.
+"""
+
+import threading
+import time
+from datetime import datetime
+
+from sqlalchemy import event, select, update
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.orm import Session
+
+LOCKS_NAME = "challenge_locks"
+# Claims are safe regardless (they re-read the row); this only bounds how stale a listing can be
+LOCK_CACHE_SECONDS = 2
+MAX_CLAIM_ATTEMPTS = 5
+
+_PENDING_KEY = "challenge_locks_pending"
+
+_cache = None  # (version, bitmap, monotonic time loaded)
+_lock = threading.Lock()
+
+
+def read_locks(db):
+    """(version, bitmap) of the locked challenges as stored in the database"""
+    from models import StateVersion
+
+    row = db.query(StateVersion.version, StateVersion.value).filter(StateVersion.name == LOCKS_NAME).first()
+    if row is None:
+        return 0, 0
+    return row.version, int(row.value or "0", 16)
+
+
+def get_locks(db=None, max_age: float = LOCK_CACHE_SECONDS) -> int:
+    """Bitmap of locked challenge template indexes, cached in process for up to max_age seconds"""
+    with _lock:
+        cached = _cache
+    if cached is not None and time.monotonic() - cached[2] < max_age:
+        return cached[1]
+
+    from database import SessionLocal
+
+    session = db or SessionLocal()
+    try:
+        version, bitmap = read_locks(session)
+    finally:
+        if db is None:
+            session.close()
+    _remember(version, bitmap)
+    return bitmap
+
+
+def _remember(version, bitmap):
+    global _cache
+    with _lock:
+        # Never replace a newer bitmap with an older one read concurrently
+        if _cache is None or version >= _cache[0]:
+            _cache = (version, bitmap, time.monotonic())
+
+
+def is_locked(template_index, db=None) -> bool:
+    """Whether another team has already claimed the charge challenge at this config position"""
+    if template_index is None:
+        return False
+    return bool(get_locks(db) >> template_index & 1)
+
+
+def _compare_and_swap(db, version, bitmap) -> bool:
+    """Store a new bitmap if the row is still at version; returns whether this writer won"""
+    from models import StateVersion
+
+    value = format(bitmap, "x")
+    if version == 0:
+        statement = insert(StateVersion).values(
+            name=LOCKS_NAME, version=1, value=value, updated_at=datetime.now()
+        ).on_conflict_do_nothing(index_elements=[StateVersion.name])
+    else:
+        statement = update(StateVersion).where(
+            StateVersion.name == LOCKS_NAME, StateVersion.version == version
+        ).values(version=version + 1, value=value, updated_at=datetime.now())
+    return db.execute(statement).rowcount == 1
+
+
+def claim_charge_challenge(db, challenge, now=None) -> bool:
+    """Lock a charge challenge for its team; False if another team got it first (the caller commits).
+
+    Every other team's row for the challenge is marked LOCKED in one statement, and any attempt in
+    progress on those rows has its distance pause ended.
+    """
+    from models import Challenge, ChallengeStatus, Modifier
+
+    index = challenge.template_index
+    now = now or datetime.now()
+    for _ in range(MAX_CLAIM_ATTEMPTS):
+        version, bitmap = read_locks(db)
+        if bitmap >> index & 1:
+            _remember(version, bitmap)
+            return False
+        if _compare_and_swap(db, version, bitmap | 1 << index):
+            break
+    else:
+        raise RuntimeError(f"Could not claim challenge {challenge.name!r}: too much contention")
+
+    others = (Challenge.template_index == index, Challenge.id != challenge.id)
+    active = select(Challenge.id).where(*others, Challenge.status == ChallengeStatus.ACTIVE)
+    interrupted = [team_id for (team_id,) in db.execute(select(Challenge.team_id).where(Challenge.id.in_(active)))]
+    db.execute(
+        update(Modifier).where(Modifier.challenge_id.in_(active), Modifier.end.is_(None)).values(end=now)
+    )
+    db.execute(
+        update(Challenge).where(
+            *others, Challenge.status.in_([ChallengeStatus.AVAILABLE, ChallengeStatus.ACTIVE])
+        ).values(status=ChallengeStatus.LOCKED),
+        execution_options={"synchronize_session": False}
+    )
+    if interrupted:
+        # The bulk UPDATEs bypass team_status's listeners, so tell other processes their caches are stale
+        import team_status
+        from database import bump_version
+        bump_version(db, team_status.TEAM_STATUS_VERSION)
+    db.info.setdefault(_PENDING_KEY, []).append((version + 1, bitmap | 1 << index, interrupted))
+    return True
+
+
+def clear_cache():
+    global _cache
+    with _lock:
+        _cache = None
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_pending_claims(session):
+    pending = session.info.pop(_PENDING_KEY, None)
+    if not pending:
+        return
+    import team_status
+
+    for version, bitmap, interrupted in pending:
+        _remember(version, bitmap)
+        for team_id in interrupted:
+            team_status.invalidate(team_id)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_pending_claims(session):
+    session.info.pop(_PENDING_KEY, None)
@@ -0,0 +1,223 @@
+"""
+Event configuration loading and validation for Floatpack Rideathon.
+
+config.yaml (or an uploaded YAML file) is checked against a typed schema. Every problem is collected
+and reported together, so an organizer can fix a file in one pass. The result is compiled into
+frozen EventConfig objects. Compiled configs are cached by the SHA-256 of the YAML text, and
+load_config also remembers each file's mtime and size. Repeated admin actions and seeding therefore
+neither re-read an unchanged file nor re-parse content they have already seen.
+"""
+
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Optional, Tuple
+
+CONFIG_FILE = "config.yaml"
+CONFIG_CACHE_SIZE = 8
+
+
+class ConfigError(ValueError):
+    """A config that failed validation; errors lists every problem found"""
+
+    def __init__(self, errors, source="config"):
+        self.errors = list(errors)
+        self.source = source
+        super().__init__(f"Invalid {source}:\n" + "\n".join(f"- {error}" for error in self.errors))
+
+
+@dataclass(frozen=True)
+class TeamConfig:
+    name: str
+    members: str
+    color: str
+    secret_code: str
+
+
+@dataclass(frozen=True)
+class ChallengeConfig:
+    name: str
+    description: str
+    pause_distance: bool
+    latitude: float
+    longitude: float
+    charge: bool = False
+
+
+@dataclass(frozen=True)
+class EventConfig:
+    teams: Tuple[TeamConfig, ...]
+    challenges: Tuple[ChallengeConfig, ...]
+    event_start: Optional[datetime]
+    event_end: Optional[datetime]
+    digest: str  # SHA-256 of the source YAML, or of the data's repr for configs built from dicts
+
+
+# Field name -> (accepted types, description used in errors)
+TEAM_SCHEMA = {
+    "name": ((str,), "a string"),
+    "members": ((str,), "a string"),
+    "color": ((str,), "a string"),
+    "secret_code": ((str,), "a string"),
+}
+CHALLENGE_SCHEMA = {
+    "name": ((str,), "a string"),
+    "description": ((str,), "a string"),
+    "pause_distance": ((bool,), "true or false"),
+    "latitude": ((int, float), "a number"),
+    "longitude": ((int, float), "a number"),
+}
+CHALLENGE_OPTIONAL = {
+    "charge": ((bool,), "true or false"),
+}
+
+
+def _check_entry(entry, schema, label, kind, errors, optional=None):
+    """Type-check one entry against a schema (and optional fields), appending problems to errors;
+    returns whether it passed"""
+    if not isinstance(entry, dict):
+        errors.append(f"Invalid {kind} data in {label}: expected a mapping")
+        return False
+    missing = [key for key in schema if key not in entry]
+    if missing:
+        errors.append(f"Invalid {kind} data in {label}: missing {', '.join(repr(key) for key in missing)}")
+    valid = not missing
+    for key, (types, description) in {**schema, **(optional or {})}.items():
+        value = entry.get(key)
+        # bool is an int subclass, so numbers must exclude it explicitly
+        if key in entry and (not isinstance(value, types) or (bool not in types and isinstance(value, bool))):
+            errors.append(f"Invalid {kind} data in {label}: {key!r} must be {description}, got {value!r}")
+            valid = False
+    return valid
+
+
+def _check_unique(entries, key, kind, errors):
+    seen = set()
+    for entry in entries:
+        value = getattr(entry, key)
+        if value in seen:
+            errors.append(f"Duplicate {kind} {key} {value!r}")
+        seen.add(value)
+
+
+def _parse_time(value, label, errors):
+    if value is None or isinstance(value, datetime):
+        return value
+    try:
+        return datetime.fromisoformat(str(value))
+    except ValueError:
+        errors.append(f"Invalid event data: {label} must be a date and time, got {value!r}")
+        return None
+
+
+def compile_config(data, source="config", digest=None):
+    """Validate parsed YAML data and compile it into an EventConfig, raising ConfigError with every problem"""
+    if not isinstance(data, dict):
+        raise ConfigError(["Expected a mapping with 'teams' and 'challenges' sections"], source)
+    errors = []
+    for section in ("teams", "challenges"):
+        if section not in data:
+            errors.append(f"Invalid YAML structure. Missing the '{section}' section")
+        elif not isinstance(data[section], list):
+            errors.append(f"The '{section}' section must be a list")
+
+    teams = []
+    for i, entry in enumerate(data.get("teams") if isinstance(data.get("teams"), list) else []):
+        if _check_entry(entry, TEAM_SCHEMA, f"teams[{i}]", "team", errors):
+            teams.append(TeamConfig(**{key: entry[key] for key in TEAM_SCHEMA}))
+    _check_unique(teams, "name", "team", errors)
+    _check_unique(teams, "secret_code", "team", errors)
+
+    challenges = []
+    for i, entry in enumerate(data.get("challenges") if isinstance(data.get("challenges"), list) else []):
+        if _check_entry(entry, CHALLENGE_SCHEMA, f"challenges[{i}]", "challenge", errors, CHALLENGE_OPTIONAL):
+            if not -90 <= entry["latitude"] <= 90 or not -180 <= entry["longitude"] <= 180:
+                errors.append(f"Invalid challenge data in challenges[{i}]: latitude/longitude out of range")
+            fields = {key: entry[key] for key in [*CHALLENGE_SCHEMA, *CHALLENGE_OPTIONAL] if key in entry}
+            challenges.append(ChallengeConfig(**fields))
+    _check_unique(challenges, "name", "challenge", errors)
+
+    event = data.get("event") or {}
+    if not isinstance(event, dict):
+        errors.append("The 'event' section must be a mapping with 'start' and 'end'")
+        event = {}
+    event_start = _parse_time(event.get("start"), "start", errors)
+    event_end = _parse_time(event.get("end"), "end", errors)
+    if event_start and event_end and event_start >= event_end:
+        errors.append("Invalid event data: start must be before end")
+
+    if errors:
+        raise ConfigError(errors, source)
+    return EventConfig(
+        teams=tuple(teams),
+        challenges=tuple(challenges),
+        event_start=event_start,
+        event_end=event_end,
+        digest=digest or hashlib.sha256(repr(data).encode()).hexdigest()
+    )
+
+
+_lock = threading.Lock()
+_compiled = OrderedDict()  # digest -> EventConfig
+_file_stats = {}  # path -> ((mtime_ns, size), digest)
+
+
+def _cached(digest):
+    with _lock:
+        config = _compiled.get(digest)
+        if config is not None:
+            _compiled.move_to_end(digest)
+        return config
+
+
+def _store(config):
+    with _lock:
+        _compiled[config.digest] = config
+        while len(_compiled) > CONFIG_CACHE_SIZE:
+            _compiled.popitem(last=False)
+
+
+def parse_config_text(text, source="uploaded YAML"):
+    """Compile YAML text, reusing the compiled config if the same text was seen before"""
+    import yaml
+
+    raw = text.encode() if isinstance(text, str) else text
+    digest = hashlib.sha256(raw).hexdigest()
+    config = _cached(digest)
+    if config is None:
+        try:
+            data = yaml.safe_load(raw)
+        except yaml.YAMLError as e:
+            raise ConfigError([f"Invalid YAML format: {str(e)}"], source)
+        config = compile_config(data, source, digest)
+        _store(config)
+    return config
+
+
+def load_config(path=CONFIG_FILE):
+    """Compiled config for a file; an unchanged file (same mtime and size) isn't even re-read"""
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"{path} file not found")
+    stat = os.stat(path)
+    signature = (stat.st_mtime_ns, stat.st_size)
+    with _lock:
+        known = _file_stats.get(path)
+    if known is not None and known[0] == signature:
+        config = _cached(known[1])
+        if config is not None:
+            return config
+
+    with open(path, "rb") as f:
+        config = parse_config_text(f.read(), source=os.path.basename(path))
+    with _lock:
+        _file_stats[path] = (signature, config.digest)
+    return config
+
+
+def clear_config_cache():
+    with _lock:
+        _compiled.clear()
+        _file_stats.clear()
@@ -1,20 +1,42 @@
-from sqlalchemy import create_engine, Column, Integer, String, Float, DateTime, Boolean, Text, ForeignKey
-from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, relationship
+from sqlalchemy.orm import declarative_base, sessionmaker
 from datetime import datetime
-from uuid import uuid4
-import uuid
-import yaml
-import os
 
 # Database setup
-engine = create_engine('sqlite:///test.db', echo=True)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+DATABASE_URL = 'sqlite:///test.db'
 Base = declarative_base()
 
+# The engine is created on first database use so pages that never touch the database,
+# and scripts that only import a helper, don't pay for it at import time
+_engine = None
+
+def get_engine():
+    """The application engine, created on first use"""
+    global _engine
+    if _engine is None:
+        from sqlalchemy import create_engine
+        _engine = create_engine(DATABASE_URL, echo=True)
+        SessionLocal.configure(bind=_engine)
+    return _engine
+
+class LazySessionmaker(sessionmaker):
+    """sessionmaker that creates the engine when the first session is opened"""
+    def __call__(self, **local_kw):
+        get_engine()
+        return super().__call__(**local_kw)
+
+SessionLocal = LazySessionmaker(autocommit=False, autoflush=False)
+
+def __getattr__(name):
+    # Keeps `from database import engine` working without creating the engine on import
+    if name == "engine":
+        return get_engine()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 # Create tables
 def create_tables():
-    Base.metadata.create_all(bind=engine)
+    import models
+    models.load_models()  # Register every table before creating them
+    Base.metadata.create_all(bind=get_engine())
 
 # Dependency to get database session
 def get_db():
@@ -31,125 +53,321 @@ def clear_database():
         db = SessionLocal()
         
         # Import from models to ensure all relationships are resolved
-        from models import Team, Challenge, Modifier, Offset
+        from models import Team, Challenge, Modifier, Offset, TeamOffsetTotal, GpxUpload, GpxCleanup, GpxRoute, Scorecard, Job, StateVersion
+        import challenge_locks
         
         # Delete all records from all tables
+        db.query(Job).delete()
+        db.query(Scorecard).delete()
+        db.query(GpxRoute).delete()
+        db.query(GpxCleanup).delete()
+        db.query(GpxUpload).delete()
         db.query(Offset).delete()
+        db.query(TeamOffsetTotal).delete()
         db.query(Modifier).delete()
         db.query(Challenge).delete()
         db.query(Team).delete()
+        db.query(StateVersion).filter(StateVersion.name == challenge_locks.LOCKS_NAME).delete()
+        
+        # Let open scoreboards, maps and other processes' team status caches know the data is gone
+        import team_status
+        from routes import ROUTES_VERSION
+        from scoring import SCOREBOARD_VERSION
+        bump_version(db, SCOREBOARD_VERSION)
+        bump_version(db, team_status.TEAM_STATUS_VERSION)
+        bump_version(db, ROUTES_VERSION)
         
         db.commit()
         db.close()
         
+        import team_status
+        import track_shards
+        from gpx import clear_track_cache
+        from scoring import SCORING_PIPELINE
+        team_status.invalidate()
+        challenge_locks.clear_cache()
+        clear_track_cache()
+        track_shards.clear_shards()
+        SCORING_PIPELINE.clear()
+        
         return True, "Database cleared successfully"
     except Exception as e:
         return False, f"Error clearing database: {str(e)}"
 
 def populate_from_config(config_file="config.yaml"):
     """Populate database from config.yaml file"""
+    from config import ConfigError, load_config
+    
     try:
-        if not os.path.exists(config_file):
-            return False, f"{config_file} file not found"
-        
-        with open(config_file, 'r') as f:
-            config = yaml.safe_load(f)
-        
-        return populate_from_yaml_data(config, source="config.yaml")
-        
+        config = load_config(config_file)
+    except FileNotFoundError as e:
+        return False, str(e)
+    except ConfigError as e:
+        return False, str(e)
     except Exception as e:
         return False, f"Error reading {config_file}: {str(e)}"
+    
+    return populate_from_event_config(config, source=config_file)
 
 def populate_from_yaml_content(yaml_content):
     """Populate database from YAML content string"""
+    from config import ConfigError, parse_config_text
+    
     try:
-        config = yaml.safe_load(yaml_content)
-        return populate_from_yaml_data(config, source="uploaded YAML")
-        
-    except yaml.YAMLError as e:
-        return False, f"Invalid YAML format: {str(e)}"
+        config = parse_config_text(yaml_content, source="uploaded YAML")
+    except ConfigError as e:
+        return False, str(e)
     except Exception as e:
         return False, f"Error parsing YAML content: {str(e)}"
+    
+    return populate_from_event_config(config, source="uploaded YAML")
 
-def populate_from_yaml_data(config, source="YAML"):
-    """Populate database from parsed YAML data"""
+def team_from_config(team_config):
+    """Build a Team from a validated TeamConfig"""
+    from models import Team
+    
+    return Team(
+        name=team_config.name,
+        members=team_config.members,
+        color=team_config.color,
+        secret_code=team_config.secret_code
+    )
+
+def challenges_from_config(challenge_config, teams, template_index=None):
+    """Build one Challenge row per team from a validated ChallengeConfig"""
+    from models import Challenge, ChallengeStatus
+    
+    return [
+        Challenge(
+            name=challenge_config.name,
+            description=challenge_config.description,
+            pause_distance=challenge_config.pause_distance,
+            latitude=challenge_config.latitude,
+            longitude=challenge_config.longitude,
+            status=ChallengeStatus.AVAILABLE,
+            team_id=team.id,
+            template_index=template_index,
+            charge=challenge_config.charge
+        )
+        for team in teams
+    ]
+
+def add_event_config(db, config):
+    """Add the teams and per-team challenges of a compiled config (the caller commits);
+    returns (teams, challenges created)"""
+    from sqlalchemy import func
+    from models import Challenge
+    
+    teams = [team_from_config(team_config) for team_config in config.teams]
+    db.add_all(teams)
+    db.flush()  # Get team IDs
+    
+    # Number on from earlier populations, so a reordered or extended config never lands on the
+    # charge lock bit of a challenge that is already in the database
+    last_index = db.query(func.max(Challenge.template_index)).scalar()
+    first_index = 0 if last_index is None else last_index + 1
+    
+    challenges_created = 0
+    for template_index, challenge_config in enumerate(config.challenges, first_index):
+        challenges = challenges_from_config(challenge_config, teams, template_index)
+        db.add_all(challenges)
+        challenges_created += len(challenges)
+    return teams, challenges_created
+
+def populate_from_event_config(config, source="YAML"):
+    """Populate database from a compiled config in a single transaction"""
     try:
-        # Import from models to ensure all relationships are resolved
-        from models import Team, Challenge, ChallengeStatus
-        
-        # Validate config structure
-        if "teams" not in config or "challenges" not in config:
-            return False, "Invalid YAML structure. Must contain 'teams' and 'challenges' sections"
-        
         db = SessionLocal()
-        
-        # Create teams
-        teams = []
-        for team_data in config["teams"]:
-            if not all(key in team_data for key in ["name", "members", "color", "secret_code"]):
-                return False, "Invalid team data. Each team must have 'name', 'members', 'color', and 'secret_code'"
-            
-            team = Team(
-                name=team_data["name"],
-                members=team_data["members"],
-                color=team_data["color"],
-                secret_code=team_data["secret_code"]
-            )
-            db.add(team)
-            teams.append(team)
-        
-        # Commit teams to get their IDs
-        db.commit()
-        
-        # Create challenges - one row for each team-challenge combination
-        challenges_created = 0
-        for challenge_data in config["challenges"]:
-            if not all(key in challenge_data for key in ["name", "description", "pause_distance", "latitude", "longitude"]):
-                return False, "Invalid challenge data. Each challenge must have 'name', 'description', 'pause_distance', 'latitude', and 'longitude'"
-            
-            for team in teams:
-                challenge = Challenge(
-                    name=challenge_data["name"],
-                    description=challenge_data["description"],
-                    pause_distance=challenge_data["pause_distance"],
-                    latitude=challenge_data["latitude"],
-                    longitude=challenge_data["longitude"],
-                    status=ChallengeStatus.AVAILABLE,
-                    team_id=team.id
-                )
-                db.add(challenge)
-                challenges_created += 1
-        
-        # Commit all challenges
-        db.commit()
-        db.close()
+        try:
+            teams, challenges_created = add_event_config(db, config)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
         
         return True, f"Successfully created {len(teams)} teams and {challenges_created} challenges from {source}"
         
     except Exception as e:
         return False, f"Error populating from {source}: {str(e)}"
 
+def populate_from_yaml_data(config, source="YAML"):
+    """Populate database from parsed YAML data"""
+    from config import ConfigError, compile_config
+    
+    try:
+        compiled = compile_config(config, source)
+    except ConfigError as e:
+        return False, str(e)
+    
+    return populate_from_event_config(compiled, source)
+
+def clean_gpx_data(gpx_data):
+    """Parse and clean a GPX submission, raising ValueError if it isn't valid GPX"""
+    from xml.etree.ElementTree import ParseError
+    from gpx import parse_gpx, clean_track
+    
+    try:
+        return clean_track(parse_gpx(gpx_data))
+    except (ParseError, TypeError, ValueError) as e:
+        raise ValueError(f"Invalid GPX data: {str(e)}")
+
+def store_gpx_upload(db, team_id, gpx_data, cleaned, uploaded_at=None):
+    """Add a GpxUpload with its cleanup and routes (the caller commits).
+    
+    Teams resubmit their whole track every hour, so when the new track starts with exactly the points
+    of the team's previous upload only the new suffix is stored, chained to that upload. A track that
+    doesn't continue the previous one is stored in full and flagged with extends_previous=False.
+    With track sharding on, the GPX text goes to the team's shard and the row only records its segment.
+    
+    Only that payload write runs in parallel across teams: the catalog row, its cleanup and its routes
+    still go to the main database and queue for its write lock. They are small, and everything they
+    are derived from is computed before the first write, so the lock is held for the inserts alone.
+    """
+    from models import GpxUpload
+    from gpx import prefix_hashes, format_hash, to_gpx, upload_track
+    from routes import ROUTES_VERSION, build_routes
+    import track_shards
+    
+    track = cleaned.track
+    hashes = prefix_hashes(track)
+    previous = db.query(GpxUpload).filter(GpxUpload.team_id == team_id).order_by(GpxUpload.id.desc()).first()
+    
+    base_upload_id = None
+    extends_previous = None
+    if previous is not None:
+        if previous.track_hash is None:
+            # Stored before fingerprinting; hash it once now
+            previous_hashes = prefix_hashes(upload_track(previous))
+            previous.point_count = len(previous_hashes)
+            previous.track_hash = format_hash(previous_hashes[-1]) if len(previous_hashes) else None
+        count = previous.point_count or 0
+        extends_previous = 0 < count <= len(track) and format_hash(hashes[count - 1]) == previous.track_hash
+        if extends_previous:
+            base_upload_id = previous.id
+            gpx_data = to_gpx(track[count:])
+    
+    shard_segment_id = None
+    if track_shards.enabled():
+        # Written before this session's first write, so the main database's lock isn't held meanwhile
+        shard_segment_id = track_shards.write_segment(team_id, gpx_data)
+        gpx_data = None
+    
+    upload = GpxUpload(
+        team_id=team_id,
+        gpx_data=gpx_data,
+        shard_segment_id=shard_segment_id,
+        uploaded_at=uploaded_at or datetime.now(),
+        base_upload_id=base_upload_id,
+        extends_previous=extends_previous,
+        point_count=len(track),
+        track_hash=format_hash(hashes[-1]) if len(track) else None
+    )
+    # SQLite holds the write lock from the first flush until the commit, so derive the cleanup and
+    # simplify the routes first; rows attached through the relationships get the ID on the flush
+    with db.no_autoflush:
+        cleanup = cleaned.to_cleanup()
+        build_routes(db, upload, track)
+    cleanup.gpx_upload = upload
+    db.add(upload)
+    db.flush()  # Get the ID
+    bump_version(db, ROUTES_VERSION)
+    return upload
+
+def gpx_upload_message(upload, cleaned):
+    """Summary shown to a team after their upload is stored"""
+    message = f"Stored GPX upload with {len(cleaned.track)} points ({cleaned.scored_distance:.2f} mi scored)"
+    if upload.extends_previous is False:
+        message += ". This track does not continue your previous upload and has been flagged for review"
+    return message
+
+def ingest_gpx_upload(team_id, gpx_data, uploaded_at=None, db_session=None):
+    """Store a team's GPX submission together with its cleanup summary"""
+    try:
+        cleaned = clean_gpx_data(gpx_data)
+        
+        db = db_session or SessionLocal()
+        try:
+            upload = store_gpx_upload(db, team_id, gpx_data, cleaned, uploaded_at)
+            db.commit()
+        finally:
+            if db_session is None:
+                db.close()
+        
+        return True, gpx_upload_message(upload, cleaned)
+        
+    except ValueError as e:
+        return False, str(e)
+    except Exception as e:
+        return False, f"Error storing GPX upload: {str(e)}"
+
 def get_database_status():
     """Get current database status with counts of all entities"""
+    try:
+        from admin_metrics import counts_statement
+        
+        db = SessionLocal()
+        try:
+            # All four counts in one query
+            return dict(db.execute(counts_statement(["teams", "challenges", "modifiers", "offsets"])).one()._mapping)
+        finally:
+            db.close()
+        
+    except Exception as e:
+        raise Exception(f"Error reading database status: {str(e)}")
+
+def get_unverified_completions():
+    """List completed challenges whose location the scoring job could not verify"""
     try:
         db = SessionLocal()
         
         # Import from models to ensure all relationships are resolved
-        from models import Team, Challenge, Modifier, Offset
+        from models import Team, Challenge, ChallengeStatus
         
-        team_count = db.query(Team).count()
-        challenge_count = db.query(Challenge).count()
-        modifier_count = db.query(Modifier).count()
-        offset_count = db.query(Offset).count()
+        rows = db.query(Team.name, Challenge.name, Challenge.end).join(Team, Challenge.team_id == Team.id).filter(
+            Challenge.status == ChallengeStatus.COMPLETED,
+            Challenge.location_verified.is_(False)
+        ).order_by(Challenge.end).all()
         
         db.close()
         
-        return {
-            "teams": team_count,
-            "challenges": challenge_count,
-            "modifiers": modifier_count,
-            "offsets": offset_count
-        }
+        return [{"team": team, "challenge": challenge, "completed_at": end} for team, challenge, end in rows]
         
     except Exception as e:
-        raise Exception(f"Error reading database status: {str(e)}")
+        raise Exception(f"Error reading challenge verification: {str(e)}")
+
+def insert_for(db, model):
+    """INSERT for the session's database dialect, so ON CONFLICT clauses build on SQLite and Postgres"""
+    if db.get_bind().dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert(model)
+
+def bump_version_statement(name):
+    """Upsert statement that increments a named state version"""
+    from sqlalchemy.dialects.sqlite import insert
+    from models import StateVersion
+    
+    statement = insert(StateVersion).values(name=name, version=1, updated_at=datetime.now())
+    return statement.on_conflict_do_update(
+        index_elements=[StateVersion.name],
+        set_={"version": StateVersion.version + 1, "updated_at": statement.excluded.updated_at}
+    )
+
+def bump_version(db, name):
+    """Increment a named state version inside the caller's transaction"""
+    db.execute(bump_version_statement(name))
+
+def get_version(name, db=None):
+    """Get the current value of a named state version (0 if it was never bumped)"""
+    from models import StateVersion
+    
+    session = db or SessionLocal()
+    try:
+        version = session.query(StateVersion.version).filter(StateVersion.name == name).scalar()
+        return version or 0
+    finally:
+        if db is None:
+            session.close()
@@ -10,6 +10,7 @@ class ChallengeStatus(enum.Enum):
     ACTIVE = "active"
     COMPLETED = "completed"
     FORFEITED = "forfeited"
+    LOCKED = "locked"  # A charge challenge another team has already claimed
 
 class Challenge(Base):
     """A challenge is a task that a team can complete to create offsets or modifies for themselves or other teams.
@@ -29,6 +30,9 @@ class Challenge(Base):
     longitude = Column(Float, nullable=False, default=0.0)
     status = Column(Enum(ChallengeStatus), nullable=False, default=ChallengeStatus.AVAILABLE)
     team_id = Column(Integer, ForeignKey("teams.id"), nullable=True)
+    location_verified = Column(Boolean, nullable=True)  # Set by the scoring job's geofence check once completed
+    template_index = Column(Integer, nullable=True, index=True)  # Position in the config, after earlier populations; shared by every team's row
+    charge = Column(Boolean, nullable=False, default=False)  # Only the first team to complete it gets it
     
     # Relationships
     team = relationship("Team", back_populates="challenges")
@@ -36,6 +40,10 @@ class Challenge(Base):
     offsets = relationship("Offset", back_populates="challenge")
 
     def start_challenge(self, team_id: int, db_session=None):
+        if self.charge:
+            import challenge_locks
+            if self.status == ChallengeStatus.LOCKED or challenge_locks.is_locked(self.template_index):
+                raise ValueError(f"{self.name} has already been completed by another team")
         self.status = ChallengeStatus.ACTIVE
         self.start = datetime.now()
         self.team_id = team_id
@@ -54,6 +62,12 @@ class Challenge(Base):
             self.modifiers.append(challenge_attempt_modifier)
 
     def complete_challenge(self, db_session=None):
+        if self.charge and self.template_index is not None:
+            import challenge_locks
+            from sqlalchemy.orm import object_session
+            session = db_session or object_session(self)
+            if session is not None and not challenge_locks.claim_charge_challenge(session, self):
+                raise ValueError(f"{self.name} has already been completed by another team")
         self.status = ChallengeStatus.COMPLETED
         self.end = datetime.now()
         if self.pause_distance and self.modifiers:
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey
+from sqlalchemy import Column, Integer, Float, DateTime, ForeignKey
 from sqlalchemy.orm import relationship
 from database import Base
 from datetime import datetime
@@ -7,7 +7,7 @@ class GpxCleanup(Base):
     __tablename__ = "gpx_cleanups"
     
     id = Column(Integer, primary_key=True, index=True)
-    gpx_upload_id = Column(Integer, ForeignKey("gpx_uploads.id"), nullable=False)
+    gpx_upload_id = Column(Integer, ForeignKey("gpx_uploads.id"), nullable=False, index=True)
     total_distance = Column(Float, nullable=False)
     total_time = Column(Float, nullable=False)
     average_speed = Column(Float, nullable=False)
@@ -15,8 +15,14 @@ class GpxCleanup(Base):
     min_speed = Column(Float, nullable=False)
     scored_distance = Column(Float, nullable=False)
     pruned_distance_speed = Column(Float, nullable=False)
+    pruned_distance_gap = Column(Float, nullable=False, default=0.0)
     pruned_distance_updated = Column(DateTime, nullable=False)
+    elevation_gain = Column(Float, nullable=True)  # feet, over counted segments
+    elevation_loss = Column(Float, nullable=True)  # feet, over counted segments
+    best_hour_distance = Column(Float, nullable=True)  # most counted miles in any hour
+    fastest_ten_mile_seconds = Column(Float, nullable=True)  # None until 10 counted miles are ridden
+    longest_stint = Column(Float, nullable=True)  # most counted miles between gaps and charge stops
     created_at = Column(DateTime, nullable=False, default=datetime.now)
 
     # Relationships
-    gpx_upload = relationship("GpxUpload", back_populates="gpx_cleanups")
\ No newline at end of file
+    gpx_upload = relationship("GpxUpload", back_populates="gpx_cleanups")
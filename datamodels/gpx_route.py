@@ -0,0 +1,19 @@
+from sqlalchemy import Column, Integer, Float, Text, DateTime, ForeignKey
+from sqlalchemy.orm import relationship
+from database import Base
+from datetime import datetime
+
+class GpxRoute(Base):
+    """A simplified polyline of an upload's track at one level of detail, cached for map rendering"""
+    __tablename__ = "gpx_routes"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    gpx_upload_id = Column(Integer, ForeignKey("gpx_uploads.id"), nullable=False, index=True)
+    min_zoom = Column(Integer, nullable=False)
+    tolerance = Column(Float, nullable=False)  # meters
+    source_points = Column(Integer, nullable=False)
+    path = Column(Text, nullable=False)  # JSON list of [longitude, latitude]
+    created_at = Column(DateTime, nullable=False, default=datetime.now)
+
+    # Relationships
+    gpx_upload = relationship("GpxUpload", back_populates="gpx_routes")
@@ -1,15 +1,27 @@
-from sqlalchemy import Column, String, DateTime, ForeignKey, Integer
+from sqlalchemy import Column, String, DateTime, ForeignKey, Integer, Boolean, Index
 from sqlalchemy.orm import relationship
 from database import Base
 from datetime import datetime
 
 class GpxUpload(Base):
     __tablename__ = "gpx_uploads"
+    __table_args__ = (
+        # Covers the late-submission check, which only needs upload times and teams
+        Index("ix_gpx_uploads_uploaded_at_team_id", "uploaded_at", "team_id"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     uploaded_at = Column(DateTime, nullable=False, default=datetime.now)
-    team_id = Column(Integer, ForeignKey("teams.id"), nullable=False)
-    gpx_data = Column(String, nullable=False)
+    team_id = Column(Integer, ForeignKey("teams.id"), nullable=False, index=True)
+    gpx_data = Column(String, nullable=True)  # Only the points after base_upload's track when base_upload_id is set; None when sharded
+    shard_segment_id = Column(Integer, nullable=True)  # Segment holding gpx_data in the team's shard (see track_shards)
+    base_upload_id = Column(Integer, ForeignKey("gpx_uploads.id"), nullable=True)
+    extends_previous = Column(Boolean, nullable=True)  # False flags a track that doesn't continue the team's previous upload
+    point_count = Column(Integer, nullable=True)
+    track_hash = Column(String(16), nullable=True)
 
     # Relationships
-    team = relationship("Team", back_populates="gpx_uploads")
\ No newline at end of file
+    team = relationship("Team", back_populates="gpx_uploads")
+    base_upload = relationship("GpxUpload", remote_side=[id])
+    gpx_cleanups = relationship("GpxCleanup", back_populates="gpx_upload")
+    gpx_routes = relationship("GpxRoute", back_populates="gpx_upload")
\ No newline at end of file
@@ -0,0 +1,34 @@
+from sqlalchemy import Column, Integer, String, Text, DateTime, Enum, Index
+from database import Base
+from datetime import datetime
+import enum
+
+class JobStatus(enum.Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+
+class Job(Base):
+    """A unit of background work (ingest, cleanup, scoring, penalties) for the worker processes.
+    A worker leases a job by setting leased_by and lease_expires_at; a job whose lease expires
+    without finishing is picked up again by another worker.
+    """
+    __tablename__ = "jobs"
+    __table_args__ = (
+        # Covers the claim query, which looks for the oldest runnable job
+        Index("ix_jobs_status_run_after", "status", "run_after"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    kind = Column(String(20), nullable=False)
+    payload = Column(Text, nullable=False, default="{}")  # JSON arguments for the job handler
+    dedupe_key = Column(String(100), unique=True, nullable=True)  # Stops periodic jobs being queued twice
+    status = Column(Enum(JobStatus), nullable=False, default=JobStatus.QUEUED)
+    attempts = Column(Integer, nullable=False, default=0)
+    run_after = Column(DateTime, nullable=False, default=datetime.now)
+    leased_by = Column(String(100), nullable=True)
+    lease_expires_at = Column(DateTime, nullable=True)
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime, nullable=False, default=datetime.now)
+    finished_at = Column(DateTime, nullable=True)
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, Float, DateTime, ForeignKey
+from sqlalchemy import Column, Integer, Float, String, DateTime, ForeignKey
 from sqlalchemy.orm import relationship
 from database import Base
 from datetime import datetime
@@ -12,6 +12,7 @@ class Offset(Base):
     receiver_id = Column(Integer, ForeignKey("teams.id"), nullable=False)
     challenge_id = Column(Integer, ForeignKey("challenges.id"), nullable=True)
     created_at = Column(DateTime, nullable=False, default=datetime.now)
+    penalty_key = Column(String(100), unique=True, nullable=True)  # Makes automated penalties idempotent
     
     # Relationships
     creator = relationship("Team", foreign_keys=[creator_id], back_populates="offsets_created")
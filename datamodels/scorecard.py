@@ -7,10 +7,11 @@ class Scorecard(Base):
     __tablename__ = "scorecards"
     
     id = Column(Integer, primary_key=True, index=True)
-    team_id = Column(Integer, ForeignKey("teams.id"), nullable=False)
+    team_id = Column(Integer, ForeignKey("teams.id"), nullable=False, index=True)
     challenges_completed = Column(Integer, nullable=False, default=0)
     distance_traveled = Column(Float, nullable=False, default=0.0)
     distance_earned = Column(Float, nullable=False, default=0.0)
+    rank = Column(Integer, nullable=True)  # Scoreboard position when this scorecard was computed
     created_at = Column(DateTime, nullable=False, default=datetime.now)
 
 
@@ -0,0 +1,14 @@
+from sqlalchemy import Column, Integer, String, Text, DateTime
+from database import Base
+from datetime import datetime
+
+class StateVersion(Base):
+    """A named counter that is bumped whenever some shared state changes, so readers can
+    cheaply tell whether anything they cached is out of date.
+    """
+    __tablename__ = "state_versions"
+    
+    name = Column(String(50), primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, nullable=False, default=datetime.now)
+    value = Column(Text, nullable=True)  # Optional state published with the version, e.g. the challenge lock bitmap
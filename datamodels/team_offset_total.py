@@ -0,0 +1,33 @@
+from sqlalchemy import Column, Integer, Float, ForeignKey, DDL, event
+from database import Base
+
+class TeamOffsetTotal(Base):
+    """Running sums of the offsets each team has given and received, so standings never re-sum the
+    offsets table. Kept current by triggers on offsets; offset_totals.check_offset_totals recomputes
+    them from scratch to catch drift.
+    """
+    __tablename__ = "team_offset_totals"
+
+    team_id = Column(Integer, ForeignKey("teams.id"), primary_key=True)
+    given = Column(Float, nullable=False, default=0.0)  # Sum of offsets this team created, including for itself
+    received = Column(Float, nullable=False, default=0.0)  # Sum of offsets applied to this team's distance
+
+
+def _apply(row, sign):
+    """Trigger statements adding (sign '+') or removing (sign '-') an offset row's distance"""
+    return f"""
+    INSERT INTO team_offset_totals (team_id, given, received) VALUES ({row}.creator_id, {sign}{row}.distance, 0)
+        ON CONFLICT(team_id) DO UPDATE SET given = given + excluded.given;
+    INSERT INTO team_offset_totals (team_id, given, received) VALUES ({row}.receiver_id, 0, {sign}{row}.distance)
+        ON CONFLICT(team_id) DO UPDATE SET received = received + excluded.received;"""
+
+OFFSET_TOTAL_TRIGGERS = [
+    f"CREATE TRIGGER IF NOT EXISTS offsets_totals_insert AFTER INSERT ON offsets BEGIN {_apply('NEW', '+')} END",
+    f"CREATE TRIGGER IF NOT EXISTS offsets_totals_delete AFTER DELETE ON offsets BEGIN {_apply('OLD', '-')} END",
+    "CREATE TRIGGER IF NOT EXISTS offsets_totals_update AFTER UPDATE OF distance, creator_id, receiver_id ON offsets "
+    f"BEGIN {_apply('OLD', '-')} {_apply('NEW', '+')} END",
+]
+
+# Created once every table exists, since the triggers live on offsets but write team_offset_totals
+for trigger in OFFSET_TOTAL_TRIGGERS:
+    event.listen(Base.metadata, "after_create", DDL(trigger).execute_if(dialect="sqlite"))
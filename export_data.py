@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+"""
+Bulk export of event data for post-event analysis.
+
+Every table is streamed with a server-side cursor in bounded chunks and written to compressed CSV,
+JSONL or Parquet, so memory use stays flat no matter how large the event database grows. Each team's
+latest (cumulative) GPX track is exported point by point along with the cleanup flags.
+"""
+
+import argparse
+import csv
+import enum
+import gzip
+import json
+import math
+import os
+from datetime import datetime
+
+from sqlalchemy import Boolean, DateTime, Float, Integer, func, select
+
+from database import SessionLocal
+from gpx import clean_track, upload_track
+
+CHUNK_SIZE = 5000
+FORMATS = ["csv", "jsonl", "parquet"]
+
+# Tables exported as-is; raw GPX documents are left out in favor of the cleaned track points
+TABLES = ["teams", "challenges", "modifiers", "offsets", "gpx_uploads", "gpx_cleanups", "scorecards"]
+EXCLUDED_COLUMNS = {"gpx_uploads": {"gpx_data"}, "teams": {"secret_code"}}
+
+TRACK_COLUMNS = [
+    ("gpx_upload_id", Integer()), ("team_id", Integer()), ("point", Integer()), ("time", DateTime()),
+    ("latitude", Float()), ("longitude", Float()), ("elevation", Float()),
+    ("segment_distance", Float()), ("counted", Boolean()),
+]
+
+
+def _value(value):
+    if isinstance(value, enum.Enum):
+        return value.value
+    return value
+
+
+def _text(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+class CsvWriter:
+    """Gzipped CSV with a header row"""
+
+    extension = "csv.gz"
+
+    def __init__(self, path, columns):
+        self.file = gzip.open(path, "wt", newline="")
+        self.writer = csv.writer(self.file)
+        self.writer.writerow([name for name, _ in columns])
+
+    def write(self, rows):
+        self.writer.writerows([[_text(value) for value in row] for row in rows])
+
+    def close(self):
+        self.file.close()
+
+
+class JsonlWriter:
+    """Gzipped JSON lines, one object per row"""
+
+    extension = "jsonl.gz"
+
+    def __init__(self, path, columns):
+        self.file = gzip.open(path, "wt")
+        self.names = [name for name, _ in columns]
+
+    def write(self, rows):
+        self.file.writelines(
+            json.dumps({name: _text(value) for name, value in zip(self.names, row)}) + "\n" for row in rows
+        )
+
+    def close(self):
+        self.file.close()
+
+
+class ParquetWriter:
+    """Columnar Parquet with one row group per chunk (requires pyarrow)"""
+
+    extension = "parquet"
+
+    def __init__(self, path, columns):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise RuntimeError("Parquet export requires pyarrow: pip install pyarrow")
+
+        def arrow_type(column_type):
+            if isinstance(column_type, Boolean):
+                return pa.bool_()
+            if isinstance(column_type, Integer):
+                return pa.int64()
+            if isinstance(column_type, Float):
+                return pa.float64()
+            if isinstance(column_type, DateTime):
+                return pa.timestamp("us")
+            return pa.string()
+
+        self.pa = pa
+        self.schema = pa.schema([(name, arrow_type(column_type)) for name, column_type in columns])
+        self.writer = pq.ParquetWriter(path, self.schema, compression="zstd")
+
+    def write(self, rows):
+        columns = list(zip(*rows)) if rows else [[] for _ in self.schema]
+        self.writer.write_table(self.pa.Table.from_arrays(
+            [self.pa.array(column, type=field.type) for column, field in zip(columns, self.schema)],
+            schema=self.schema
+        ))
+
+    def close(self):
+        self.writer.close()
+
+
+WRITERS = {"csv": CsvWriter, "jsonl": JsonlWriter, "parquet": ParquetWriter}
+
+
+def export_table(table, writer_class, output_dir, chunk_size=CHUNK_SIZE):
+    """Stream one table to a file in chunks; returns the number of rows written"""
+    columns = [column for column in table.columns if column.name not in EXCLUDED_COLUMNS.get(table.name, set())]
+    path = os.path.join(output_dir, f"{table.name}.{writer_class.extension}")
+    writer = writer_class(path, [(column.name, column.type) for column in columns])
+    rows_written = 0
+    db = SessionLocal()
+    try:
+        result = db.connection().execution_options(stream_results=True, yield_per=chunk_size).execute(
+            select(*columns).order_by(table.primary_key.columns.values()[0])
+        )
+        for partition in result.partitions():
+            writer.write([[_value(value) for value in row] for row in partition])
+            rows_written += len(partition)
+    finally:
+        writer.close()
+        db.close()
+    return rows_written
+
+
+def iter_track_rows(db, chunk_size=CHUNK_SIZE):
+    """Yield chunks of cleaned track points from each team's latest upload, one upload in memory at a time"""
+    from models import GpxUpload
+
+    latest_ids = select(func.max(GpxUpload.id)).group_by(GpxUpload.team_id)
+    uploads = db.execute(
+        select(GpxUpload).where(GpxUpload.id.in_(latest_ids)).order_by(GpxUpload.team_id)
+        .execution_options(yield_per=1)
+    ).scalars()
+
+    for upload in uploads:
+        cleaned = clean_track(upload_track(upload))
+        track = cleaned.track
+        for start in range(0, len(track), chunk_size):
+            rows = []
+            for i in range(start, min(start + chunk_size, len(track))):
+                # Segment i-1 ends at point i; the first point starts the track
+                counted = bool(cleaned.keep[i - 1]) if i > 0 else True
+                distance = float(cleaned.distances[i - 1]) if i > 0 else 0.0
+                rows.append([
+                    upload.id, upload.team_id, i, datetime.fromtimestamp(track.time[i]),
+                    float(track.lat[i]), float(track.lon[i]),
+                    None if math.isnan(track.ele[i]) else float(track.ele[i]),
+                    distance, counted,
+                ])
+            yield rows
+        db.expunge(upload)
+
+
+def export_tracks(writer_class, output_dir, chunk_size=CHUNK_SIZE):
+    """Stream cleaned track points to a file; returns the number of points written"""
+    path = os.path.join(output_dir, f"track_points.{writer_class.extension}")
+    writer = writer_class(path, TRACK_COLUMNS)
+    rows_written = 0
+    db = SessionLocal()
+    try:
+        for rows in iter_track_rows(db, chunk_size):
+            writer.write(rows)
+            rows_written += len(rows)
+    finally:
+        writer.close()
+        db.close()
+    return rows_written
+
+
+def export_event(output_dir="exports", file_format="csv", chunk_size=CHUNK_SIZE):
+    """Export every table plus cleaned tracks; returns a dict of row counts by file"""
+    from database import Base
+    import models
+    models.load_models()  # Register every table on Base.metadata
+
+    if file_format not in WRITERS:
+        raise ValueError(f"Unknown export format {file_format}. Choose one of {', '.join(FORMATS)}")
+    writer_class = WRITERS[file_format]
+    os.makedirs(output_dir, exist_ok=True)
+
+    counts = {}
+    for name in TABLES:
+        counts[name] = export_table(Base.metadata.tables[name], writer_class, output_dir, chunk_size)
+    counts["track_points"] = export_tracks(writer_class, output_dir, chunk_size)
+    return counts
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export event data for post-event analysis")
+    parser.add_argument("--format", choices=FORMATS, default="csv", help="output file format")
+    parser.add_argument("--output", default="exports", help="directory to write the export files to")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help="rows fetched and written per chunk")
+    args = parser.parse_args()
+
+    counts = export_event(args.output, args.format, args.chunk_size)
+    for name, count in counts.items():
+        print(f"{name}: {count} rows")
@@ -0,0 +1,109 @@
+"""
+Geofence verification of challenge completions.
+
+A completion is verified when the team's cleaned track passed within a radius of the challenge
+location between the challenge's start and end. Track points are bucketed into a grid whose cells
+are at least as wide as the radius, so each check only looks at the points in the 3x3 block of
+cells around the challenge instead of scanning the whole track.
+"""
+
+import numpy as np
+
+from gpx import EARTH_RADIUS_MILES
+
+GEOFENCE_RADIUS_METERS = 150
+# Allow for a team scanning the QR code a little before or after their GPX fix
+WINDOW_SLACK_SECONDS = 5 * 60
+
+METERS_PER_MILE = 1609.344
+METERS_PER_DEGREE_LAT = 111320.0
+
+
+def distance_meters(lat1, lon1, lat2, lon2):
+    """Great-circle distance in meters from arrays of points to a single point"""
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_MILES * METERS_PER_MILE * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+class TrackIndex:
+    """Track points bucketed into a latitude/longitude grid"""
+
+    def __init__(self, lat, lon, time, cell_meters: float = GEOFENCE_RADIUS_METERS):
+        self.lat = np.asarray(lat, dtype=float)
+        self.lon = np.asarray(lon, dtype=float)
+        self.time = np.asarray(time, dtype=float)
+        self.cell_lat = cell_meters / METERS_PER_DEGREE_LAT
+        # Longitude cells are sized at the widest latitude in the track so they are never narrower than cell_meters
+        widest = np.cos(np.radians(np.abs(self.lat).max())) if len(self.lat) else 1.0
+        self.cell_lon = cell_meters / (METERS_PER_DEGREE_LAT * max(widest, 1e-6))
+
+        self.cells = {}
+        if len(self.lat):
+            rows = np.floor(self.lat / self.cell_lat).astype(np.int64)
+            cols = np.floor(self.lon / self.cell_lon).astype(np.int64)
+            keys, inverse = np.unique(np.stack([rows, cols], axis=1), axis=0, return_inverse=True)
+            order = np.argsort(inverse.ravel(), kind="stable")
+            bounds = np.cumsum(np.bincount(inverse.ravel(), minlength=len(keys)))[:-1]
+            for (row, col), indices in zip(keys, np.split(order, bounds)):
+                self.cells[(int(row), int(col))] = indices
+
+    @classmethod
+    def from_cleaned(cls, cleaned, cell_meters: float = GEOFENCE_RADIUS_METERS):
+        """Index the points of a cleaned track that touch a counted segment (or every point of a one-point track)"""
+        track = cleaned.track
+        if len(track) > 1:
+            counted = np.concatenate(([False], cleaned.keep)) | np.concatenate((cleaned.keep, [False]))
+        else:
+            counted = np.ones(len(track), dtype=bool)
+        return cls(track.lat[counted], track.lon[counted], track.time[counted], cell_meters)
+
+    def passed_within(self, lat: float, lon: float, radius_meters: float, start: float, end: float) -> bool:
+        """Whether any point between start and end (POSIX seconds) lies within radius_meters of (lat, lon)"""
+        row = int(np.floor(lat / self.cell_lat))
+        col = int(np.floor(lon / self.cell_lon))
+        # Cells are at least radius wide, so this is normally just the 3x3 block around the target
+        reach_rows = int(np.ceil(radius_meters / METERS_PER_DEGREE_LAT / self.cell_lat))
+        reach_cols = int(np.ceil(radius_meters / METERS_PER_DEGREE_LAT / max(np.cos(np.radians(abs(lat))), 1e-6) / self.cell_lon))
+        for d_row in range(-reach_rows, reach_rows + 1):
+            for d_col in range(-reach_cols, reach_cols + 1):
+                indices = self.cells.get((row + d_row, col + d_col))
+                if indices is None:
+                    continue
+                times = self.time[indices]
+                indices = indices[(times >= start) & (times <= end)]
+                if len(indices) and (distance_meters(self.lat[indices], self.lon[indices], lat, lon) <= radius_meters).any():
+                    return True
+        return False
+
+
+def verify_completions(db, cleaned_tracks, radius_meters: float = GEOFENCE_RADIUS_METERS,
+                       slack_seconds: float = WINDOW_SLACK_SECONDS):
+    """Check every completed challenge against its team's cleaned track and record the result.
+
+    cleaned_tracks maps team id to the team's CleanedTrack (teams without a track fail verification).
+    Returns a dict of challenge id to whether the completion was verified.
+    """
+    from models import Challenge, ChallengeStatus
+
+    completions = db.query(Challenge).filter(
+        Challenge.status == ChallengeStatus.COMPLETED,
+        Challenge.team_id.isnot(None)
+    ).all()
+
+    indexes = {}
+    results = {}
+    for challenge in completions:
+        if challenge.start is None or challenge.end is None:
+            continue
+        if challenge.team_id not in indexes:
+            cleaned = cleaned_tracks.get(challenge.team_id)
+            indexes[challenge.team_id] = TrackIndex.from_cleaned(cleaned, radius_meters) if cleaned is not None else None
+        index = indexes[challenge.team_id]
+        verified = index is not None and index.passed_within(
+            challenge.latitude, challenge.longitude, radius_meters,
+            challenge.start.timestamp() - slack_seconds, challenge.end.timestamp() + slack_seconds
+        )
+        challenge.location_verified = bool(verified)
+        results[challenge.id] = bool(verified)
+    return results
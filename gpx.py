@@ -0,0 +1,343 @@
+"""
+GPX parsing and cleanup for team track submissions.
+
+Tracks are held as parallel numpy arrays so the distance rules (gaps of more than a minute and
+speeds over 25 mph are not counted) are applied to every segment at once.
+"""
+
+import threading
+import xml.etree.ElementTree as ET
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+import numpy as np
+
+EARTH_RADIUS_MILES = 3958.8
+MAX_GAP_SECONDS = 60
+MAX_SPEED_MPH = 25
+# Stopped for this long counts as a charge stop, which ends a stint
+CHARGE_STOP_SECONDS = 10 * 60
+STOPPED_MPH = 1.0
+
+# Trackers report elevation to a few meters of noise, so it is averaged over a few points and
+# climbs only count once they exceed a threshold
+ELEVATION_SMOOTHING_POINTS = 5
+ELEVATION_THRESHOLD_METERS = 2.0
+FEET_PER_METER = 3.28084
+# Windows for the "Speed Demon" style metrics: most distance in an hour, fastest 10 miles
+BEST_DISTANCE_WINDOW_SECONDS = 60 * 60
+BEST_TIME_WINDOW_MILES = 10.0
+
+# Points are fingerprinted at about a meter and a second, finer than any tracker's own precision
+HASH_COORDINATE_SCALE = 1e5
+HASH_BASE = np.uint64(0x100000001B3)
+TRACK_CACHE_SIZE = 64
+
+
+class Track:
+    """Track points as parallel arrays; time is POSIX seconds"""
+
+    def __init__(self, lat, lon, ele, time):
+        self.lat = np.asarray(lat, dtype=float)
+        self.lon = np.asarray(lon, dtype=float)
+        self.ele = np.asarray(ele, dtype=float)
+        self.time = np.asarray(time, dtype=float)
+
+    def __len__(self):
+        return len(self.time)
+
+    def __getitem__(self, index):
+        return Track(self.lat[index], self.lon[index], self.ele[index], self.time[index])
+
+    @classmethod
+    def empty(cls):
+        return cls([], [], [], [])
+
+    @classmethod
+    def concatenate(cls, tracks):
+        return cls(*(np.concatenate([getattr(track, name) for track in tracks]) for name in ("lat", "lon", "ele", "time")))
+
+
+class CleanedTrack:
+    """A track with per-segment distances and the mask of segments that count towards distance"""
+
+    def __init__(self, track: Track, distances, durations, keep, gap, too_fast):
+        self.track = track
+        self.distances = distances
+        self.durations = durations
+        self.keep = keep
+        self.gap = gap
+        self.too_fast = too_fast
+
+    @property
+    def total_distance(self) -> float:
+        return float(self.distances.sum())
+
+    @property
+    def total_time(self) -> float:
+        return float(self.track.time[-1] - self.track.time[0]) if len(self.track) else 0.0
+
+    @property
+    def scored_distance(self) -> float:
+        return float(self.distances[self.keep].sum())
+
+    @property
+    def pruned_distance_gap(self) -> float:
+        return float(self.distances[self.gap].sum())
+
+    @property
+    def pruned_distance_speed(self) -> float:
+        return float(self.distances[self.too_fast].sum())
+
+    def counted_distance_prefix(self):
+        """Counted distance from the first point to each point, in miles"""
+        return np.concatenate(([0.0], np.cumsum(np.where(self.keep, self.distances, 0.0))))
+
+    def elevation_change(self, smoothing_points: int = ELEVATION_SMOOTHING_POINTS,
+                         threshold_meters: float = ELEVATION_THRESHOLD_METERS):
+        """(gain, loss) in feet over counted segments, from a trailing moving average of elevation.
+        A climb or descent is only counted once it moves threshold_meters from the last turning point."""
+        ele = self.track.ele
+        valid = ~np.isnan(ele)
+        if valid.sum() < 2:
+            return 0.0, 0.0
+        # Fill points without elevation from their neighbours so every segment has a difference
+        indices = np.arange(len(ele))
+        ele = np.interp(indices, indices[valid], ele[valid])
+        prefix = np.concatenate(([0.0], np.cumsum(ele)))
+        starts = np.maximum(indices - smoothing_points + 1, 0)
+        smoothed = (prefix[indices + 1] - prefix[starts]) / (indices + 1 - starts)
+        # Elevation profile over counted segments only
+        profile = np.concatenate(([0.0], np.cumsum(np.where(self.keep, np.diff(smoothed), 0.0))))
+
+        # Whether a point is a turning point depends on the previous turning point, so this pass is
+        # sequential; over a plain float list it runs at well under a microsecond a point
+        gain = loss = 0.0
+        reference = profile[0]
+        for value in profile[1:].tolist():
+            if value - reference >= threshold_meters:
+                gain += value - reference
+                reference = value
+            elif reference - value >= threshold_meters:
+                loss += reference - value
+                reference = value
+        return gain * FEET_PER_METER, loss * FEET_PER_METER
+
+    def best_distance_in(self, window_seconds: float = BEST_DISTANCE_WINDOW_SECONDS) -> float:
+        """Most counted distance (miles) ridden within any window of window_seconds"""
+        if len(self.track) < 2:
+            return 0.0
+        prefix = self.counted_distance_prefix()
+        time = self.track.time
+        # For each starting point, the last point still inside its window
+        ends = np.searchsorted(time, time + window_seconds, side="right") - 1
+        return float((prefix[ends] - prefix).max())
+
+    def fastest_time_for(self, miles: float = BEST_TIME_WINDOW_MILES):
+        """Shortest elapsed seconds in which miles of counted distance were ridden, or None if never"""
+        if len(self.track) < 2:
+            return None
+        prefix = self.counted_distance_prefix()
+        # For each starting point, the first point at which the distance has been covered
+        ends = np.searchsorted(prefix, prefix + miles - 1e-9, side="left")
+        reached = ends < len(prefix)
+        if not reached.any():
+            return None
+        time = self.track.time
+        return float((time[ends[reached]] - time[reached]).min())
+
+    def speeds(self):
+        """Speed of each segment in mph"""
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return np.where(self.durations > 0, self.distances / (self.durations / 3600.0), 0.0)
+
+    def to_cleanup(self, gpx_upload_id: int = None):
+        """Build the GpxCleanup row summarizing this track (without an id, attach it to its upload)"""
+        from models import GpxCleanup
+
+        speeds = self.speeds()[self.keep]
+        scored_hours = float(self.durations[self.keep].sum()) / 3600.0
+        elevation_gain, elevation_loss = self.elevation_change()
+        stints = stint_distances(self)
+        return GpxCleanup(
+            gpx_upload_id=gpx_upload_id,
+            total_distance=self.total_distance,
+            total_time=self.total_time,
+            average_speed=self.scored_distance / scored_hours if scored_hours > 0 else 0.0,
+            max_speed=float(speeds.max()) if len(speeds) else 0.0,
+            min_speed=float(speeds.min()) if len(speeds) else 0.0,
+            scored_distance=self.scored_distance,
+            pruned_distance_speed=self.pruned_distance_speed,
+            pruned_distance_gap=self.pruned_distance_gap,
+            pruned_distance_updated=datetime.now(),
+            elevation_gain=elevation_gain,
+            elevation_loss=elevation_loss,
+            best_hour_distance=self.best_distance_in(BEST_DISTANCE_WINDOW_SECONDS),
+            fastest_ten_mile_seconds=self.fastest_time_for(BEST_TIME_WINDOW_MILES),
+            longest_stint=float(stints.max()) if len(stints) else 0.0,
+        )
+
+
+def _local_name(tag: str) -> str:
+    return tag.rsplit("}", 1)[-1]
+
+
+def _parse_time(text: str) -> float:
+    """Parse a GPX timestamp (UTC, usually with a Z suffix) into POSIX seconds"""
+    text = text.strip()
+    if text.endswith("Z"):
+        text = text[:-1] + "+00:00"
+    return datetime.fromisoformat(text).timestamp()
+
+
+def parse_gpx(gpx_data: str) -> Track:
+    """Parse every timestamped track point out of a GPX document"""
+    root = ET.fromstring(gpx_data)
+    lat, lon, ele, time = [], [], [], []
+    for element in root.iter():
+        if _local_name(element.tag) != "trkpt":
+            continue
+        point_time = None
+        point_ele = np.nan
+        for child in element:
+            name = _local_name(child.tag)
+            if name == "time" and child.text:
+                point_time = _parse_time(child.text)
+            elif name == "ele" and child.text:
+                point_ele = float(child.text)
+        # Points without a timestamp can't be checked against the gap and speed rules
+        if point_time is None:
+            continue
+        lat.append(float(element.get("lat")))
+        lon.append(float(element.get("lon")))
+        ele.append(point_ele)
+        time.append(point_time)
+    return Track(lat, lon, ele, time)
+
+
+def to_gpx(track: Track) -> str:
+    """Serialize a track back into a minimal GPX document"""
+    points = []
+    for lat, lon, ele, time in zip(track.lat, track.lon, track.ele, track.time):
+        timestamp = datetime.fromtimestamp(time, timezone.utc).isoformat().replace("+00:00", "Z")
+        elevation = "" if np.isnan(ele) else f"<ele>{float(ele)!r}</ele>"
+        points.append(f'<trkpt lat="{float(lat)!r}" lon="{float(lon)!r}">{elevation}<time>{timestamp}</time></trkpt>')
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?>\n'
+        '<gpx xmlns="http://www.topografix.com/GPX/1/1" version="1.1" creator="floatpack_rideathon">'
+        f'<trk><trkseg>{"".join(points)}</trkseg></trk></gpx>'
+    )
+
+
+def prefix_hashes(track: Track):
+    """Rolling fingerprints of a track: element k hashes points 0..k, so any prefix of one upload can be
+    compared against the whole of another in O(1)"""
+    with np.errstate(over="ignore"):
+        lat = np.round(track.lat * HASH_COORDINATE_SCALE).astype(np.int64).view(np.uint64)
+        lon = np.round(track.lon * HASH_COORDINATE_SCALE).astype(np.int64).view(np.uint64)
+        time = np.round(track.time).astype(np.int64).view(np.uint64)
+        # Mix each quantized point into a single 64-bit value, then take a polynomial prefix sum (mod 2^64)
+        values = lat * np.uint64(0x9E3779B97F4A7C15) ^ lon * np.uint64(0xC2B2AE3D27D4EB4F) ^ time * np.uint64(0x165667B19E3779F9)
+        values ^= values >> np.uint64(29)
+        powers = np.cumprod(np.full(len(values), HASH_BASE, dtype=np.uint64)) if len(values) else values
+        return np.cumsum(values * powers, dtype=np.uint64)
+
+
+def format_hash(value) -> str:
+    return f"{int(value):016x}"
+
+
+_track_cache = OrderedDict()
+_track_cache_lock = threading.Lock()
+
+
+def upload_track(gpx_upload) -> Track:
+    """Load the full track for a GpxUpload, following base uploads when only a suffix was stored.
+    Uploads never change, so reconstructed tracks are cached; the upload time is part of the key
+    because SQLite may reuse ids after rows are deleted."""
+    key = (gpx_upload.id, gpx_upload.uploaded_at) if gpx_upload.id is not None else None
+    if key is not None:
+        with _track_cache_lock:
+            track = _track_cache.get(key)
+            if track is not None:
+                _track_cache.move_to_end(key)
+                return track
+
+    if gpx_upload.shard_segment_id is None:
+        gpx_data = gpx_upload.gpx_data
+    else:
+        from track_shards import read_segment
+        gpx_data = read_segment(gpx_upload.team_id, gpx_upload.shard_segment_id)
+    track = parse_gpx(gpx_data)
+    if gpx_upload.base_upload_id is not None:
+        track = Track.concatenate([upload_track(gpx_upload.base_upload), track])
+
+    if key is not None:
+        with _track_cache_lock:
+            _track_cache[key] = track
+            while len(_track_cache) > TRACK_CACHE_SIZE:
+                _track_cache.popitem(last=False)
+    return track
+
+
+def track_cached(gpx_upload) -> bool:
+    with _track_cache_lock:
+        return (gpx_upload.id, gpx_upload.uploaded_at) in _track_cache
+
+
+def clear_track_cache():
+    with _track_cache_lock:
+        _track_cache.clear()
+
+
+def dedupe_track(track: Track) -> Track:
+    """Drop points that repeat the previous point exactly, as some trackers log on every screen wake"""
+    if len(track) < 2:
+        return track
+    repeated = (np.diff(track.time) == 0) & (np.diff(track.lat) == 0) & (np.diff(track.lon) == 0)
+    if not repeated.any():
+        return track
+    return track[np.concatenate(([True], ~repeated))]
+
+
+def segment_distances(lat, lon):
+    """Great-circle distance in miles between consecutive points"""
+    lat = np.radians(lat)
+    lon = np.radians(lon)
+    dlat = np.diff(lat)
+    dlon = np.diff(lon)
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat[:-1]) * np.cos(lat[1:]) * np.sin(dlon / 2) ** 2
+    return 2 * EARTH_RADIUS_MILES * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def clean_track(track: Track, max_gap_seconds: float = MAX_GAP_SECONDS, max_speed_mph: float = MAX_SPEED_MPH) -> CleanedTrack:
+    """Flag the segments that don't count towards distance: gaps longer than max_gap_seconds
+    and segments ridden faster than max_speed_mph"""
+    distances = segment_distances(track.lat, track.lon)
+    durations = np.diff(track.time)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        speeds = np.where(durations > 0, distances / (durations / 3600.0), np.where(distances > 0, np.inf, 0.0))
+    gap = durations > max_gap_seconds
+    too_fast = ~gap & (speeds > max_speed_mph)
+    keep = ~gap & ~too_fast
+    return CleanedTrack(track, distances, durations, keep, gap, too_fast)
+
+
+def stint_distances(cleaned: CleanedTrack, charge_stop_seconds: float = CHARGE_STOP_SECONDS, stopped_mph: float = STOPPED_MPH):
+    """Counted distance of each stint, where stints are split by GPX gaps and charge stops"""
+    if len(cleaned.distances) == 0:
+        return np.zeros(0)
+
+    # Label runs of consecutive stopped segments and total the time spent in each run
+    stopped = (cleaned.speeds() < stopped_mph) & ~cleaned.gap
+    run_start = stopped & ~np.concatenate(([False], stopped[:-1]))
+    run_ids = np.cumsum(run_start) - 1
+    run_seconds = np.bincount(run_ids[stopped], weights=cleaned.durations[stopped], minlength=int(run_start.sum()))
+    charge_stop = np.zeros(len(stopped), dtype=bool)
+    charge_stop[stopped] = run_seconds[run_ids[stopped]] >= charge_stop_seconds
+
+    # Each run of break segments (a gap or a charge stop) starts a new stint
+    breaks = cleaned.gap | charge_stop
+    stint_ids = np.cumsum(breaks & ~np.concatenate(([False], breaks[:-1])))
+    counted = np.where(cleaned.keep & ~breaks, cleaned.distances, 0.0)
+    return np.bincount(stint_ids, weights=counted)
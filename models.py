@@ -1,23 +1,48 @@
 """
 Central models module that imports all data models to ensure proper SQLAlchemy relationship resolution.
 This module should be imported whenever any data model is needed to avoid circular import issues.
+
+The data models are loaded on first access rather than when this module is imported, so importing it
+is cheap for code paths that never reach the database. Accessing any model loads all of them, since
+their relationships refer to each other by name.
 """
 
-# Import all data models to ensure they're all available for SQLAlchemy relationship resolution
-from datamodels.team import Team
-from datamodels.challenge import Challenge, ChallengeStatus
-from datamodels.modifier import Modifier
-from datamodels.offset import Offset
-from datamodels.gpx_upload import GpxUpload
-from datamodels.scorecard import Scorecard
+import importlib
+
+# Model name -> module that defines it
+_MODEL_MODULES = {
+    'Team': 'datamodels.team',
+    'Challenge': 'datamodels.challenge',
+    'ChallengeStatus': 'datamodels.challenge',
+    'Modifier': 'datamodels.modifier',
+    'Offset': 'datamodels.offset',
+    'TeamOffsetTotal': 'datamodels.team_offset_total',
+    'GpxUpload': 'datamodels.gpx_upload',
+    'GpxCleanup': 'datamodels.gpx_cleanup',
+    'GpxRoute': 'datamodels.gpx_route',
+    'Scorecard': 'datamodels.scorecard',
+    'StateVersion': 'datamodels.state_version',
+    'Job': 'datamodels.job',
+    'JobStatus': 'datamodels.job',
+}
+
+
+def load_models():
+    """Import every data model into this module"""
+    for name, module in _MODEL_MODULES.items():
+        globals()[name] = getattr(importlib.import_module(module), name)
+
+    # Registers the listeners that keep the live team status and challenge lock caches current
+    import team_status  # noqa: F401
+    import challenge_locks  # noqa: F401
+
+
+def __getattr__(name):
+    if name in _MODEL_MODULES:
+        load_models()
+        return globals()[name]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 
 # Export all models for easy importing
-__all__ = [
-    'Team',
-    'Challenge', 
-    'ChallengeStatus',
-    'Modifier',
-    'Offset',
-    'GpxUpload',
-    'Scorecard'
-]
+__all__ = list(_MODEL_MODULES)
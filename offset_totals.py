@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Per-team offset totals for Floatpack Rideathon.
+
+Distance steals and penalties are Offset rows. Instead of summing the whole offsets table for every
+standings computation, triggers keep team_offset_totals current as offsets are inserted, updated or
+deleted. This module reads those totals and checks them against a full recomputation, so drift
+(e.g. from offsets written before the triggers existed) is reported and can be repaired.
+
+    python offset_totals.py            # report drift
+    python offset_totals.py --repair   # rebuild the totals from the offsets table
+"""
+
+import argparse
+from collections import defaultdict
+
+from sqlalchemy import func
+
+from database import SessionLocal
+
+# Float sums accumulated in different orders can differ in the last bits
+DRIFT_TOLERANCE = 1e-6
+
+
+def get_offset_totals(db):
+    """{team id: (given, received)} from the maintained totals"""
+    from models import TeamOffsetTotal
+
+    return {row.team_id: (row.given, row.received) for row in db.query(TeamOffsetTotal).all()}
+
+
+def received_offsets(db):
+    """{team id: total offset distance received}, the amount added to each team's earned distance"""
+    from models import TeamOffsetTotal
+
+    return dict(db.query(TeamOffsetTotal.team_id, TeamOffsetTotal.received).all())
+
+
+def recompute_offset_totals(db):
+    """{team id: (given, received)} summed from scratch over the offsets table"""
+    from models import Offset
+
+    totals = defaultdict(lambda: [0.0, 0.0])
+    for team_id, given in db.query(Offset.creator_id, func.sum(Offset.distance)).group_by(Offset.creator_id):
+        totals[team_id][0] = given
+    for team_id, received in db.query(Offset.receiver_id, func.sum(Offset.distance)).group_by(Offset.receiver_id):
+        totals[team_id][1] = received
+    return {team_id: tuple(values) for team_id, values in totals.items()}
+
+
+def check_offset_totals(db):
+    """List every team whose stored totals differ from a full recomputation"""
+    stored = get_offset_totals(db)
+    actual = recompute_offset_totals(db)
+
+    drift = []
+    for team_id in sorted(set(stored) | set(actual)):
+        stored_given, stored_received = stored.get(team_id, (0.0, 0.0))
+        actual_given, actual_received = actual.get(team_id, (0.0, 0.0))
+        if abs(stored_given - actual_given) > DRIFT_TOLERANCE or abs(stored_received - actual_received) > DRIFT_TOLERANCE:
+            drift.append({
+                "team_id": team_id,
+                "stored": (stored_given, stored_received),
+                "actual": (actual_given, actual_received)
+            })
+    return drift
+
+
+def rebuild_offset_totals(db):
+    """Replace the stored totals with a full recomputation (the caller commits)"""
+    from models import TeamOffsetTotal
+
+    db.query(TeamOffsetTotal).delete()
+    db.add_all(
+        TeamOffsetTotal(team_id=team_id, given=given, received=received)
+        for team_id, (given, received) in recompute_offset_totals(db).items()
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check the per-team offset totals against the offsets table")
+    parser.add_argument("--repair", action="store_true", help="Rebuild the totals if they have drifted")
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        drift = check_offset_totals(db)
+        for entry in drift:
+            print(f"Team {entry['team_id']}: stored given/received {entry['stored']}, actual {entry['actual']}")
+        if drift and args.repair:
+            rebuild_offset_totals(db)
+            db.commit()
+            print(f"Rebuilt offset totals for {len(drift)} drifted teams")
+        elif not drift:
+            print("Offset totals are consistent")
+    finally:
+        db.close()
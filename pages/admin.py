@@ -1,5 +1,10 @@
+import hashlib
+
 import streamlit as st
-from database import clear_database, populate_from_config, populate_from_yaml_content, get_database_status
+from admin_actions import ADMIN_ACTIONS, recompute_scores
+from admin_metrics import get_admin_metrics, invalidate as invalidate_metrics
+from database import clear_database, populate_from_config, populate_from_yaml_content, get_unverified_completions
+from scoring import SCORING_PIPELINE
 
 st.title("Admin")
 
@@ -10,25 +15,37 @@ Here are some admin tools for managing the database.
 # Database Management Section
 st.header("Database Management")
 
-col1, col2, col3 = st.columns(3)
+# Actions are shared by every admin session: a click while the same action is running waits for
+# that run instead of starting another
+for state in ADMIN_ACTIONS.running():
+    waiting = f", {state.waiters} more request(s) waiting on it" if state.waiters else ""
+    st.info(f"⏳ {state.action} running since {state.started_at:%H:%M:%S}{waiting}")
+
+def show_result(success, message):
+    if success:
+        invalidate_metrics()
+        st.success(message)
+    else:
+        st.error(message)
+
+col1, col2, col3, col4 = st.columns(4)
 
 with col1:
     if st.button("🗑️ Clear Database", type="secondary"):
-        success, message = clear_database()
-        if success:
-            st.success(message)
-        else:
-            st.error(message)
+        with st.spinner("Clearing database..."):
+            show_result(*ADMIN_ACTIONS.run("clear_database", clear_database))
 
 with col2:
     if st.button("📄 Populate from config.yaml", type="primary"):
-        success, message = populate_from_config()
-        if success:
-            st.success(message)
-        else:
-            st.error(message)
+        with st.spinner("Populating from config.yaml..."):
+            show_result(*ADMIN_ACTIONS.run("populate_config", populate_from_config))
 
 with col3:
+    if st.button("🧮 Recompute Scores", type="secondary"):
+        with st.spinner("Scoring every team..."):
+            show_result(*ADMIN_ACTIONS.run("recompute_scores", recompute_scores))
+
+with col4:
     st.markdown("**Upload YAML File**")
     uploaded_file = st.file_uploader("Choose a YAML file", type=['yaml', 'yml'], key="yaml_upload")
     
@@ -36,11 +53,10 @@ with col3:
         if st.button("📤 Populate from Uploaded YAML", type="primary"):
             try:
                 yaml_content = uploaded_file.read().decode('utf-8')
-                success, message = populate_from_yaml_content(yaml_content)
-                if success:
-                    st.success(message)
-                else:
-                    st.error(message)
+                # The same file uploaded twice shares one run
+                key = hashlib.sha256(yaml_content.encode()).hexdigest()
+                with st.spinner("Populating from uploaded YAML..."):
+                    show_result(*ADMIN_ACTIONS.run("populate_yaml", populate_from_yaml_content, yaml_content, key=key))
             except Exception as e:
                 st.error(f"Error reading uploaded file: {str(e)}")
 
@@ -48,13 +64,104 @@ with col3:
 st.header("Database Status")
 
 try:
-    status = get_database_status()
+    # Cached for a few seconds, so reruns don't query the database again
+    metrics = get_admin_metrics()
     
-    st.metric("Teams", status["teams"])
-    st.metric("Challenges", status["challenges"])
-    st.metric("Modifiers", status["modifiers"])
-    st.metric("Offsets", status["offsets"])
+    columns = st.columns(3)
+    for i, (table, count) in enumerate(metrics.counts.items()):
+        growth = metrics.growth_per_hour[table]
+        with columns[i % 3]:
+            st.metric(table.replace("_", " ").title(), count, delta=None if growth is None else f"{growth:+.0f}/h")
+    
+    col1, col2, col3 = st.columns(3)
+    col1.metric("Database size", f"{metrics.database_bytes / 2**20:.1f} MB")
+    col2.metric("WAL size", f"{metrics.wal_bytes / 2**20:.1f} MB")
+    col3.metric(
+        "Last scoring tick",
+        metrics.last_scoring_tick.strftime("%H:%M:%S") if metrics.last_scoring_tick else "Never"
+    )
+    
+    if metrics.last_uploads:
+        st.dataframe(metrics.last_uploads, hide_index=True, column_order=["team_name", "uploaded_at"])
+    st.caption(f"Collected at {metrics.collected_at:%H:%M:%S}")
     
 except Exception as e:
     st.error(f"Error reading database status: {str(e)}")
 
+# Scoring Pipeline Section
+st.header("Scoring Pipeline")
+
+pipeline_report = SCORING_PIPELINE.report()
+if pipeline_report:
+    st.dataframe(pipeline_report, hide_index=True, column_config={
+        "hit_rate": st.column_config.NumberColumn("hit rate", format="percent"),
+        "ms": st.column_config.NumberColumn("time (ms)", format="%.1f"),
+    })
+    st.caption("Cache stats for the scoring ticks run by this server, e.g. Recompute Scores; workers log their own")
+else:
+    st.info("No scoring ticks have run in this server yet")
+
+# Challenge Verification Section
+st.header("Challenge Verification")
+
+try:
+    unverified = get_unverified_completions()
+    
+    if unverified:
+        st.warning(f"{len(unverified)} completed challenge(s) were not near the team's GPX track")
+        st.dataframe(unverified, hide_index=True)
+    else:
+        st.success("Every checked completion matches its team's GPX track")
+    
+except Exception as e:
+    st.error(f"Error reading challenge verification: {str(e)}")
+
+# What-if Section
+st.header("What-if Adjudication")
+
+st.markdown("""
+Preview how a ruling would change the standings before recording it.
+""")
+
+@st.cache_resource(max_entries=2, show_spinner=False)
+def load_scoring_state(version):
+    """In-memory scoring inputs, rebuilt when the scoring job publishes a new scoreboard"""
+    from database import SessionLocal
+    from simulator import ScoringState
+    
+    db = SessionLocal()
+    try:
+        return ScoringState.load(db)
+    finally:
+        db.close()
+
+try:
+    from database import get_version
+    from scoring import SCOREBOARD_VERSION
+    from simulator import Simulation
+    
+    state = load_scoring_state(get_version(SCOREBOARD_VERSION))
+    team_names = {team.name: team_id for team_id, team in state.teams.items()}
+    
+    if team_names:
+        col1, col2 = st.columns(2)
+        with col1:
+            team_name = st.selectbox("Team", sorted(team_names), key="whatif_team")
+        with col2:
+            distance = st.number_input("Dock (-) or award (+) miles", value=0.0, step=1.0, key="whatif_distance")
+        nullified = st.multiselect(
+            "Nullify completed challenges", sorted(state.challenge_teams), key="whatif_challenges",
+            format_func=lambda challenge_id: f"Challenge {challenge_id} ({state.teams[state.challenge_teams[challenge_id]].name})"
+        )
+        
+        simulation = Simulation(state).add_offset(team_names[team_name], distance)
+        for challenge_id in nullified:
+            simulation.nullify_challenge(challenge_id)
+        st.dataframe(simulation.standings(), hide_index=True, column_order=[
+            "rank", "team_name", "distance_earned", "change", "previous_rank", "challenges_completed"
+        ])
+    else:
+        st.info("No teams to simulate yet")
+    
+except Exception as e:
+    st.error(f"Error running what-if simulation: {str(e)}")
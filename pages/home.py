@@ -1,6 +1,4 @@
 import streamlit as st
-from models import Team
-from database import SessionLocal
 
 st.title("Float Pack Ride-a-thon")
 
@@ -14,6 +12,10 @@ if st.session_state.get("team") is None:
     st.text_input("Team Name", key="team_name")
     st.text_input("Secret Code", key="secret_code")
     if st.button("Login"):
+        # Database imports are deferred so the login form renders without loading SQLAlchemy
+        from models import Team
+        from database import SessionLocal
+
         # Query teams from database
         db = SessionLocal()
         try:
@@ -38,7 +40,19 @@ else:
     st.success(f"Logged in as: {team.name}")
     st.write(f"**Members:** {team.members}")
     st.write(f"**Team Color:** {team.color}")
-    
+
+    # Live status comes from the in-process cache, not a scan of modifiers and challenges
+    from team_status import get_team_status
+    status = get_team_status(team.id)
+    st.header("Current Status")
+    col1, col2 = st.columns(2)
+    with col1:
+        st.metric("Active Challenge", status.active_challenge_name or "None")
+    with col2:
+        st.metric("Multiplier", f"{status.multiplier:g}x")
+    if status.expires_at:
+        st.caption(f"Multiplier changes at {status.expires_at.strftime('%Y-%m-%d %H:%M:%S')}")
+
     if st.button("Logout"):
         del st.session_state["team"]
         st.rerun()
@@ -0,0 +1,58 @@
+import streamlit as st
+import pydeck as pdk
+from database import SessionLocal, get_version
+from routes import ROUTE_LEVELS, ROUTES_VERSION, get_team_routes
+
+st.title("Map")
+
+DETAIL_LEVELS = {"Overview": ROUTE_LEVELS[0][0], "City": ROUTE_LEVELS[1][0], "Street": ROUTE_LEVELS[2][0]}
+
+
+@st.cache_data(max_entries=8, show_spinner=False)
+def load_routes(zoom, version):
+    """Simplified team routes for a zoom; cached until a new upload's routes are stored"""
+    db = SessionLocal()
+    try:
+        return get_team_routes(db, zoom)
+    finally:
+        db.close()
+
+
+def hex_to_rgb(color):
+    color = color.lstrip("#")
+    if len(color) != 6:
+        return [128, 128, 128]
+    return [int(color[i:i + 2], 16) for i in (0, 2, 4)]
+
+
+detail = st.segmented_control("Detail", list(DETAIL_LEVELS), default="Overview")
+zoom = DETAIL_LEVELS[detail or "Overview"]
+
+try:
+    routes = load_routes(zoom, get_version(ROUTES_VERSION))
+
+    if not routes:
+        st.warning("No GPX tracks have been submitted yet.")
+    else:
+        for route in routes:
+            route["rgb"] = hex_to_rgb(route["team_color"])
+
+        points = [point for route in routes for point in route["path"]]
+        view = pdk.ViewState(
+            longitude=sum(p[0] for p in points) / len(points),
+            latitude=sum(p[1] for p in points) / len(points),
+            zoom=max(zoom, 11)
+        )
+        layer = pdk.Layer(
+            "PathLayer",
+            routes,
+            get_path="path",
+            get_color="rgb",
+            width_min_pixels=3,
+            pickable=True
+        )
+        st.pydeck_chart(pdk.Deck(layers=[layer], initial_view_state=view, tooltip={"text": "{team_name}"}))
+        st.caption(f"{len(points)} points at {detail or 'Overview'} detail")
+
+except Exception as e:
+    st.error(f"Error loading routes: {str(e)}")
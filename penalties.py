@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Late GPX submission penalties for Floatpack Rideathon.
+
+Teams must upload their track between :50 and :00 every hour of the event. Each tick checks every
+hourly window that closed at least PENALTY_GRACE ago since the event started and gives a penalty
+Offset to each team without an upload in it. The grace period lets an upload submitted on time
+finish its trip through the job queue (retries and an expired lease included) before its window is
+judged. Without an event window in the config no penalties are given. Penalties carry a key for their team and window and are inserted with
+ON CONFLICT DO NOTHING, so reruns and concurrent ticks from several app processes never penalize
+the same miss twice.
+"""
+
+import argparse
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import and_, or_
+from sqlalchemy.dialects.sqlite import insert
+
+from config import CONFIG_FILE, load_config
+from database import SessionLocal
+
+LATE_PENALTY_MILES = 5.0
+SUBMISSION_WINDOW = timedelta(minutes=10)
+# Longer than a worker's lease plus the ingest retry backoff
+PENALTY_GRACE = timedelta(minutes=10)
+TICK_SECONDS = 60
+
+
+def load_event_window(config_file=CONFIG_FILE):
+    """(start, end) of the event from the config's event section, or (None, None) if it has none"""
+    config = load_config(config_file)
+    return config.event_start, config.event_end
+
+
+def submission_deadlines(event_start, event_end, now, grace=PENALTY_GRACE):
+    """Every on-the-hour deadline after the event start whose window closed at least grace before now"""
+    deadline = event_start.replace(minute=0, second=0, microsecond=0) + timedelta(hours=1)
+    last = min(event_end, now - grace)
+    deadlines = []
+    while deadline <= last:
+        deadlines.append(deadline)
+        deadline += timedelta(hours=1)
+    return deadlines
+
+
+def penalty_key(team_id, deadline):
+    return f"late-gpx:{team_id}:{deadline:%Y-%m-%dT%H:%M}"
+
+
+def on_time_submissions(db, deadlines):
+    """Set of (team id, deadline) pairs with an upload inside the deadline's window, in one query"""
+    from models import GpxUpload
+
+    windows = [
+        and_(GpxUpload.uploaded_at >= deadline - SUBMISSION_WINDOW, GpxUpload.uploaded_at <= deadline)
+        for deadline in deadlines
+    ]
+    rows = db.query(GpxUpload.team_id, GpxUpload.uploaded_at).filter(or_(*windows)).all()
+
+    submitted = set()
+    for team_id, uploaded_at in rows:
+        # An upload at exactly :00 belongs to the window that just closed
+        deadline = uploaded_at.replace(minute=0, second=0, microsecond=0)
+        if uploaded_at != deadline:
+            deadline += timedelta(hours=1)
+        submitted.add((team_id, deadline))
+    return submitted
+
+
+def evaluate_late_submissions(db, event_start, event_end, now=None, penalty_miles: float = LATE_PENALTY_MILES):
+    """Penalize every team that missed a closed submission window; returns the number of new penalties.
+    The caller commits."""
+    from models import Team, Offset
+
+    now = now or datetime.now()
+    deadlines = submission_deadlines(event_start, event_end, now)
+    team_ids = [team_id for (team_id,) in db.query(Team.id).all()]
+    if not deadlines or not team_ids:
+        return 0
+
+    submitted = on_time_submissions(db, deadlines)
+    rows = [
+        {
+            "distance": -penalty_miles,
+            "creator_id": team_id,
+            "receiver_id": team_id,
+            "created_at": deadline,
+            "penalty_key": penalty_key(team_id, deadline),
+        }
+        for deadline in deadlines
+        for team_id in team_ids
+        if (team_id, deadline) not in submitted
+    ]
+    if not rows:
+        return 0
+
+    statement = insert(Offset).values(rows).on_conflict_do_nothing(index_elements=["penalty_key"])
+    return db.execute(statement).rowcount
+
+
+def run_penalty_tick(db_session=None, event_start=None, event_end=None, now=None, commit=True):
+    """Apply any outstanding late penalties; they count from the next scoring tick.
+    With commit=False the caller's transaction is left open for it to commit."""
+    if event_start is None or event_end is None:
+        event_start, event_end = load_event_window()
+    if event_start is None or event_end is None:
+        return 0
+
+    db = db_session or SessionLocal()
+    try:
+        added = evaluate_late_submissions(db, event_start, event_end, now)
+        if commit:
+            db.commit()
+        return added
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        if db_session is None:
+            db.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Apply late GPX submission penalties")
+    parser.add_argument("--loop", action="store_true", help=f"Keep running, checking every {TICK_SECONDS} seconds")
+    args = parser.parse_args()
+
+    while True:
+        added = run_penalty_tick()
+        print(f"Applied {added} late submission penalties")
+        if not args.loop:
+            break
+        time.sleep(TICK_SECONDS)
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+Replay scoring for Floatpack Rideathon.
+
+Re-runs GPX cleanup and scoring for a whole event from the stored uploads, modifiers and offsets.
+It can use different cleanup parameters, e.g. to tune the gap and speed limits. The results are
+diffed against the latest recorded scorecards. Inputs are loaded once in the parent process; each
+team's track is then cleaned and scored for every parameter set in a process pool. Replays are
+deterministic and never write to the database.
+
+    python replay.py                                  # current parameters vs the recorded results
+    python replay.py --max-gap 60 90 --max-speed 25 30
+"""
+
+import argparse
+import itertools
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+
+from database import SessionLocal
+from gpx import MAX_GAP_SECONDS, MAX_SPEED_MPH, clean_track, upload_track
+from offset_totals import received_offsets
+from scoring import get_latest_scorecards, latest_uploads, rank_standings, score_track
+from simulator import SimModifier
+
+
+@dataclass(frozen=True)
+class ReplayParams:
+    """Cleanup parameters to score with"""
+    max_gap_seconds: float = MAX_GAP_SECONDS
+    max_speed_mph: float = MAX_SPEED_MPH
+
+    def __str__(self):
+        return f"gap {self.max_gap_seconds:g}s, speed {self.max_speed_mph:g} mph"
+
+
+def load_replay_inputs(db):
+    """Everything replay needs from the database: {team id: (track, modifiers)} and offsets by team"""
+    from models import Team, Modifier
+
+    uploads = latest_uploads(db)
+    modifiers = {}
+    for m in db.query(Modifier).order_by(Modifier.id):
+        modifiers.setdefault(m.receiver_id, []).append(
+            SimModifier(m.id, m.multiplier, m.start, m.end, m.created_at, m.challenge_id)
+        )
+
+    inputs = {}
+    for (team_id,) in db.query(Team.id).order_by(Team.id):
+        track = upload_track(uploads[team_id]) if team_id in uploads else None
+        inputs[team_id] = (track, modifiers.get(team_id, []))
+    return inputs, received_offsets(db)
+
+
+def score_team(task):
+    """(traveled, earned before offsets) for one team's track under each parameter set"""
+    track, modifiers, param_sets = task
+    if track is None:
+        return [(0.0, 0.0) for _ in param_sets]
+    return [
+        score_track(clean_track(track, params.max_gap_seconds, params.max_speed_mph), modifiers)
+        for params in param_sets
+    ]
+
+
+def replay_event(db, param_sets, processes=None):
+    """Rescore every team under each parameter set; returns {params: {team id: (traveled, earned)}}.
+    processes=1 scores in this process."""
+    param_sets = list(param_sets)
+    inputs, offsets = load_replay_inputs(db)
+    team_ids = list(inputs)
+    tasks = [(track, modifiers, param_sets) for track, modifiers in inputs.values()]
+
+    if processes == 1 or len(tasks) <= 1:
+        results = list(map(score_team, tasks))
+    else:
+        # Spawned workers, since forking a process with live threads (e.g. the Streamlit server) can deadlock
+        with ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context("spawn")) as pool:
+            results = list(pool.map(score_team, tasks))
+
+    return {
+        params: {
+            team_id: (scores[i][0], scores[i][1] + (offsets.get(team_id) or 0.0))
+            for team_id, scores in zip(team_ids, results)
+        }
+        for i, params in enumerate(param_sets)
+    }
+
+
+def diff_scorecards(db, replayed):
+    """Compare one parameter set's replayed scores with each team's latest recorded scorecard.
+    Both are ranked in scoreboard order; a replay doesn't change the challenges each team completed."""
+    recorded = {
+        team.id: (
+            team.name,
+            scorecard.challenges_completed if scorecard else 0,
+            scorecard.distance_traveled if scorecard else 0.0,
+            scorecard.distance_earned if scorecard else 0.0,
+        )
+        for team, scorecard in get_latest_scorecards(db)
+    }
+    recorded_rank = rank_standings({
+        team_id: (completed, earned, name) for team_id, (name, completed, _, earned) in recorded.items()
+    })
+    replayed_rank = rank_standings({
+        team_id: (completed, replayed.get(team_id, (0.0, 0.0))[1], name)
+        for team_id, (name, completed, _, _) in recorded.items()
+    })
+
+    rows = []
+    for team_id, (name, _, traveled, earned) in recorded.items():
+        new_traveled, new_earned = replayed.get(team_id, (0.0, 0.0))
+        rows.append({
+            "team_name": name,
+            "recorded_traveled": traveled,
+            "replayed_traveled": new_traveled,
+            "recorded_earned": earned,
+            "replayed_earned": new_earned,
+            "earned_change": new_earned - earned,
+            "recorded_rank": recorded_rank[team_id],
+            "replayed_rank": replayed_rank[team_id],
+        })
+    return sorted(rows, key=lambda row: row["replayed_rank"])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rescore the stored event under different cleanup parameters")
+    parser.add_argument("--max-gap", type=float, nargs="+", default=[MAX_GAP_SECONDS], help="Gap limits in seconds")
+    parser.add_argument("--max-speed", type=float, nargs="+", default=[MAX_SPEED_MPH], help="Speed limits in mph")
+    parser.add_argument("--processes", type=int, default=None, help="Worker processes (default: one per CPU)")
+    args = parser.parse_args()
+
+    param_sets = [ReplayParams(gap, speed) for gap, speed in itertools.product(args.max_gap, args.max_speed)]
+    db = SessionLocal()
+    try:
+        results = replay_event(db, param_sets, args.processes)
+        for params in param_sets:
+            print(f"\n{params}")
+            for row in diff_scorecards(db, results[params]):
+                print(
+                    f"  {row['replayed_rank']:>2} ({row['recorded_rank']:>2}) {row['team_name']:<20} "
+                    f"{row['replayed_earned']:8.2f} mi ({row['earned_change']:+.2f})"
+                )
+    finally:
+        db.close()
@@ -0,0 +1,149 @@
+"""
+Simplified team routes for map rendering.
+
+Each GpxUpload gets a Douglas-Peucker polyline per level of detail, stored as GpxRoute rows, so the
+map only ships the handful of points that are visible at the current zoom instead of the raw track.
+Uploads are cumulative, so when a new upload extends its base upload only the new points are
+simplified and appended to the base upload's polylines. Routes are built in the transaction that
+stores the upload, which also bumps ROUTES_VERSION so maps refresh; the map itself only reads them.
+"""
+
+import json
+
+import numpy as np
+
+from gpx import upload_track
+
+# (minimum map zoom, tolerance in meters); roughly one screen pixel at the upper end of each range
+ROUTE_LEVELS = [(0, 100.0), (12, 20.0), (15, 3.0)]
+ROUTES_VERSION = "routes"
+
+METERS_PER_DEGREE_LAT = 111320.0
+COORDINATE_DECIMALS = 6
+
+
+def level_for_zoom(zoom: float):
+    """The (min zoom, tolerance) level to serve at a map zoom"""
+    level = ROUTE_LEVELS[0]
+    for candidate in ROUTE_LEVELS:
+        if zoom >= candidate[0]:
+            level = candidate
+    return level
+
+
+def simplify(lat, lon, tolerance: float):
+    """Indices of the points Douglas-Peucker keeps at a tolerance in meters"""
+    n = len(lat)
+    if n <= 2:
+        return np.arange(n)
+
+    # Project to local meters; accurate enough over the few miles of a city route
+    y = np.asarray(lat, dtype=float) * METERS_PER_DEGREE_LAT
+    x = np.asarray(lon, dtype=float) * METERS_PER_DEGREE_LAT * np.cos(np.radians(np.mean(lat)))
+
+    keep = np.zeros(n, dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, n - 1)]
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+        px, py = x[first + 1:last], y[first + 1:last]
+        dx, dy = x[last] - x[first], y[last] - y[first]
+        length_squared = dx * dx + dy * dy
+        if length_squared == 0:
+            distances = np.hypot(px - x[first], py - y[first])
+        else:
+            # Distance to the segment, not the infinite line, so loops back to the start are kept
+            t = np.clip(((px - x[first]) * dx + (py - y[first]) * dy) / length_squared, 0.0, 1.0)
+            distances = np.hypot(px - (x[first] + t * dx), py - (y[first] + t * dy))
+        farthest = int(np.argmax(distances))
+        if distances[farthest] > tolerance:
+            split = first + 1 + farthest
+            keep[split] = True
+            stack.append((first, split))
+            stack.append((split, last))
+    return np.flatnonzero(keep)
+
+
+def _path(lat, lon, indices):
+    return [[round(float(lon[i]), COORDINATE_DECIMALS), round(float(lat[i]), COORDINATE_DECIMALS)] for i in indices]
+
+
+def _base_routes(db, upload):
+    """Routes of the upload this one extends, keyed by min zoom"""
+    from models import GpxRoute
+
+    if upload.base_upload_id is None:
+        return {}
+    routes = db.query(GpxRoute).filter(GpxRoute.gpx_upload_id == upload.base_upload_id).all()
+    return {route.min_zoom: route for route in routes}
+
+
+def build_routes(db, upload, track=None):
+    """Add a GpxRoute per level of detail for an upload (the caller commits)"""
+    from models import GpxRoute
+
+    track = track if track is not None else upload_track(upload)
+    base = _base_routes(db, upload)
+
+    routes = []
+    for min_zoom, tolerance in ROUTE_LEVELS:
+        route = base.get(min_zoom)
+        if route is not None and 2 <= route.source_points <= len(track):
+            # Only simplify from the previous endpoint onwards and append to the cached polyline
+            start = route.source_points - 1
+            suffix = simplify(track.lat[start:], track.lon[start:], tolerance) + start
+            path = json.loads(route.path) + _path(track.lat, track.lon, suffix[1:])
+        else:
+            path = _path(track.lat, track.lon, simplify(track.lat, track.lon, tolerance))
+        routes.append(GpxRoute(
+            gpx_upload=upload,
+            min_zoom=min_zoom,
+            tolerance=tolerance,
+            source_points=len(track),
+            path=json.dumps(path)
+        ))
+    db.add_all(routes)
+    return routes
+
+
+def build_missing_routes(db):
+    """Add the routes of every upload stored without them, oldest first so extended routes exist
+    (the caller commits); returns the number of uploads routed"""
+    from models import GpxUpload, GpxRoute
+    from database import bump_version
+
+    routed = db.query(GpxRoute.gpx_upload_id).distinct()
+    uploads = db.query(GpxUpload).filter(GpxUpload.id.not_in(routed)).order_by(GpxUpload.id).all()
+    for upload in uploads:
+        build_routes(db, upload)
+        db.flush()  # The next upload may extend this one's routes
+    if uploads:
+        bump_version(db, ROUTES_VERSION)
+    return len(uploads)
+
+
+def get_team_routes(db, zoom: float):
+    """Simplified route of every team's latest upload at the level of detail for a map zoom.
+    Read only: an upload whose routes haven't been built yet is left off the map."""
+    from models import Team, GpxRoute
+    from scoring import latest_uploads
+
+    min_zoom, _ = level_for_zoom(zoom)
+    uploads = latest_uploads(db)
+    cached = {
+        route.gpx_upload_id: route
+        for route in db.query(GpxRoute).filter(
+            GpxRoute.gpx_upload_id.in_([upload.id for upload in uploads.values()]),
+            GpxRoute.min_zoom == min_zoom
+        )
+    }
+
+    results = []
+    for team in db.query(Team).all():
+        upload = uploads.get(team.id)
+        route = cached.get(upload.id) if upload is not None else None
+        if route is not None:
+            results.append({"team_name": team.name, "team_color": team.color, "path": json.loads(route.path)})
+    return results
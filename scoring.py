@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+"""
+Scoring job for Floatpack Rideathon.
+
+Each tick scores every team's latest GPX track and applies the modifiers and offsets they received.
+When any team's totals differ from its latest Scorecard, it writes a Scorecard per team and publishes
+a new scoreboard version so open scoreboards refresh; an idle tick writes nothing.
+
+The work runs as a cached pipeline (parse -> dedupe -> clean -> modifiers per team, then offsets ->
+rank), so a tick only recomputes the stages whose inputs changed since the previous one. Each
+Scorecard stores the team's rank in scoreboard order. Per-stage cache stats
+for the ticks run in this process are shown on the admin page.
+"""
+
+from collections import defaultdict
+from datetime import datetime
+
+import numpy as np
+from sqlalchemy import func
+
+import track_shards
+from database import SessionLocal, bump_version
+from geofence import verify_completions
+from gpx import MAX_GAP_SECONDS, MAX_SPEED_MPH, clean_track, dedupe_track, track_cached, upload_track
+from offset_totals import received_offsets
+from pipeline import Pipeline, Stage
+
+SCOREBOARD_VERSION = "scoreboard"
+
+
+def modifier_multipliers(times, modifiers):
+    """Effective multiplier at each timestamp: the product of every modifier active at that time"""
+    multipliers = np.ones(len(times))
+    for modifier in modifiers:
+        start = modifier.start or modifier.created_at
+        start = start.timestamp() if start else -np.inf
+        end = modifier.end.timestamp() if modifier.end else np.inf
+        multipliers[(times >= start) & (times < end)] *= modifier.multiplier
+    return multipliers
+
+
+def score_track(cleaned, modifiers):
+    """Return (distance traveled, distance earned) for a cleaned track before offsets"""
+    if cleaned is None or len(cleaned.distances) == 0:
+        return 0.0, 0.0
+    distances = np.where(cleaned.keep, cleaned.distances, 0.0)
+    # A segment earns at the multiplier in effect when it starts
+    earned = distances * modifier_multipliers(cleaned.track.time[:-1], modifiers)
+    return float(distances.sum()), float(earned.sum())
+
+
+def apply_offsets(team_ids, offsets, *scores):
+    """{team id: (distance traveled, distance earned)} once each team's received offsets are added"""
+    return {
+        team_id: (traveled, earned + (offsets.get(team_id) or 0.0))
+        for team_id, (traveled, earned) in zip(team_ids, scores)
+    }
+
+
+def standings_key(challenges_completed, distance_earned, team_name, team_id):
+    """Scoreboard order: most challenges completed, then most distance earned, then team name and id"""
+    return (-challenges_completed, -distance_earned, team_name, team_id)
+
+
+def rank_standings(standings):
+    """Rank (1 = first) of each team id in {team id: (challenges completed, distance earned, team name)}"""
+    order = sorted(standings, key=lambda team_id: standings_key(*standings[team_id], team_id))
+    return {team_id: position + 1 for position, team_id in enumerate(order)}
+
+
+def rank_totals(totals, completed, names):
+    """Scoreboard rank of each team id from its totals, completed challenge count and name"""
+    return rank_standings({
+        team_id: (completed.get(team_id, 0), earned, names[team_id]) for team_id, (_, earned) in totals.items()
+    })
+
+
+PARSE = Stage("parse", upload_track)
+DEDUPE = Stage("dedupe", dedupe_track)
+CLEAN = Stage("clean", clean_track, max_gap_seconds=MAX_GAP_SECONDS, max_speed_mph=MAX_SPEED_MPH)
+MODIFIERS = Stage("modifiers", score_track)
+OFFSETS = Stage("offsets", apply_offsets)
+RANK = Stage("rank", rank_totals)
+
+# Shared across ticks in this process so unchanged stages are cache hits
+SCORING_PIPELINE = Pipeline()
+
+
+def scoring_graph(team_ids, uploads, modifiers, offsets, completed, names):
+    """Sources and nodes of the scoring pipeline for one tick"""
+    sources = {
+        "teams": (team_ids, team_ids),
+        "offsets": (offsets, sorted(offsets.items())),
+        "completed": (completed, sorted(completed.items())),
+        "names": (names, sorted(names.items())),
+    }
+    nodes = {}
+    for team_id in team_ids:
+        upload = uploads.get(team_id)
+        if upload is not None:
+            # Uploads never change once stored, so their identity stands in for their content
+            sources[f"upload:{team_id}"] = (upload, (upload.id, upload.uploaded_at, upload.point_count, upload.track_hash))
+            nodes[f"track:{team_id}"] = (PARSE, [f"upload:{team_id}"])
+            nodes[f"deduped:{team_id}"] = (DEDUPE, [f"track:{team_id}"])
+            nodes[f"cleaned:{team_id}"] = (CLEAN, [f"deduped:{team_id}"])
+        else:
+            sources[f"cleaned:{team_id}"] = (None, None)
+        team_modifiers = sorted(modifiers[team_id], key=lambda m: m.id)
+        sources[f"modifiers:{team_id}"] = (
+            team_modifiers, [(m.id, m.multiplier, m.start, m.end, m.created_at) for m in team_modifiers]
+        )
+        nodes[f"score:{team_id}"] = (MODIFIERS, [f"cleaned:{team_id}", f"modifiers:{team_id}"])
+    nodes["totals"] = (OFFSETS, ["teams", "offsets"] + [f"score:{team_id}" for team_id in team_ids])
+    nodes["ranking"] = (RANK, ["totals", "completed", "names"])
+    return sources, nodes
+
+
+def latest_uploads(db):
+    """Most recent GpxUpload for each team, keyed by team id"""
+    from models import GpxUpload
+
+    latest_ids = db.query(func.max(GpxUpload.id)).group_by(GpxUpload.team_id)
+    uploads = db.query(GpxUpload).filter(GpxUpload.id.in_(latest_ids)).all()
+    return {upload.team_id: upload for upload in uploads}
+
+
+def get_latest_scorecards(db):
+    """Return (team, latest scorecard or None) pairs for every team in two queries"""
+    from models import Team, Scorecard
+
+    latest_ids = db.query(func.max(Scorecard.id)).group_by(Scorecard.team_id)
+    scorecards = db.query(Scorecard).filter(Scorecard.id.in_(latest_ids)).all()
+    by_team = {scorecard.team_id: scorecard for scorecard in scorecards}
+    return [(team, by_team.get(team.id)) for team in db.query(Team).all()]
+
+
+def scorecards_changed(db, scorecards):
+    """Whether any team's new totals differ from its latest stored scorecard"""
+    latest = {team.id: scorecard for team, scorecard in get_latest_scorecards(db)}
+    for scorecard in scorecards:
+        previous = latest.get(scorecard.team_id)
+        if previous is None or (
+            previous.challenges_completed, previous.distance_traveled, previous.distance_earned, previous.rank
+        ) != (scorecard.challenges_completed, scorecard.distance_traveled, scorecard.distance_earned, scorecard.rank):
+            return True
+    return False
+
+
+def write_scorecards(db, scorecards, commit=True):
+    """Store a batch of scorecards and publish a new scoreboard version in the same transaction"""
+    db.add_all(scorecards)
+    bump_version(db, SCOREBOARD_VERSION)
+    if commit:
+        db.commit()
+
+
+def compute_scorecards(db, now=None):
+    """Score every team from its latest upload; returns unsaved Scorecard rows"""
+    from models import Team, Challenge, ChallengeStatus, Modifier, Scorecard
+
+    now = now or datetime.now()
+    teams = db.query(Team).all()
+    uploads = latest_uploads(db)
+
+    modifiers = defaultdict(list)
+    for modifier in db.query(Modifier).all():
+        modifiers[modifier.receiver_id].append(modifier)
+
+    # Maintained per team by triggers on offsets, so this never scans the offsets table
+    offsets = received_offsets(db)
+    completed = dict(
+        db.query(Challenge.team_id, func.count(Challenge.id))
+        .filter(Challenge.status == ChallengeStatus.COMPLETED)
+        .group_by(Challenge.team_id).all()
+    )
+
+    team_ids = [team.id for team in teams]
+    # Read the sharded track data the parse stage will need from all shards at once
+    track_shards.prefetch_uploads(db, [upload for upload in uploads.values() if not track_cached(upload)])
+    names = {team.id: team.name for team in teams}
+    outputs = SCORING_PIPELINE.run(*scoring_graph(team_ids, uploads, modifiers, offsets, completed, names))
+
+    cleaned_tracks = {}
+    for team_id, upload in uploads.items():
+        cleaned_tracks[team_id] = outputs[f"cleaned:{team_id}"]
+        if not upload.gpx_cleanups:
+            db.add(cleaned_tracks[team_id].to_cleanup(upload.id))
+
+    # Flag completions the team's track doesn't back up so referees can review them
+    verify_completions(db, cleaned_tracks)
+
+    scorecards = []
+    for team in teams:
+        traveled, earned = outputs["totals"][team.id]
+        scorecards.append(Scorecard(
+            team_id=team.id,
+            challenges_completed=completed.get(team.id, 0),
+            distance_traveled=traveled,
+            distance_earned=earned,
+            rank=outputs["ranking"][team.id],
+            created_at=now
+        ))
+    return scorecards
+
+
+def pipeline_summary():
+    """One line of scoring pipeline cache stats for logs"""
+    report = SCORING_PIPELINE.report()
+    runs = sum(row["runs"] for row in report)
+    hits = sum(row["hits"] for row in report)
+    return f"{runs} stage runs, {hits} cache hits ({hits / (runs + hits) if runs + hits else 0:.0%})"
+
+
+def run_scoring_tick(db_session=None, commit=True):
+    """Score every team and publish the results if any team's totals changed.
+    With commit=False the caller's transaction is left open for it to commit."""
+    db = db_session or SessionLocal()
+    try:
+        scorecards = compute_scorecards(db)
+        if scorecards_changed(db, scorecards):
+            write_scorecards(db, scorecards, commit=False)
+        if commit:
+            # Also keeps any cleanups and verification flags from an idle tick
+            db.commit()
+        return scorecards
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        if db_session is None:
+            db.close()
+
+
+if __name__ == "__main__":
+    scorecards = run_scoring_tick()
+    print(f"Scored {len(scorecards)} teams")
+    for row in SCORING_PIPELINE.report():
+        print(f"  {row['stage']:<10} {row['runs']:>4} runs {row['hits']:>4} hits ({row['hit_rate']:.0%}) {row['ms']:8.1f} ms")
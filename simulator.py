@@ -0,0 +1,191 @@
+"""
+What-if scoring for referee adjudication.
+
+ScoringState loads everything scoring needs into memory once. That covers each team's counted
+track segments, its modifiers, its received offset total, and the modifiers and offsets attached
+to challenges. A Simulation layers hypothetical changes on top of that state and recomputes only
+the teams they touch. An offset only shifts a total; a modifier change re-weights that one team's
+segments. Previewing a ruling therefore takes milliseconds and never writes to the database.
+"""
+
+from collections import defaultdict, namedtuple
+
+import numpy as np
+
+from gpx import clean_track, upload_track
+from offset_totals import received_offsets
+from scoring import latest_uploads, modifier_multipliers, rank_standings
+
+# The modifier fields scoring reads, detached from the session
+SimModifier = namedtuple("SimModifier", ["id", "multiplier", "start", "end", "created_at", "challenge_id"])
+
+
+class TeamState:
+    """A team's scoring inputs: counted segment distances and start times, modifiers and offsets"""
+
+    def __init__(self, team_id, name, distances, times, modifiers, offsets, challenges_completed):
+        self.team_id = team_id
+        self.name = name
+        self.distances = distances
+        self.times = times
+        self.modifiers = modifiers
+        self.offsets = offsets
+        self.challenges_completed = challenges_completed
+        self.track_earned = self.earned_with(modifiers)
+
+    def earned_with(self, modifiers):
+        """Track distance earned under a set of modifiers, before offsets"""
+        if len(self.distances) == 0:
+            return 0.0
+        return float((self.distances * modifier_multipliers(self.times, modifiers)).sum())
+
+    @property
+    def distance_earned(self):
+        return self.track_earned + self.offsets
+
+
+class ScoringState:
+    """In-memory snapshot of the scoring inputs for every team"""
+
+    def __init__(self, teams, challenge_offsets, challenge_teams):
+        self.teams = teams  # team id -> TeamState
+        self.challenge_offsets = challenge_offsets  # challenge id -> [(receiver id, distance)]
+        self.challenge_teams = challenge_teams  # completed challenge id -> team id
+
+    @classmethod
+    def load(cls, db):
+        from models import Team, Challenge, ChallengeStatus, Modifier, Offset
+
+        uploads = latest_uploads(db)
+        offsets = received_offsets(db)
+
+        modifiers = defaultdict(list)
+        for m in db.query(Modifier).all():
+            modifiers[m.receiver_id].append(SimModifier(m.id, m.multiplier, m.start, m.end, m.created_at, m.challenge_id))
+
+        # Only offsets tied to a challenge can be nullified individually; the rest stay in the totals
+        challenge_offsets = defaultdict(list)
+        for challenge_id, receiver_id, distance in db.query(
+            Offset.challenge_id, Offset.receiver_id, Offset.distance
+        ).filter(Offset.challenge_id.isnot(None)):
+            challenge_offsets[challenge_id].append((receiver_id, distance))
+
+        challenge_teams = dict(
+            db.query(Challenge.id, Challenge.team_id).filter(Challenge.status == ChallengeStatus.COMPLETED).all()
+        )
+        completed = defaultdict(int)
+        for team_id in challenge_teams.values():
+            completed[team_id] += 1
+
+        teams = {}
+        for team_id, name in db.query(Team.id, Team.name).all():
+            distances, times = np.zeros(0), np.zeros(0)
+            if team_id in uploads:
+                cleaned = clean_track(upload_track(uploads[team_id]))
+                if len(cleaned.distances):
+                    distances = np.where(cleaned.keep, cleaned.distances, 0.0)
+                    times = cleaned.track.time[:-1]
+            teams[team_id] = TeamState(
+                team_id, name, distances, times, modifiers[team_id], offsets.get(team_id) or 0.0, completed[team_id]
+            )
+        return cls(teams, dict(challenge_offsets), challenge_teams)
+
+    def standings(self):
+        return Simulation(self).standings()
+
+
+class Simulation:
+    """Hypothetical changes applied over a ScoringState; the state itself is never modified"""
+
+    def __init__(self, state):
+        self.state = state
+        self.modifiers = {}  # team id -> changed modifier list
+        self.offsets = defaultdict(float)  # team id -> offset distance added or removed
+        self.completed = defaultdict(int)  # team id -> change in completed challenges
+        self.nullified = set()
+        self._earned = {}  # team id -> recomputed track earnings for teams with changed modifiers
+
+    def _team(self, team_id):
+        if team_id not in self.state.teams:
+            raise ValueError(f"Unknown team: {team_id}")
+        return self.state.teams[team_id]
+
+    def _modifiers(self, team_id):
+        return self.modifiers.get(team_id, self._team(team_id).modifiers)
+
+    def _set_modifiers(self, team_id, modifiers):
+        self.modifiers[team_id] = modifiers
+        self._earned.pop(team_id, None)
+
+    def add_offset(self, receiver_id, distance: float):
+        """Dock (negative) or award (positive) distance to a team"""
+        self._team(receiver_id)
+        self.offsets[receiver_id] += distance
+        return self
+
+    def add_modifier(self, receiver_id, multiplier: float, start=None, end=None):
+        """Apply a multiplier to a team's distance between start and end (open-ended if None)"""
+        modifier = SimModifier(None, multiplier, start, end, None, None)
+        self._set_modifiers(receiver_id, list(self._modifiers(receiver_id)) + [modifier])
+        return self
+
+    def remove_modifier(self, receiver_id, modifier_id):
+        """Drop an existing modifier from a team"""
+        remaining = [m for m in self._modifiers(receiver_id) if m.id != modifier_id]
+        self._set_modifiers(receiver_id, remaining)
+        return self
+
+    def nullify_challenge(self, challenge_id):
+        """Void a completed challenge: it no longer counts and its offsets and modifiers are dropped"""
+        if challenge_id in self.nullified:
+            return self
+        self.nullified.add(challenge_id)
+        team_id = self.state.challenge_teams.get(challenge_id)
+        if team_id is not None:
+            self.completed[team_id] -= 1
+        for receiver_id, distance in self.state.challenge_offsets.get(challenge_id, []):
+            self.offsets[receiver_id] -= distance
+        for team_id in self.state.teams:
+            modifiers = self._modifiers(team_id)
+            if any(m.challenge_id == challenge_id for m in modifiers):
+                self._set_modifiers(team_id, [m for m in modifiers if m.challenge_id != challenge_id])
+        return self
+
+    def distance_earned(self, team_id):
+        team = self._team(team_id)
+        if team_id in self.modifiers:
+            if team_id not in self._earned:
+                self._earned[team_id] = team.earned_with(self.modifiers[team_id])
+            track_earned = self._earned[team_id]
+        else:
+            track_earned = team.track_earned
+        return track_earned + team.offsets + self.offsets.get(team_id, 0.0)
+
+    def standings(self):
+        """Simulated ranking with each team's change from the current standings, in scoreboard order"""
+        teams = self.state.teams
+        current = {team_id: team.distance_earned for team_id, team in teams.items()}
+        simulated = {team_id: self.distance_earned(team_id) for team_id in teams}
+        completed = {
+            team_id: team.challenges_completed + self.completed.get(team_id, 0) for team_id, team in teams.items()
+        }
+        current_rank = rank_standings({
+            team_id: (team.challenges_completed, current[team_id], team.name) for team_id, team in teams.items()
+        })
+        simulated_rank = rank_standings({
+            team_id: (completed[team_id], simulated[team_id], team.name) for team_id, team in teams.items()
+        })
+
+        standings = [
+            {
+                "rank": simulated_rank[team_id],
+                "team_id": team_id,
+                "team_name": teams[team_id].name,
+                "distance_earned": simulated[team_id],
+                "change": simulated[team_id] - current[team_id],
+                "previous_rank": current_rank[team_id],
+                "challenges_completed": completed[team_id],
+            }
+            for team_id in teams
+        ]
+        return sorted(standings, key=lambda row: row["rank"])
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Postgame superlatives for Floatpack Rideathon.
+
+Computes every bonus listed in the rules from stored data: most challenges complete, most
+un-adjusted miles, longest single stint by distance and most handicaps accrued. Every superlative
+is a grouped query over all teams: the track ones read the cleanup stored with each team's latest
+upload, and only uploads without one have their track cleaned here.
+"""
+
+from sqlalchemy import func
+
+import track_shards
+from database import SessionLocal
+from gpx import clean_track, stint_distances, upload_track
+
+SUPERLATIVES = [
+    ("most_challenges_complete", "Most Challenges Complete", "challenges"),
+    ("most_unadjusted_miles", "Most Un-Adjusted Miles", "mi"),
+    ("longest_stint", "Longest Single Stint by Distance", "mi"),
+    ("most_handicaps_accrued", "Most Handicaps Accrued", "handicaps"),
+]
+
+
+def team_track_stats(upload):
+    """Un-adjusted miles and longest stint for one upload"""
+    cleaned = clean_track(upload_track(upload))
+    stints = stint_distances(cleaned)
+    return cleaned.scored_distance, float(stints.max()) if len(stints) else 0.0
+
+
+def compute_superlatives(db):
+    """Return one entry per superlative with the standings and the (possibly tied) winners"""
+    from models import Team, Challenge, ChallengeStatus, Modifier, GpxUpload, GpxCleanup
+
+    teams = db.query(Team).all()
+
+    completed = dict(
+        db.query(Challenge.team_id, func.count(Challenge.id))
+        .filter(Challenge.status == ChallengeStatus.COMPLETED)
+        .group_by(Challenge.team_id).all()
+    )
+    # A handicap is any modifier one team puts on another
+    handicaps = dict(
+        db.query(Modifier.receiver_id, func.count(Modifier.id))
+        .filter(Modifier.creator_id != Modifier.receiver_id)
+        .group_by(Modifier.receiver_id).all()
+    )
+    # Miles and longest stint from the latest cleanup of each team's latest upload
+    latest_ids = db.query(func.max(GpxUpload.id)).group_by(GpxUpload.team_id)
+    latest_cleanup_ids = (
+        db.query(func.max(GpxCleanup.id)).filter(GpxCleanup.gpx_upload_id.in_(latest_ids))
+        .group_by(GpxCleanup.gpx_upload_id)
+    )
+    track_stats = {}
+    uncleaned = set()
+    for team_id, upload_id, miles, longest_stint in (
+        db.query(GpxUpload.team_id, GpxUpload.id, GpxCleanup.scored_distance, GpxCleanup.longest_stint)
+        .outerjoin(GpxCleanup, (GpxCleanup.gpx_upload_id == GpxUpload.id) & GpxCleanup.id.in_(latest_cleanup_ids))
+        .filter(GpxUpload.id.in_(latest_ids)).all()
+    ):
+        if longest_stint is None:
+            uncleaned.add(upload_id)
+        else:
+            track_stats[team_id] = (miles, longest_stint)
+    # Uploads the ingest path hasn't summarized yet (or summarized before stints were stored)
+    if uncleaned:
+        uploads = db.query(GpxUpload).filter(GpxUpload.id.in_(uncleaned)).all()
+        track_shards.prefetch_uploads(db, uploads)
+        for upload in uploads:
+            track_stats[upload.team_id] = team_track_stats(upload)
+
+    values = {key: {} for key, _, _ in SUPERLATIVES}
+    for team in teams:
+        miles, longest_stint = track_stats.get(team.id, (0.0, 0.0))
+        values["most_challenges_complete"][team.id] = completed.get(team.id, 0)
+        values["most_unadjusted_miles"][team.id] = miles
+        values["longest_stint"][team.id] = longest_stint
+        values["most_handicaps_accrued"][team.id] = handicaps.get(team.id, 0)
+
+    names = {team.id: team.name for team in teams}
+    results = []
+    for key, title, unit in SUPERLATIVES:
+        standings = sorted(
+            ((names[team_id], value) for team_id, value in values[key].items()),
+            key=lambda item: item[1], reverse=True
+        )
+        best = standings[0][1] if standings else 0
+        results.append({
+            "key": key,
+            "title": title,
+            "unit": unit,
+            "value": best,
+            # Nobody wins a superlative with a zero score
+            "winners": [name for name, value in standings if value == best and value > 0],
+            "standings": standings,
+        })
+    return results
+
+
+if __name__ == "__main__":
+    db = SessionLocal()
+    try:
+        for superlative in compute_superlatives(db):
+            winners = ", ".join(superlative["winners"]) or "No winner"
+            value = superlative["value"]
+            value = f"{value:.1f}" if isinstance(value, float) else value
+            print(f"{superlative['title']}: {winners} ({value} {superlative['unit']})")
+    finally:
+        db.close()
@@ -0,0 +1,247 @@
+"""
+In-process cache of each team's live status: the active challenge, the effective distance
+multiplier and when that multiplier next changes.
+
+The cache is kept current by challenge status changes and by modifier inserts/updates, applied once
+their transaction commits, so pages can read a team's status without scanning the modifiers and
+challenges tables. A change queued inside a SAVEPOINT is dropped only if that savepoint (or a
+transaction around it) rolls back.
+
+Every such change also bumps the TEAM_STATUS_VERSION row in the same transaction. Readers compare
+it with the version their cache was built at, at most every STATUS_CHECK_SECONDS, and drop the
+cache when another process (a worker, another server) has written since.
+"""
+
+import threading
+import time
+from datetime import datetime
+
+from sqlalchemy import event, inspect, or_
+from sqlalchemy.orm import Session, object_session
+
+from datamodels.challenge import Challenge, ChallengeStatus
+from datamodels.modifier import Modifier
+
+TEAM_STATUS_VERSION = "team_status"
+STATUS_CHECK_SECONDS = 2
+
+_PENDING_KEY = "team_status_pending_modifiers"
+_PENDING_CHALLENGES_KEY = "team_status_pending_challenges"
+_BUMP_KEY = "team_status_bump"
+
+
+class TeamStatus:
+    """Current state of a single team"""
+
+    def __init__(self, team_id: int, active_challenge_id: int = None, active_challenge_name: str = None):
+        self.team_id = team_id
+        self.active_challenge_id = active_challenge_id
+        self.active_challenge_name = active_challenge_name
+        self.modifiers = {}  # modifier id -> (multiplier, start, end)
+        self.multiplier = 1.0
+        self.expires_at = None
+
+    def set_modifier(self, modifier_id: int, multiplier: float, start: datetime, end: datetime, now: datetime = None):
+        self.modifiers[modifier_id] = (multiplier, start, end)
+        self.refresh(now)
+
+    def refresh(self, now: datetime = None):
+        """Recompute the effective multiplier, dropping modifiers that have ended"""
+        now = now or datetime.now()
+        multiplier = 1.0
+        expires_at = None
+        for modifier_id, (value, start, end) in list(self.modifiers.items()):
+            if end is not None and end <= now:
+                del self.modifiers[modifier_id]
+                continue
+            if start is not None and start > now:
+                # Not active yet, but the multiplier changes when it kicks in
+                expires_at = start if expires_at is None else min(expires_at, start)
+                continue
+            multiplier *= value
+            if end is not None:
+                expires_at = end if expires_at is None else min(expires_at, end)
+        self.multiplier = multiplier
+        self.expires_at = expires_at
+
+    def is_stale(self, now: datetime = None) -> bool:
+        return self.expires_at is not None and self.expires_at <= (now or datetime.now())
+
+
+_statuses = {}
+_checked = None  # (TEAM_STATUS_VERSION the cache is valid for, monotonic time checked)
+_lock = threading.Lock()
+
+
+def _check_version(db_session=None, max_age: float = STATUS_CHECK_SECONDS):
+    """Drop every cached status if the version row moved since the cache was last checked"""
+    global _checked
+    with _lock:
+        checked = _checked
+    if checked is not None and time.monotonic() - checked[1] < max_age:
+        return
+
+    from database import get_version
+
+    version = get_version(TEAM_STATUS_VERSION, db_session)
+    with _lock:
+        if _checked is None or _checked[0] != version:
+            _statuses.clear()
+        _checked = (version, time.monotonic())
+
+
+def get_team_status(team_id: int, db_session=None, max_age: float = STATUS_CHECK_SECONDS) -> TeamStatus:
+    """Return the cached status for a team, loading it from the database on first use"""
+    _check_version(db_session, max_age)
+    with _lock:
+        status = _statuses.get(team_id)
+        if status is not None:
+            if status.is_stale():
+                status.refresh()
+            return status
+
+    status = load_team_status(team_id, db_session)
+    with _lock:
+        # Another thread may have loaded it meanwhile; keep the first one
+        return _statuses.setdefault(team_id, status)
+
+
+def load_team_status(team_id: int, db_session=None) -> TeamStatus:
+    """Build a team's status from the database"""
+    from database import SessionLocal
+
+    db = db_session or SessionLocal()
+    try:
+        now = datetime.now()
+        active = db.query(Challenge).filter(
+            Challenge.team_id == team_id,
+            Challenge.status == ChallengeStatus.ACTIVE
+        ).order_by(Challenge.start.desc()).first()
+
+        status = TeamStatus(
+            team_id,
+            active_challenge_id=active.id if active else None,
+            active_challenge_name=active.name if active else None
+        )
+
+        modifiers = db.query(Modifier).filter(
+            Modifier.receiver_id == team_id,
+            or_(Modifier.end.is_(None), Modifier.end > now)
+        ).all()
+        for modifier in modifiers:
+            status.modifiers[modifier.id] = (modifier.multiplier, modifier.start or modifier.created_at, modifier.end)
+        status.refresh(now)
+        return status
+    finally:
+        if db_session is None:
+            db.close()
+
+
+def record_challenge_started(team_id: int, challenge_id: int, challenge_name: str):
+    """Mark a challenge as the team's active challenge"""
+    with _lock:
+        status = _statuses.get(team_id)
+        if status is None:
+            # Nothing cached yet; the first read loads the full state from the database
+            return
+        status.active_challenge_id = challenge_id
+        status.active_challenge_name = challenge_name
+
+
+def record_challenge_ended(team_id: int, challenge_id: int):
+    """Clear the team's active challenge after it is completed or forfeited"""
+    with _lock:
+        status = _statuses.get(team_id)
+        if status is None:
+            return
+        if status.active_challenge_id in (None, challenge_id):
+            status.active_challenge_id = None
+            status.active_challenge_name = None
+
+
+def invalidate(team_id: int = None):
+    """Drop cached status for one team, or for every team"""
+    global _checked
+    with _lock:
+        if team_id is None:
+            _statuses.clear()
+            _checked = None
+        else:
+            _statuses.pop(team_id, None)
+
+
+def _current_transaction(session):
+    return session.get_nested_transaction() or session.get_transaction()
+
+
+def _queue(session, key, change):
+    """Hold a change until the session commits, remembering the (sub)transaction it was made in"""
+    session.info.setdefault(key, []).append((_current_transaction(session), change))
+    session.info[_BUMP_KEY] = True
+
+
+def _within(transaction, ended):
+    while transaction is not None:
+        if transaction is ended:
+            return True
+        transaction = transaction.parent
+    return False
+
+
+# Modifier and challenge writes are applied once their transaction commits, so a rollback never leaks into the cache
+@event.listens_for(Modifier, "after_insert")
+@event.listens_for(Modifier, "after_update")
+def _queue_modifier(mapper, connection, target):
+    session = object_session(target)
+    if session is not None:
+        _queue(session, _PENDING_KEY, (
+            target.id, target.receiver_id, target.multiplier, target.start or target.created_at, target.end
+        ))
+
+
+@event.listens_for(Session, "after_flush")
+def _bump_version(session, flush_context):
+    # Once per flush that queued a change, so other processes see it when this transaction commits
+    if session.info.pop(_BUMP_KEY, False):
+        from database import bump_version
+        bump_version(session, TEAM_STATUS_VERSION)
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_pending_modifiers(session):
+    pending = session.info.pop(_PENDING_KEY, None)
+    if not pending:
+        return
+    now = datetime.now()
+    with _lock:
+        for _, (modifier_id, receiver_id, multiplier, start, end) in pending:
+            status = _statuses.get(receiver_id)
+            if status is not None:
+                status.set_modifier(modifier_id, multiplier, start, end, now)
+
+
+@event.listens_for(Challenge, "after_insert")
+@event.listens_for(Challenge, "after_update")
+def _queue_challenge(mapper, connection, target):
+    session = object_session(target)
+    if session is not None and target.team_id is not None and inspect(target).attrs.status.history.has_changes():
+        _queue(session, _PENDING_CHALLENGES_KEY, (target.id, target.team_id, target.name, target.status))
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_pending_challenges(session):
+    for _, (challenge_id, team_id, name, status) in session.info.pop(_PENDING_CHALLENGES_KEY, None) or []:
+        if status == ChallengeStatus.ACTIVE:
+            record_challenge_started(team_id, challenge_id, name)
+        elif status in (ChallengeStatus.COMPLETED, ChallengeStatus.FORFEITED):
+            record_challenge_ended(team_id, challenge_id)
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _discard_rolled_back(session, previous_transaction):
+    """Drop the changes made inside the transaction or savepoint that rolled back, keeping the rest"""
+    session.info.pop(_BUMP_KEY, None)
+    for key in (_PENDING_KEY, _PENDING_CHALLENGES_KEY):
+        pending = session.info.get(key)
+        if pending:
+            session.info[key] = [entry for entry in pending if not _within(entry[0], previous_transaction)]
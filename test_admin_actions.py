@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+Unit tests for single-flight admin actions
+"""
+
+import unittest
+import threading
+import time
+
+from admin_actions import SingleFlight
+
+
+class TestSingleFlight(unittest.TestCase):
+    """Test coalescing, rate limiting and the concurrency cap"""
+
+    def setUp(self):
+        self.flight = SingleFlight({"slow": 60, "other": 0})
+        self.calls = 0
+        self.release = threading.Event()
+
+    def slow(self, value="done"):
+        self.calls += 1
+        self.release.wait(5)
+        return True, value
+
+    def start(self, results, *args, key=None):
+        thread = threading.Thread(target=lambda: results.append(self.flight.run("slow", self.slow, *args, key=key)))
+        thread.start()
+        return thread
+
+    def wait_until(self, condition):
+        deadline = time.monotonic() + 5
+        while not condition() and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertTrue(condition())
+
+    def test_identical_requests_share_one_run(self):
+        """Requests arriving while the action runs wait for it and get its result"""
+        results = []
+        threads = [self.start(results)]
+        self.wait_until(lambda: self.flight.state("slow").running)
+        threads += [self.start(results) for _ in range(3)]
+        self.wait_until(lambda: self.flight.state("slow").waiters == 3)
+        self.release.set()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(results, [(True, "done")] * 4)
+        self.assertEqual(self.flight.state("slow").result, (True, "done"))
+        self.assertFalse(self.flight.running())
+
+    def test_rate_limit(self):
+        """A finished action can't run again until its interval has passed"""
+        self.release.set()
+        self.assertEqual(self.flight.run("slow", self.slow), (True, "done"))
+        success, message = self.flight.run("slow", self.slow)
+        self.assertFalse(success)
+        self.assertIn("just ran", message)
+        self.assertEqual(self.calls, 1)
+
+        # An action without an interval runs every time
+        self.assertEqual(self.flight.run("other", lambda: (True, "again")), (True, "again"))
+        self.assertEqual(self.flight.run("other", lambda: (True, "again")), (True, "again"))
+
+    def test_busy_actions_reject_other_work(self):
+        """Different input for a running action, or another action, is turned away"""
+        results = []
+        thread = self.start(results, "first", key="a")
+        self.wait_until(lambda: self.flight.state("slow").running)
+        try:
+            self.assertFalse(self.flight.run("slow", self.slow, "second", key="b")[0])
+            success, message = self.flight.run("other", lambda: (True, "ran"))
+            self.assertFalse(success)
+            self.assertIn("Busy with slow", message)
+        finally:
+            self.release.set()
+            thread.join()
+        self.assertEqual(results, [(True, "first")])
+        self.assertEqual(self.calls, 1)
+
+    def test_errors_are_results(self):
+        """An exception is reported as a failed result and doesn't leave the action running"""
+        def broken():
+            raise RuntimeError("disk full")
+
+        success, message = self.flight.run("other", broken)
+        self.assertFalse(success)
+        self.assertIn("disk full", message)
+        self.assertFalse(self.flight.state("other").running)
+
+    def test_interrupted_action_is_cleared(self):
+        """A BaseException in the action still ends the run and releases the requests that joined it"""
+        class Interrupted(BaseException):
+            pass
+
+        def interrupted():
+            self.release.wait(5)
+            raise Interrupted()
+
+        raised, results = [], []
+
+        def lead():
+            try:
+                self.flight.run("slow", interrupted)
+            except Interrupted:
+                raised.append(True)
+
+        leader = threading.Thread(target=lead)
+        leader.start()
+        self.wait_until(lambda: self.flight.state("slow").running)
+        waiter = threading.Thread(target=lambda: results.append(self.flight.run("slow", interrupted)))
+        waiter.start()
+        self.wait_until(lambda: self.flight.state("slow").waiters == 1)
+        self.release.set()
+        leader.join()
+        waiter.join()
+
+        self.assertEqual(raised, [True])
+        self.assertEqual(results, [(False, "slow was interrupted")])
+        self.assertFalse(self.flight.running())
+
+    def test_waiters_give_up(self):
+        """A request that joins a run waits a bounded time for it"""
+        self.flight.wait_seconds = 0.05
+        results = []
+        thread = self.start(results)
+        self.wait_until(lambda: self.flight.state("slow").running)
+        try:
+            success, message = self.flight.run("slow", self.slow)
+            self.assertFalse(success)
+            self.assertIn("still running", message)
+        finally:
+            self.release.set()
+            thread.join()
+        self.assertEqual(results, [(True, "done")])
+        self.assertEqual(self.calls, 1)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the asyncio data-access layer
+"""
+
+import unittest
+import json
+import os
+import tempfile
+from datetime import datetime, timezone
+
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import NullPool
+
+import async_database
+import database
+from database import Base, SessionLocal, get_version
+from models import Team, GpxUpload, GpxCleanup, Scorecard
+from scoring import SCOREBOARD_VERSION
+from testing import make_gpx, reset_caches, straight_ride
+
+
+class TestAsyncDatabase(unittest.IsolatedAsyncioTestCase):
+    """Test the async equivalents of the database operations"""
+
+    def setUp(self):
+        """Point the sync and async sessions at a fresh database file of this test's own"""
+        self.directory = tempfile.TemporaryDirectory()
+        path = os.path.join(self.directory.name, "async.db")
+        self.engine = create_engine(f"sqlite:///{path}")
+        Base.metadata.create_all(bind=self.engine)
+        # aiosqlite can't reach the shared in-memory test database, so these tests use a file
+        self.async_engine = create_async_engine(f"sqlite+aiosqlite:///{path}", poolclass=NullPool)
+
+        self._saved_engine = database._engine
+        self._saved_session_kw = dict(SessionLocal.kw)
+        self._saved_async_session_kw = dict(async_database.AsyncSessionLocal.kw)
+        database._engine = self.engine
+        SessionLocal.configure(bind=self.engine)
+        async_database.AsyncSessionLocal.configure(bind=self.async_engine)
+        reset_caches()
+
+    async def asyncTearDown(self):
+        await self.async_engine.dispose()
+
+    def tearDown(self):
+        async_database.AsyncSessionLocal.kw = self._saved_async_session_kw
+        SessionLocal.kw = self._saved_session_kw
+        database._engine = self._saved_engine
+        self.engine.dispose()
+        self.directory.cleanup()
+        reset_caches()
+
+    async def test_populate_and_status(self):
+        """Seeding creates one challenge row per team and shows up in the status counts"""
+        config = {
+            "teams": [
+                {"name": "Async Alpha", "members": "A, B", "color": "red", "secret_code": "AA1"},
+                {"name": "Async Beta", "members": "C, D", "color": "blue", "secret_code": "AB2"},
+            ],
+            "challenges": [
+                {"name": "Loop", "description": "Ride a loop", "pause_distance": True, "latitude": 1.0, "longitude": 2.0},
+            ],
+        }
+        success, message = await async_database.populate_from_yaml_data(config)
+        self.assertTrue(success, message)
+
+        status = await async_database.get_database_status()
+        self.assertEqual(status, {"teams": 2, "challenges": 2, "modifiers": 0, "offsets": 0})
+
+    async def test_populate_rejects_invalid_team(self):
+        """Incomplete team entries are reported without writing anything"""
+        success, message = await async_database.populate_from_yaml_data({"teams": [{"name": "Nameless"}], "challenges": []})
+        self.assertFalse(success)
+        self.assertIn("Invalid team data", message)
+        self.assertEqual((await async_database.get_database_status())["teams"], 0)
+
+    async def test_concurrent_ingest_and_scorecards(self):
+        """Concurrent uploads are all stored and scorecard writes publish a version"""
+        db = SessionLocal()
+        teams = [Team(name=f"Team {i}", members=json.dumps([]), color="green", secret_code=f"CODE{i}") for i in range(4)]
+        db.add_all(teams)
+        db.commit()
+        team_ids = [team.id for team in teams]
+        db.close()
+
+        start = datetime(2024, 6, 1, 18, 0, tzinfo=timezone.utc)
+        uploads = [(team_id, make_gpx(straight_ride(start, 61))) for team_id in team_ids]
+        uploads.append((team_ids[0], "not gpx"))
+        results = await async_database.ingest_gpx_uploads(uploads)
+
+        self.assertTrue(all(success for success, _ in results[:-1]))
+        self.assertFalse(results[-1][0])
+        self.assertIn("Invalid GPX data", results[-1][1])
+
+        await async_database.write_scorecards([Scorecard(team_id=team_id, distance_traveled=1.0) for team_id in team_ids])
+
+        db = SessionLocal()
+        try:
+            self.assertEqual(db.query(GpxUpload).count(), 4)
+            self.assertEqual(db.query(GpxCleanup).count(), 4)
+            self.assertEqual(db.query(Scorecard).count(), 4)
+            self.assertEqual(get_version(SCOREBOARD_VERSION, db), 1)
+        finally:
+            db.close()
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
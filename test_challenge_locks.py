@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the charge challenge lockout
+"""
+
+import unittest
+
+import challenge_locks
+from config import compile_config
+from database import SessionLocal, add_event_config
+from models import Challenge, ChallengeStatus, Modifier
+from testing import DatabaseTestCase
+
+CONFIG = {
+    "teams": [
+        {"name": name, "members": "A, B", "color": "red", "secret_code": f"{name}1"}
+        for name in ("Alpha", "Beta", "Gamma")
+    ],
+    "challenges": [
+        {"name": "Loop", "description": "Ride a loop", "pause_distance": True, "latitude": 1.0, "longitude": 2.0},
+        {"name": "Charge", "description": "First team only", "pause_distance": True,
+         "latitude": 1.0, "longitude": 2.0, "charge": True},
+    ],
+}
+
+
+class TestChallengeLocks(DatabaseTestCase):
+    """Test that a charge challenge can be completed by one team only"""
+
+    def setUp(self):
+        """Set up each test with three teams and a normal and a charge challenge"""
+        super().setUp()
+        self.teams, _ = add_event_config(self.db, compile_config(CONFIG))
+        self.db.commit()
+
+    def challenge(self, db, team, name="Charge"):
+        return db.query(Challenge).filter(Challenge.team_id == team.id, Challenge.name == name).one()
+
+    def test_completion_locks_other_teams(self):
+        """Completing a charge challenge locks every other team's row and ends their attempts"""
+        alpha, beta, gamma = self.teams
+        self.challenge(self.db, beta).start_challenge(beta.id, self.db)
+        self.challenge(self.db, alpha).start_challenge(alpha.id, self.db)
+        self.db.commit()
+
+        self.challenge(self.db, alpha).complete_challenge(self.db)
+        self.db.commit()
+
+        statuses = {c.team_id: c.status for c in self.db.query(Challenge).filter(Challenge.name == "Charge")}
+        self.assertEqual(statuses, {
+            alpha.id: ChallengeStatus.COMPLETED, beta.id: ChallengeStatus.LOCKED, gamma.id: ChallengeStatus.LOCKED
+        })
+        beta_attempt = self.db.query(Modifier).filter(Modifier.receiver_id == beta.id).one()
+        self.assertIsNotNone(beta_attempt.end)
+        self.assertTrue(challenge_locks.is_locked(self.challenge(self.db, alpha).template_index))
+
+        with self.assertRaises(ValueError):
+            self.challenge(self.db, gamma).start_challenge(gamma.id, self.db)
+        # Normal challenges are unaffected
+        self.assertFalse(challenge_locks.is_locked(self.challenge(self.db, alpha, "Loop").template_index))
+        self.challenge(self.db, gamma, "Loop").start_challenge(gamma.id, self.db)
+
+    def test_only_one_claim_wins(self):
+        """Two teams finishing at once: the second claim sees the first team's lock"""
+        alpha, beta, _ = self.teams
+        first = self.challenge(self.db, alpha)
+        self.assertFalse(challenge_locks.is_locked(first.template_index))
+        self.assertTrue(challenge_locks.claim_charge_challenge(self.db, first))
+        self.db.commit()
+
+        # The second claim re-reads the lock row rather than trusting a cached bitmap
+        other = SessionLocal()
+        try:
+            self.assertFalse(challenge_locks.claim_charge_challenge(other, self.challenge(other, beta)))
+            other.commit()
+        finally:
+            other.close()
+
+        version, bitmap = challenge_locks.read_locks(self.db)
+        self.assertEqual(version, 1)
+        self.assertEqual(bitmap, 1 << first.template_index)
+
+    def test_repopulating_keeps_locks_in_place(self):
+        """Challenges added by a later, reordered config never inherit an earlier challenge's lock"""
+        alpha = self.teams[0]
+        self.assertTrue(challenge_locks.claim_charge_challenge(self.db, self.challenge(self.db, alpha)))
+        self.db.commit()
+
+        reordered = {
+            "teams": [{"name": "Delta", "members": "A", "color": "red", "secret_code": "Delta1"}],
+            "challenges": list(reversed(CONFIG["challenges"])),
+        }
+        (delta,), _ = add_event_config(self.db, compile_config(reordered))
+        self.db.commit()
+        for name in ("Loop", "Charge"):
+            self.assertFalse(challenge_locks.is_locked(self.challenge(self.db, delta, name).template_index, self.db))
+        self.assertEqual(self.challenge(self.db, delta, "Charge").status, ChallengeStatus.AVAILABLE)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+Unit tests for config validation and the compiled config cache
+"""
+
+import unittest
+import os
+import subprocess
+import sys
+import tempfile
+from datetime import datetime
+
+from config import ConfigError, compile_config, parse_config_text, load_config, clear_config_cache
+from database import populate_from_yaml_data
+from models import Team
+from testing import DatabaseTestCase
+
+VALID_YAML = """
+teams:
+  - name: "Alpha"
+    members: "A, B"
+    color: "red"
+    secret_code: "alpha1"
+challenges:
+  - name: "Loop"
+    description: "Ride a loop"
+    pause_distance: true
+    latitude: 40.7
+    longitude: -74.0
+event:
+  start: "2024-06-01 10:00"
+  end: "2024-06-01 18:00"
+"""
+
+
+class TestConfig(unittest.TestCase):
+    """Test the config schema and cache"""
+
+    def setUp(self):
+        clear_config_cache()
+
+    def test_compile_valid_config(self):
+        """A valid file compiles into typed entries with parsed event times"""
+        config = parse_config_text(VALID_YAML)
+        self.assertEqual(config.teams[0].name, "Alpha")
+        self.assertEqual(config.challenges[0].latitude, 40.7)
+        self.assertEqual(config.event_start, datetime(2024, 6, 1, 10, 0))
+
+    def test_every_error_is_reported(self):
+        """All problems are collected instead of stopping at the first"""
+        with self.assertRaises(ConfigError) as raised:
+            compile_config({
+                "teams": [
+                    {"name": "Alpha", "members": "A", "color": "red", "secret_code": "same"},
+                    {"name": "Beta", "members": "B", "secret_code": "same"},
+                    {"name": "Alpha", "members": "C", "color": "blue", "secret_code": "other"},
+                ],
+                "challenges": [
+                    {"name": "Loop", "description": "Ride", "pause_distance": "yes", "latitude": 1, "longitude": 2},
+                    {"name": "Far", "description": "Ride", "pause_distance": True, "latitude": 100, "longitude": 2},
+                ],
+                "event": {"start": "2024-06-01 18:00", "end": "2024-06-01 10:00"},
+            })
+        errors = "\n".join(raised.exception.errors)
+        self.assertEqual(len(raised.exception.errors), 5, errors)
+        self.assertIn("teams[1]: missing 'color'", errors)
+        self.assertIn("Duplicate team name 'Alpha'", errors)
+        self.assertIn("'pause_distance' must be true or false", errors)
+        self.assertIn("out of range", errors)
+        self.assertIn("start must be before end", errors)
+
+    def test_invalid_yaml(self):
+        """Unparseable YAML is a config error"""
+        with self.assertRaises(ConfigError) as raised:
+            parse_config_text("teams: [unclosed")
+        self.assertIn("Invalid YAML format", str(raised.exception))
+
+    def test_cache(self):
+        """Unchanged files and repeated content reuse the compiled config; edits recompile"""
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "config.yaml")
+            with open(path, "w") as f:
+                f.write(VALID_YAML)
+            first = load_config(path)
+            self.assertIs(load_config(path), first)
+            self.assertIs(parse_config_text(VALID_YAML), first)
+
+            with open(path, "w") as f:
+                f.write(VALID_YAML.replace("Alpha", "Omega"))
+            os.utime(path, ns=(0, os.stat(path).st_mtime_ns + 1))
+            self.assertEqual(load_config(path).teams[0].name, "Omega")
+
+
+class TestPopulate(DatabaseTestCase):
+    """Test seeding the database from a config"""
+
+    def test_invalid_config_writes_nothing(self):
+        """A bad challenge entry no longer leaves the teams committed"""
+        config = {
+            "teams": [{"name": "Alpha", "members": "A", "color": "red", "secret_code": "alpha1"}],
+            "challenges": [{"name": "Loop"}],
+        }
+        success, message = populate_from_yaml_data(config)
+        self.assertFalse(success)
+        self.assertIn("Invalid challenge data", message)
+
+        self.assertEqual(self.db.query(Team).count(), 0)
+
+
+class TestInitDb(unittest.TestCase):
+    """Test seeding an empty database with init_db.py"""
+
+    def test_init_empty_database(self):
+        """init_db creates the schema and seeds it from config.yaml in a fresh interpreter"""
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "empty.db")
+            script = (
+                "import database\n"
+                f"database.DATABASE_URL = 'sqlite:///{path}'\n"
+                "import init_db\n"
+                "init_db.init_database()\n"
+                "from models import Team\n"
+                "db = database.SessionLocal()\n"
+                "assert db.query(Team).count() > 0\n"
+                "db.close()\n"
+            )
+            result = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True,
+                                    cwd=os.path.dirname(os.path.abspath(__file__)))
+            self.assertEqual(result.returncode, 0, result.stderr[-2000:])
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -6,44 +6,22 @@ Unit tests for database models and sample data population
 import unittest
 import json
 import os
+import subprocess
+import sys
+import tempfile
 from datetime import datetime
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy import create_engine, inspect
 
-from database import Base
-from datamodels.team import Team
-from datamodels.challenge import Challenge, ChallengeStatus
-from datamodels.modifier import Modifier
-from datamodels.offset import Offset
+import admin_metrics
+from database import bump_version, get_database_status
+from models import Team, Challenge, ChallengeStatus, Modifier, Offset
+from scoring import SCOREBOARD_VERSION
+from testing import DatabaseTestCase, make_offsets, make_teams, make_uploads
 
 
-class TestDatabaseModels(unittest.TestCase):
+class TestDatabaseModels(DatabaseTestCase):
     """Test database models and sample data creation"""
     
-    @classmethod
-    def setUpClass(cls):
-        """Set up test database"""
-        # Use file-based SQLite database for testing (so we can inspect the data)
-        cls.engine = create_engine('sqlite:///test.db', echo=False)
-        cls.SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=cls.engine)
-        
-        # Create all tables
-        Base.metadata.create_all(bind=cls.engine)
-    
-    def setUp(self):
-        """Set up each test with a fresh database session"""
-        # Clear all tables before each test to ensure test isolation
-        Base.metadata.drop_all(bind=self.engine)
-        Base.metadata.create_all(bind=self.engine)
-        
-        self.db = self.SessionLocal()
-    
-    def tearDown(self):
-        """Clean up after each test"""
-        self.db.rollback()
-        self.db.close()
-
-    
     def test_create_teams(self):
         """Test creating team records"""
         # Create sample teams
@@ -499,6 +477,101 @@ class TestDatabaseModels(unittest.TestCase):
         self.assertEqual(len(challenge2.offsets), 2)  # Original + forfeit penalty
 
 
+
+class TestAdminMetrics(DatabaseTestCase):
+    """Test the admin page's metrics query"""
+    
+    def test_metrics_in_one_query(self):
+        """Counts, last uploads and the last tick come back together; status reuses the counts"""
+        from sqlalchemy import event
+        
+        teams = make_teams(self.db, 3, "Metrics")
+        make_offsets(self.db, teams, 2)
+        uploads = make_uploads(self.db, teams[:2], datetime(2024, 6, 1, 10, 0), 10)
+        bump_version(self.db, SCOREBOARD_VERSION)
+        self.db.commit()
+        
+        statements = []
+        event.listen(self.connection, "before_cursor_execute", lambda *args: statements.append(args[2]))
+        metrics = admin_metrics.collect_metrics(self.db, now=0.0)
+        self.assertEqual(len([sql for sql in statements if sql.startswith("SELECT")]), 1)
+        
+        self.assertEqual(metrics.counts["teams"], 3)
+        self.assertEqual(metrics.counts["offsets"], 6)
+        self.assertEqual(metrics.counts["gpx_uploads"], 2)
+        self.assertEqual(metrics.counts["scorecards"], 0)
+        self.assertGreater(metrics.database_bytes, 0)
+        self.assertIsNotNone(metrics.last_scoring_tick)
+        self.assertEqual(
+            [(upload["team_name"], upload["uploaded_at"]) for upload in metrics.last_uploads],
+            [("Metrics 0", uploads[0].uploaded_at), ("Metrics 1", uploads[1].uploaded_at), ("Metrics 2", None)]
+        )
+        self.assertEqual(get_database_status(), {"teams": 3, "challenges": 0, "modifiers": 0, "offsets": 6})
+    
+    def test_growth_rates(self):
+        """Growth is per hour since the oldest sample in the window"""
+        teams = make_teams(self.db, 2, "Growth")
+        self.assertIsNone(admin_metrics.collect_metrics(self.db, now=0.0).growth_per_hour["offsets"])
+        
+        make_offsets(self.db, teams, 5)
+        self.db.commit()
+        metrics = admin_metrics.collect_metrics(self.db, now=360.0)
+        self.assertAlmostEqual(metrics.growth_per_hour["offsets"], 100.0)
+        self.assertAlmostEqual(metrics.growth_per_hour["teams"], 0.0)
+        
+        # Samples older than the window are ignored
+        later = admin_metrics.collect_metrics(self.db, now=360.0 + admin_metrics.GROWTH_WINDOW_SECONDS)
+        self.assertAlmostEqual(later.growth_per_hour["offsets"], 0.0)
+    
+    def test_metrics_are_cached(self):
+        """Reruns within the cache period reuse the same metrics until invalidated"""
+        first = admin_metrics.get_admin_metrics()
+        make_teams(self.db, 1, "Cached")
+        self.db.commit()
+        self.assertIs(admin_metrics.get_admin_metrics(), first)
+        admin_metrics.invalidate()
+        self.assertEqual(admin_metrics.get_admin_metrics().counts["teams"], first.counts["teams"] + 1)
+
+
+class TestLazyStartup(unittest.TestCase):
+    """Test that importing the database layer defers the expensive work"""
+    
+    def test_imports_are_lazy(self):
+        """Importing models loads no data models and importing database creates no engine"""
+        script = (
+            "import sys, database, models\n"
+            "assert database._engine is None\n"
+            "assert 'datamodels.team' not in sys.modules\n"
+            "models.Team\n"
+            "assert 'datamodels.gpx_upload' in sys.modules and 'team_status' in sys.modules\n"
+            "database.SessionLocal().close()\n"
+            "assert database.engine is database._engine is not None\n"
+        )
+        result = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)))
+        self.assertEqual(result.returncode, 0, result.stderr)
+    
+    def test_create_tables_in_fresh_interpreter(self):
+        """create_tables registers the lazily loaded models before creating the schema"""
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "fresh.db")
+            script = (
+                "import database\n"
+                f"database.DATABASE_URL = 'sqlite:///{path}'\n"
+                "database.create_tables()\n"
+            )
+            result = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True,
+                                    cwd=os.path.dirname(os.path.abspath(__file__)))
+            self.assertEqual(result.returncode, 0, result.stderr)
+            
+            engine = create_engine(f"sqlite:///{path}")
+            try:
+                tables = set(inspect(engine).get_table_names())
+            finally:
+                engine.dispose()
+            self.assertTrue({"teams", "challenges", "gpx_uploads", "scorecards", "jobs"} <= tables, tables)
+
+
 if __name__ == '__main__':
     # Run the tests
     unittest.main(verbosity=2)
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the bulk event export
+"""
+
+import unittest
+import csv
+import gzip
+import json
+import shutil
+import tempfile
+from datetime import datetime, timezone
+
+from export_data import export_event
+from testing import DatabaseTestCase, make_offsets, make_teams, make_uploads
+
+
+class TestExportData(DatabaseTestCase):
+    """Test streaming every table and the cleaned tracks to disk"""
+
+    def setUp(self):
+        """Populate a small event"""
+        super().setUp()
+        self.output_dir = tempfile.mkdtemp()
+
+        teams = make_teams(self.db, 3, "Export")
+        start = datetime(2024, 6, 1, 18, 0, tzinfo=timezone.utc)
+        # An older partial upload and the latest cumulative one
+        make_uploads(self.db, teams, start, 10)
+        make_uploads(self.db, teams, start, 25)
+        make_offsets(self.db, teams, 1, distance=-5)
+        self.db.commit()
+
+    def tearDown(self):
+        shutil.rmtree(self.output_dir)
+        super().tearDown()
+
+    def test_export_csv(self):
+        """Tables and latest tracks are written as gzipped CSV in small chunks"""
+        counts = export_event(self.output_dir, "csv", chunk_size=7)
+        self.assertEqual(counts["teams"], 3)
+        self.assertEqual(counts["offsets"], 3)
+        self.assertEqual(counts["gpx_uploads"], 6)
+        self.assertEqual(counts["track_points"], 3 * 25)
+
+        with gzip.open(f"{self.output_dir}/gpx_uploads.csv.gz", "rt") as f:
+            rows = list(csv.DictReader(f))
+        self.assertEqual(len(rows), 6)
+        self.assertNotIn("gpx_data", rows[0])
+
+        with gzip.open(f"{self.output_dir}/teams.csv.gz", "rt") as f:
+            self.assertNotIn("secret_code", next(csv.reader(f)))
+
+        with gzip.open(f"{self.output_dir}/track_points.csv.gz", "rt") as f:
+            points = list(csv.DictReader(f))
+        self.assertEqual(len(points), 75)
+        self.assertEqual(points[0]["counted"], "True")
+
+    def test_export_jsonl(self):
+        """JSONL rows carry column names and ISO timestamps"""
+        export_event(self.output_dir, "jsonl", chunk_size=4)
+        with gzip.open(f"{self.output_dir}/offsets.jsonl.gz", "rt") as f:
+            offsets = [json.loads(line) for line in f]
+        self.assertEqual(len(offsets), 3)
+        self.assertEqual(offsets[0]["distance"], -5)
+        datetime.fromisoformat(offsets[0]["created_at"])
+
+    def test_export_parquet(self):
+        """Parquet export writes typed columns when pyarrow is available"""
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            self.skipTest("pyarrow not installed")
+        export_event(self.output_dir, "parquet", chunk_size=10)
+        table = pq.read_table(f"{self.output_dir}/track_points.parquet")
+        self.assertEqual(table.num_rows, 75)
+        self.assertEqual(str(table.schema.field("counted").type), "bool")
+
+    def test_unknown_format(self):
+        """Unknown formats are rejected before anything is written"""
+        with self.assertRaises(ValueError):
+            export_event(self.output_dir, "xlsx")
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+"""
+Unit tests for GPX parsing and cleanup
+"""
+
+import unittest
+import os
+import tempfile
+import numpy as np
+from datetime import datetime, timedelta, timezone
+
+import track_shards
+from database import ingest_gpx_upload
+from gpx import parse_gpx, clean_track, clear_track_cache, dedupe_track, stint_distances, prefix_hashes, to_gpx, upload_track
+from models import GpxUpload, GpxCleanup
+from testing import DEGREES_PER_MILE, DatabaseTestCase, make_gpx, make_teams, straight_ride
+
+class TestGpx(unittest.TestCase):
+    """Test GPX parsing and the distance rules"""
+
+    def setUp(self):
+        self.start = datetime(2024, 6, 1, 18, 0, tzinfo=timezone.utc)
+
+    def test_parse_gpx(self):
+        """Every timestamped track point is parsed"""
+        track = parse_gpx(make_gpx(straight_ride(self.start, 5)))
+        self.assertEqual(len(track), 5)
+        self.assertAlmostEqual(track.lat[0], 37.77)
+        self.assertEqual(track.time[1] - track.time[0], 10)
+        self.assertEqual(track.time[0], self.start.timestamp())
+
+    def test_clean_track_keeps_normal_riding(self):
+        """An hour at 12 mph scores about 12 miles"""
+        cleaned = clean_track(parse_gpx(make_gpx(straight_ride(self.start, 361))))
+        self.assertAlmostEqual(cleaned.scored_distance, 12.0, delta=0.05)
+        self.assertEqual(cleaned.pruned_distance_gap, 0.0)
+        self.assertEqual(cleaned.pruned_distance_speed, 0.0)
+
+    def test_clean_track_prunes_gaps_and_speeding(self):
+        """Gaps over a minute and segments over 25 mph are not counted"""
+        points = straight_ride(self.start, 10)
+        last_lat = points[-1][0]
+        # Two minute gap
+        resumed = self.start + timedelta(seconds=90 + 120)
+        points += straight_ride(resumed, 10, lat=last_lat + 0.001)
+        # 60 mph burst
+        last_lat = points[-1][0]
+        points += straight_ride(points[-1][3] + timedelta(seconds=10), 5, mph=60, lat=last_lat + 60 * 10 / 3600 * DEGREES_PER_MILE)
+
+        cleaned = clean_track(parse_gpx(make_gpx(points)))
+        self.assertEqual(int(cleaned.gap.sum()), 1)
+        self.assertEqual(int(cleaned.too_fast.sum()), 5)
+        self.assertGreater(cleaned.pruned_distance_gap, 0)
+        self.assertGreater(cleaned.pruned_distance_speed, 0)
+        self.assertAlmostEqual(
+            cleaned.scored_distance + cleaned.pruned_distance_gap + cleaned.pruned_distance_speed,
+            cleaned.total_distance
+        )
+
+    def test_stints_split_on_charge_stops_and_gaps(self):
+        """A long stop or a GPX gap ends a stint; a short stop does not"""
+        first = straight_ride(self.start, 181)  # 30 minutes at 12 mph
+        lat = first[-1][0]
+        # Stopped for 5 minutes (short break), then another 15 minutes of riding
+        stop = self.start + timedelta(minutes=30)
+        points = first + [(lat, -122.42, 10.0, stop + timedelta(seconds=30 * i)) for i in range(1, 11)]
+        points += straight_ride(points[-1][3] + timedelta(seconds=10), 91, lat=lat)
+        lat = points[-1][0]
+        # Charge stop: 20 minutes without moving, then 10 minutes of riding
+        stop = points[-1][3]
+        points += [(lat, -122.42, 10.0, stop + timedelta(seconds=30 * i)) for i in range(1, 41)]
+        points += straight_ride(points[-1][3] + timedelta(seconds=10), 61, lat=lat)
+        lat = points[-1][0]
+        # Five minute GPX gap, then 5 more minutes
+        points += straight_ride(points[-1][3] + timedelta(minutes=5), 31, lat=lat)
+
+        stints = stint_distances(clean_track(parse_gpx(make_gpx(points))))
+        self.assertEqual(len(stints), 3)
+        self.assertAlmostEqual(stints[0], 9.0, delta=0.1)
+        self.assertAlmostEqual(stints[1], 2.0, delta=0.1)
+        self.assertAlmostEqual(stints[2], 1.0, delta=0.1)
+
+    def test_empty_track(self):
+        """A GPX file without track points cleans to zero distance"""
+        cleaned = clean_track(parse_gpx(make_gpx([])))
+        self.assertEqual(cleaned.scored_distance, 0.0)
+        self.assertEqual(cleaned.total_time, 0.0)
+
+    def test_elevation_change(self):
+        """Smoothing removes tracker noise; real climbs and descents are counted in feet"""
+        ride = straight_ride(self.start, 201)
+        # Climb 100 m then descend 50 m, with a few meters of noise
+        noise = np.random.default_rng(0).normal(0, 1.5, 201)
+        profile = [min(i, 100) - max(i - 150, 0) + noise[i] for i in range(201)]
+        points = [(lat, lon, ele, time) for (lat, lon, _, time), ele in zip(ride, profile)]
+        gain, loss = clean_track(parse_gpx(make_gpx(points))).elevation_change()
+        self.assertAlmostEqual(gain, 100 * 3.28084, delta=15)
+        self.assertAlmostEqual(loss, 50 * 3.28084, delta=15)
+
+    def test_best_windows(self):
+        """Most distance in an hour and fastest 10 miles, counting only scored segments"""
+        # 30 minutes at 12 mph, then 60 minutes at 20 mph
+        first = straight_ride(self.start, 181)
+        points = first + straight_ride(first[-1][3] + timedelta(seconds=10), 360, mph=20, lat=first[-1][0])
+        cleaned = clean_track(parse_gpx(make_gpx(points)))
+        self.assertAlmostEqual(cleaned.best_distance_in(3600), 20.0, delta=0.1)
+        self.assertAlmostEqual(cleaned.fastest_time_for(10.0), 1800, delta=15)
+        self.assertIsNone(cleaned.fastest_time_for(100.0))
+
+        cleanup = cleaned.to_cleanup(1)
+        self.assertAlmostEqual(cleanup.best_hour_distance, 20.0, delta=0.1)
+        self.assertEqual(cleanup.elevation_gain, 0.0)
+
+    def test_dedupe_track(self):
+        """Exact repeats of the previous point are dropped without changing the scored distance"""
+        ride = straight_ride(self.start, 10)
+        track = parse_gpx(make_gpx(ride[:5] + [ride[4], ride[4]] + ride[5:]))
+        deduped = dedupe_track(track)
+        self.assertEqual(len(track), 12)
+        self.assertEqual(len(deduped), 10)
+        self.assertAlmostEqual(clean_track(deduped).scored_distance, clean_track(track).scored_distance)
+
+    def test_prefix_hashes(self):
+        """A prefix of a track hashes the same as the track it was cut from, and a changed point doesn't"""
+        track = parse_gpx(make_gpx(straight_ride(self.start, 20)))
+        hashes = prefix_hashes(track)
+        self.assertEqual(list(prefix_hashes(track[:12])), list(hashes[:12]))
+
+        moved = parse_gpx(make_gpx(straight_ride(self.start, 20, lat=37.7701)))
+        self.assertNotEqual(prefix_hashes(moved)[11], hashes[11])
+
+    def test_to_gpx_round_trip(self):
+        """Serialized tracks parse back to the same points"""
+        track = parse_gpx(make_gpx(straight_ride(self.start, 5)))
+        again = parse_gpx(to_gpx(track))
+        self.assertEqual(list(again.lat), list(track.lat))
+        self.assertEqual(list(again.time), list(track.time))
+
+
+class TestGpxUploads(DatabaseTestCase):
+    """Test storing cumulative GPX resubmissions"""
+
+    def setUp(self):
+        """Set up each test with one team"""
+        super().setUp()
+        self.team, = make_teams(self.db, 1, "Uploaders")
+        self.db.commit()
+        self.start = datetime(2024, 6, 1, 18, 0, tzinfo=timezone.utc)
+
+    def test_resubmissions_store_only_new_points(self):
+        """Each hourly resubmission stores just the points after the previous upload"""
+        ride = straight_ride(self.start, 300)
+        for count in (100, 200, 300):
+            success, message = ingest_gpx_upload(self.team.id, make_gpx(ride[:count]), db_session=self.db)
+            self.assertTrue(success, message)
+
+        uploads = self.db.query(GpxUpload).order_by(GpxUpload.id).all()
+        self.assertEqual([upload.point_count for upload in uploads], [100, 200, 300])
+        self.assertEqual([upload.extends_previous for upload in uploads], [None, True, True])
+        self.assertEqual([len(parse_gpx(upload.gpx_data)) for upload in uploads], [100, 100, 100])
+        self.assertEqual(uploads[2].base_upload_id, uploads[1].id)
+
+        # The full track is rebuilt from the chain
+        full = upload_track(uploads[2])
+        self.assertEqual(list(full.time), list(parse_gpx(make_gpx(ride)).time))
+
+    def test_non_extension_is_flagged(self):
+        """A track that doesn't continue the previous upload is stored in full and flagged"""
+        ingest_gpx_upload(self.team.id, make_gpx(straight_ride(self.start, 100)), db_session=self.db)
+        other_device = straight_ride(self.start + timedelta(seconds=3), 150, lon=-122.5)
+        success, message = ingest_gpx_upload(self.team.id, make_gpx(other_device), db_session=self.db)
+        self.assertTrue(success)
+        self.assertIn("flagged", message)
+
+        upload = self.db.query(GpxUpload).order_by(GpxUpload.id.desc()).first()
+        self.assertFalse(upload.extends_previous)
+        self.assertIsNone(upload.base_upload_id)
+        self.assertEqual(len(upload_track(upload)), 150)
+
+
+class TestTrackShards(DatabaseTestCase):
+    """Test storing GPX text in per-team shard files"""
+
+    def setUp(self):
+        """Set up each test with sharding on and three teams"""
+        super().setUp()
+        self.shard_dir = tempfile.TemporaryDirectory()
+        self.previous_dir = track_shards.TRACK_SHARD_DIR
+        track_shards.TRACK_SHARD_DIR = self.shard_dir.name
+        self.teams = make_teams(self.db, 3, "Shard")
+        self.db.commit()
+        self.start = datetime(2024, 6, 1, 18, 0, tzinfo=timezone.utc)
+
+    def tearDown(self):
+        """Close and remove the shards"""
+        track_shards.clear_shards()
+        track_shards.TRACK_SHARD_DIR = self.previous_dir
+        self.shard_dir.cleanup()
+        super().tearDown()
+
+    def test_uploads_are_stored_in_team_shards(self):
+        """Uploads go to each team's shard; the main database only catalogs them"""
+        ride = straight_ride(self.start, 200)
+        for points in (ride[:100], ride):
+            for team in self.teams:
+                success, message = ingest_gpx_upload(team.id, make_gpx(points), db_session=self.db)
+                self.assertTrue(success, message)
+        self.assertEqual(len([name for name in os.listdir(self.shard_dir.name) if name.endswith(".db")]), 3)
+
+        uploads = self.db.query(GpxUpload).order_by(GpxUpload.id).all()
+        self.assertEqual(len(uploads), 6)
+        self.assertTrue(all(upload.gpx_data is None and upload.shard_segment_id for upload in uploads))
+        self.assertEqual(self.db.query(GpxCleanup).count(), 6)
+
+        # Rebuilt from the shards alone, following the resubmission chain
+        track_shards.clear_cache()
+        clear_track_cache()
+        latest = [upload for upload in uploads if upload.base_upload_id is not None]
+        track_shards.prefetch_uploads(self.db, latest)
+        for upload in latest:
+            full = upload_track(upload)
+            self.assertEqual(list(full.time), list(parse_gpx(make_gpx(ride)).time))
+            self.assertEqual(len(parse_gpx(track_shards.read_segment(upload.team_id, upload.shard_segment_id))), 100)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
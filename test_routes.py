@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Unit tests for simplified map routes
+"""
+
+import unittest
+import json
+from datetime import datetime, timezone
+
+import numpy as np
+
+from database import get_version, ingest_gpx_upload
+from models import Team, GpxRoute
+from routes import ROUTE_LEVELS, ROUTES_VERSION, build_missing_routes, simplify, get_team_routes, level_for_zoom
+from testing import DatabaseTestCase, make_gpx, straight_ride
+
+
+def zigzag_ride(start, count, seconds_apart=10):
+    """Points heading north while weaving about 50 m east and west every few points"""
+    points = straight_ride(start, count, seconds_apart)
+    return [(lat, lon + (0.0006 if (i // 5) % 2 else 0.0), ele, time) for i, (lat, lon, ele, time) in enumerate(points)]
+
+
+class TestRoutes(DatabaseTestCase):
+    """Test route simplification and the per-upload route cache"""
+
+    def setUp(self):
+        """Set up each test with a fresh database and one team"""
+        super().setUp()
+        self.team = Team(name="Mappers", members=json.dumps(["A"]), color="#FF6B6B", secret_code="MAP1")
+        self.db.add(self.team)
+        self.db.commit()
+        self.start = datetime(2024, 6, 1, 18, 0, tzinfo=timezone.utc)
+
+    def test_simplify_straight_line(self):
+        """A straight line simplifies to its endpoints"""
+        lat = np.linspace(37.0, 37.1, 500)
+        lon = np.full(500, -122.0)
+        self.assertEqual(list(simplify(lat, lon, 5.0)), [0, 499])
+
+    def test_simplify_levels_keep_more_detail_when_zoomed_in(self):
+        """Lower tolerances keep more of the zigzag"""
+        points = zigzag_ride(self.start, 200)
+        lat = np.array([p[0] for p in points])
+        lon = np.array([p[1] for p in points])
+        counts = [len(simplify(lat, lon, tolerance)) for _, tolerance in ROUTE_LEVELS]
+        self.assertEqual(counts, sorted(counts))
+        self.assertLess(counts[0], 10)
+        self.assertGreater(counts[-1], 50)
+
+    def test_level_for_zoom(self):
+        """Each map zoom is served the most detailed level it has reached"""
+        self.assertEqual(level_for_zoom(3), ROUTE_LEVELS[0])
+        self.assertEqual(level_for_zoom(13), ROUTE_LEVELS[1])
+        self.assertEqual(level_for_zoom(20), ROUTE_LEVELS[-1])
+
+    def test_cumulative_uploads_extend_cached_routes(self):
+        """A resubmitted track only simplifies its new points and matches a from-scratch simplification's ends"""
+        points = zigzag_ride(self.start, 300)
+        ingest_gpx_upload(self.team.id, make_gpx(points[:120]), db_session=self.db)
+        ingest_gpx_upload(self.team.id, make_gpx(points), db_session=self.db)
+
+        routes = self.db.query(GpxRoute).order_by(GpxRoute.gpx_upload_id, GpxRoute.min_zoom).all()
+        self.assertEqual(len(routes), 2 * len(ROUTE_LEVELS))
+        first, second = routes[:len(ROUTE_LEVELS)], routes[len(ROUTE_LEVELS):]
+        for before, after in zip(first, second):
+            before_path = json.loads(before.path)
+            after_path = json.loads(after.path)
+            # The earlier polyline is reused as-is
+            self.assertEqual(after_path[:len(before_path)], before_path)
+            self.assertEqual(after.source_points, 300)
+            self.assertAlmostEqual(after_path[-1][1], points[-1][0], places=5)
+
+        served = get_team_routes(self.db, 16)
+        self.assertEqual(get_version(ROUTES_VERSION, self.db), 2)
+        self.assertEqual(len(served), 1)
+        self.assertEqual(served[0]["path"], json.loads(second[-1].path))
+
+    def test_routes_are_simplified_before_the_first_write(self):
+        """Storing an upload simplifies its routes before taking the main database's write lock"""
+        from unittest import mock
+        from sqlalchemy import event
+        import routes
+
+        points = zigzag_ride(self.start, 300)
+        ingest_gpx_upload(self.team.id, make_gpx(points[:120]), db_session=self.db)
+        statements = []
+        event.listen(self.connection, "before_cursor_execute", lambda *args: statements.append(args[2]))
+
+        def recorded(*args):
+            statements.append("simplify")
+            return simplify(*args)
+
+        with mock.patch.object(routes, "simplify", side_effect=recorded):
+            success, message = ingest_gpx_upload(self.team.id, make_gpx(points), db_session=self.db)
+        self.assertTrue(success, message)
+        writes = [i for i, sql in enumerate(statements) if sql.startswith(("INSERT", "UPDATE"))]
+        simplified = [i for i, sql in enumerate(statements) if sql == "simplify"]
+        self.assertEqual(len(simplified), len(ROUTE_LEVELS))
+        self.assertLess(max(simplified), min(writes))
+        self.assertEqual(self.db.query(GpxRoute).count(), 2 * len(ROUTE_LEVELS))
+
+    def test_missing_routes_are_backfilled(self):
+        """The map never writes; uploads stored without routes get them from the cleanup backfill"""
+        from models import GpxUpload
+        self.db.add(GpxUpload(team_id=self.team.id, gpx_data=make_gpx(zigzag_ride(self.start, 50))))
+        self.db.commit()
+
+        self.assertEqual(get_team_routes(self.db, 0), [])
+        self.assertEqual(self.db.query(GpxRoute).count(), 0)
+
+        self.assertEqual(build_missing_routes(self.db), 1)
+        self.db.commit()
+        self.assertEqual(get_team_routes(self.db, 0)[0]["team_name"], "Mappers")
+        self.assertEqual(self.db.query(GpxRoute).count(), len(ROUTE_LEVELS))
+        self.assertEqual(build_missing_routes(self.db), 0)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
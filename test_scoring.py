@@ -0,0 +1,429 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the scoring job
+"""
+
+import unittest
+import json
+from datetime import datetime, timedelta
+
+from database import get_version, ingest_gpx_upload
+from models import Team, Challenge, ChallengeStatus, Modifier, Offset, TeamOffsetTotal, GpxUpload, GpxCleanup, Scorecard
+from scoring import SCOREBOARD_VERSION, SCORING_PIPELINE, run_scoring_tick, get_latest_scorecards
+from superlatives import compute_superlatives
+from simulator import ScoringState, Simulation
+from geofence import TrackIndex
+from offset_totals import get_offset_totals, check_offset_totals, rebuild_offset_totals
+from replay import ReplayParams, replay_event, diff_scorecards
+from penalties import LATE_PENALTY_MILES, run_penalty_tick, submission_deadlines
+from gpx import clean_track, parse_gpx, upload_track
+from testing import (
+    DatabaseTestCase, make_challenges, make_gpx, make_modifiers, make_offsets, make_teams, make_uploads, straight_ride
+)
+
+
+class TestScoring(DatabaseTestCase):
+    """Test scoring teams from their uploads, modifiers and offsets"""
+
+    def setUp(self):
+        """Set up each test with a fresh database and two teams"""
+        super().setUp()
+
+        self.team = Team(name="Riders", members=json.dumps(["A", "B"]), color="red", secret_code="RIDE1")
+        self.rival = Team(name="Rivals", members=json.dumps(["C", "D"]), color="blue", secret_code="RIVAL1")
+        self.db.add_all([self.team, self.rival])
+        self.db.commit()
+
+        # One hour at 12 mph, starting on the hour
+        self.start = datetime.now().replace(minute=0, second=0, microsecond=0) - timedelta(hours=2)
+        self.db.add(GpxUpload(team_id=self.team.id, gpx_data=make_gpx(straight_ride(self.start, 361))))
+        self.db.commit()
+
+    def test_scoring_tick_writes_scorecards(self):
+        """Every team gets a scorecard and the upload gets a cleanup"""
+        run_scoring_tick(self.db)
+
+        standings = {team.name: scorecard for team, scorecard in get_latest_scorecards(self.db)}
+        self.assertAlmostEqual(standings["Riders"].distance_traveled, 12.0, delta=0.05)
+        self.assertAlmostEqual(standings["Riders"].distance_earned, 12.0, delta=0.05)
+        self.assertEqual(standings["Rivals"].distance_traveled, 0.0)
+        self.assertEqual(self.db.query(GpxCleanup).count(), 1)
+
+    def test_modifiers_offsets_and_challenges(self):
+        """Modifiers scale distance while active, offsets are added and completed challenges counted"""
+        self.db.add(Modifier(
+            multiplier=2, creator_id=self.team.id, receiver_id=self.team.id,
+            start=self.start, end=self.start + timedelta(minutes=30)
+        ))
+        self.db.add(Offset(distance=-5, creator_id=self.rival.id, receiver_id=self.team.id))
+        self.db.add(Challenge(
+            name="Done", description="Completed", latitude=0.0, longitude=0.0,
+            status=ChallengeStatus.COMPLETED, team_id=self.team.id
+        ))
+        self.db.commit()
+
+        run_scoring_tick(self.db)
+
+        scorecard = self.db.query(Scorecard).filter(Scorecard.team_id == self.team.id).one()
+        self.assertAlmostEqual(scorecard.distance_traveled, 12.0, delta=0.05)
+        self.assertAlmostEqual(scorecard.distance_earned, 18.0 - 5, delta=0.1)
+        self.assertEqual(scorecard.challenges_completed, 1)
+
+    def test_scoring_tick_publishes_version(self):
+        """A scoring run that changes any total bumps the scoreboard version once; an idle run writes nothing"""
+        self.assertEqual(get_version(SCOREBOARD_VERSION, self.db), 0)
+        run_scoring_tick(self.db)
+        self.assertEqual(get_version(SCOREBOARD_VERSION, self.db), 1)
+        run_scoring_tick(self.db)
+        self.assertEqual(get_version(SCOREBOARD_VERSION, self.db), 1)
+        self.assertEqual(self.db.query(Scorecard).count(), 2)
+
+        self.db.add(Offset(distance=-1, creator_id=self.rival.id, receiver_id=self.team.id))
+        self.db.commit()
+        run_scoring_tick(self.db)
+        self.assertEqual(get_version(SCOREBOARD_VERSION, self.db), 2)
+
+        # Latest scorecard per team only
+        self.assertEqual(self.db.query(Scorecard).count(), 4)
+        self.assertEqual(len(get_latest_scorecards(self.db)), 2)
+
+    def test_superlatives(self):
+        """Each postgame superlative goes to the right team and ties share the win"""
+        # Rival rides half as far but gets handicapped twice and completes a challenge
+        self.db.add(GpxUpload(team_id=self.rival.id, gpx_data=make_gpx(straight_ride(self.start, 181))))
+        for _ in range(2):
+            self.db.add(Modifier(multiplier=0.5, creator_id=self.team.id, receiver_id=self.rival.id, start=self.start))
+        # Boosting yourself is not a handicap
+        self.db.add(Modifier(multiplier=2, creator_id=self.team.id, receiver_id=self.team.id, start=self.start))
+        for team in (self.team, self.rival):
+            self.db.add(Challenge(
+                name="Done", description="Completed", latitude=0.0, longitude=0.0,
+                status=ChallengeStatus.COMPLETED, team_id=team.id
+            ))
+        self.db.commit()
+
+        results = {superlative["key"]: superlative for superlative in compute_superlatives(self.db)}
+        self.assertEqual(results["most_challenges_complete"]["winners"], ["Riders", "Rivals"])
+        self.assertEqual(results["most_unadjusted_miles"]["winners"], ["Riders"])
+        self.assertAlmostEqual(results["most_unadjusted_miles"]["value"], 12.0, delta=0.05)
+        self.assertEqual(results["longest_stint"]["winners"], ["Riders"])
+        self.assertEqual(results["most_handicaps_accrued"]["winners"], ["Rivals"])
+        self.assertEqual(results["most_handicaps_accrued"]["value"], 2)
+
+    def test_superlatives_from_cleanups(self):
+        """With every latest upload summarized, the superlatives take a fixed number of queries"""
+        from sqlalchemy import event
+
+        success, message = ingest_gpx_upload(
+            self.rival.id, make_gpx(straight_ride(self.start, 181)), db_session=self.db
+        )
+        self.assertTrue(success, message)
+        upload = self.db.query(GpxUpload).filter(GpxUpload.team_id == self.team.id).one()
+        self.db.add(clean_track(upload_track(upload)).to_cleanup(upload.id))
+        self.db.commit()
+
+        statements = []
+        event.listen(self.connection, "before_cursor_execute", lambda *args: statements.append(args[2]))
+        results = {superlative["key"]: superlative for superlative in compute_superlatives(self.db)}
+        self.assertEqual(len([sql for sql in statements if sql.startswith("SELECT")]), 4)
+        self.assertEqual(results["most_unadjusted_miles"]["winners"], ["Riders"])
+        self.assertAlmostEqual(results["most_unadjusted_miles"]["value"], 12.0, delta=0.05)
+        self.assertAlmostEqual(dict(results["longest_stint"]["standings"])["Rivals"], 6.0, delta=0.05)
+
+    def test_geofence_verification(self):
+        """Completions are verified only if the track passed the challenge location during the attempt"""
+        track = parse_gpx(make_gpx(straight_ride(self.start, 361)))
+        # Point 100 of the ride, reached 1000 seconds in
+        lat, lon = float(track.lat[100]), float(track.lon[100])
+        reached = self.start + timedelta(seconds=1000)
+
+        def completed(name, latitude, start):
+            challenge = Challenge(
+                name=name, description="Geofenced", latitude=latitude, longitude=lon,
+                status=ChallengeStatus.COMPLETED, team_id=self.team.id,
+                start=start, end=start + timedelta(minutes=10)
+            )
+            self.db.add(challenge)
+            return challenge
+
+        on_route = completed("On Route", lat, reached - timedelta(minutes=5))
+        off_route = completed("Off Route", lat + 0.05, reached - timedelta(minutes=5))
+        too_early = completed("Too Early", lat, reached - timedelta(minutes=30))
+        self.db.commit()
+
+        run_scoring_tick(self.db)
+
+        self.assertTrue(on_route.location_verified)
+        self.assertFalse(off_route.location_verified)
+        self.assertFalse(too_early.location_verified)
+
+    def test_track_index_cell_lookup(self):
+        """The grid index finds points near a target and ignores points outside the radius or window"""
+        index = TrackIndex([37.0, 37.001, 37.01], [-122.0, -122.0, -122.0], [0, 10, 20], cell_meters=150)
+        self.assertTrue(index.passed_within(37.001, -122.0005, 150, 0, 20))
+        self.assertFalse(index.passed_within(37.001, -122.0005, 150, 15, 20))
+        self.assertFalse(index.passed_within(37.005, -122.0, 150, 0, 20))
+
+    def test_simulation_matches_scoring(self):
+        """With no changes the simulated standings equal what the scoring job computes"""
+        self.db.add(Modifier(multiplier=2, creator_id=self.team.id, receiver_id=self.team.id,
+                             start=self.start, end=self.start + timedelta(minutes=30)))
+        self.db.add(Offset(distance=-1, creator_id=self.team.id, receiver_id=self.rival.id))
+        self.db.commit()
+        run_scoring_tick(self.db)
+
+        scored = {team.name: scorecard.distance_earned for team, scorecard in get_latest_scorecards(self.db)}
+        simulated = {row["team_name"]: row["distance_earned"] for row in ScoringState.load(self.db).standings()}
+        for name in scored:
+            self.assertAlmostEqual(simulated[name], scored[name])
+
+    def test_simulated_rulings(self):
+        """Hypothetical offsets, modifiers and nullified challenges change the ranking without touching the database"""
+        challenge = Challenge(
+            name="Steal", description="Completed", latitude=0.0, longitude=0.0,
+            status=ChallengeStatus.COMPLETED, team_id=self.rival.id
+        )
+        self.db.add(challenge)
+        self.db.flush()
+        self.db.add(Offset(distance=20, creator_id=self.rival.id, receiver_id=self.rival.id, challenge_id=challenge.id))
+        self.db.commit()
+
+        state = ScoringState.load(self.db)
+        self.assertEqual([row["team_name"] for row in state.standings()], ["Rivals", "Riders"])
+
+        standings = Simulation(state).nullify_challenge(challenge.id).standings()
+        self.assertEqual([row["team_name"] for row in standings], ["Riders", "Rivals"])
+        self.assertEqual(standings[1]["change"], -20)
+        self.assertEqual(standings[1]["previous_rank"], 1)
+        self.assertEqual(standings[1]["challenges_completed"], 0)
+
+        # Halving the riders' whole ride only touches the riders
+        simulation = Simulation(state).add_modifier(self.team.id, 0.5).add_offset(self.rival.id, -15)
+        by_name = {row["team_name"]: row for row in simulation.standings()}
+        self.assertAlmostEqual(by_name["Riders"]["distance_earned"], 6.0, delta=0.05)
+        self.assertEqual(by_name["Rivals"]["distance_earned"], 5)
+        # A completed challenge still outranks more distance, as on the scoreboard
+        self.assertEqual(by_name["Rivals"]["rank"], 1)
+
+        # The state is shared and left as loaded
+        self.assertEqual(state.standings()[0]["team_name"], "Rivals")
+        self.assertEqual(self.db.query(Offset).count(), 1)
+        self.assertEqual(self.db.query(Modifier).count(), 0)
+
+    def test_replay_matches_recorded_scores(self):
+        """Replaying with the live parameters reproduces the recorded scorecards, in or out of a process pool"""
+        self.db.add(Offset(distance=-2, creator_id=self.rival.id, receiver_id=self.team.id))
+        self.db.commit()
+        run_scoring_tick(self.db)
+
+        params = ReplayParams()
+        pooled = replay_event(self.db, [params], processes=2)[params]
+        self.assertEqual(pooled, replay_event(self.db, [params], processes=1)[params])
+        for row in diff_scorecards(self.db, pooled):
+            self.assertAlmostEqual(row["earned_change"], 0.0)
+            self.assertEqual(row["replayed_rank"], row["recorded_rank"])
+
+    def test_replay_parameter_sweep(self):
+        """A speed limit below the riding speed prunes the whole ride"""
+        self.db.add(Challenge(
+            name="Done", description="Completed", latitude=0.0, longitude=0.0,
+            status=ChallengeStatus.COMPLETED, team_id=self.rival.id
+        ))
+        self.db.commit()
+        run_scoring_tick(self.db)
+        strict, loose = ReplayParams(max_speed_mph=10), ReplayParams(max_speed_mph=30)
+        results = replay_event(self.db, [strict, loose], processes=1)
+
+        self.assertEqual(results[strict][self.team.id], (0.0, 0.0))
+        self.assertAlmostEqual(results[loose][self.team.id][0], 12.0, delta=0.05)
+        rows = {row["team_name"]: row for row in diff_scorecards(self.db, results[strict])}
+        self.assertAlmostEqual(rows["Riders"]["earned_change"], -12.0, delta=0.05)
+        # Ranked in scoreboard order: the rivals' completed challenge beats the riders' distance
+        self.assertEqual(rows["Rivals"]["recorded_rank"], 1)
+        self.assertEqual([row["team_name"] for row in diff_scorecards(self.db, results[loose])], ["Rivals", "Riders"])
+
+    def test_pipeline_reruns_only_changed_stages(self):
+        """A tick with nothing new is all cache hits; an offset re-runs only the offset and rank stages"""
+        SCORING_PIPELINE.clear()
+        run_scoring_tick(self.db)
+        first = {row["stage"]: row["runs"] for row in SCORING_PIPELINE.report()}
+        self.assertEqual(first, {"parse": 1, "dedupe": 1, "clean": 1, "modifiers": 2, "offsets": 1, "rank": 1})
+
+        def runs_since(previous):
+            return {row["stage"]: row["runs"] - previous.get(row["stage"], 0) for row in SCORING_PIPELINE.report()}
+
+        run_scoring_tick(self.db)
+        self.assertEqual(set(runs_since(first).values()), {0})
+
+        self.db.add(Offset(distance=-5, creator_id=self.rival.id, receiver_id=self.team.id))
+        self.db.commit()
+        run_scoring_tick(self.db)
+        changed = runs_since(first)
+        self.assertEqual({stage for stage, runs in changed.items() if runs}, {"offsets", "rank"})
+
+        # A modifier re-scores only the team that received it
+        self.db.add(Modifier(multiplier=2, creator_id=self.team.id, receiver_id=self.rival.id))
+        self.db.commit()
+        before = {row["stage"]: row["runs"] for row in SCORING_PIPELINE.report()}
+        scorecards = {scorecard.team_id: scorecard for scorecard in run_scoring_tick(self.db)}
+        self.assertEqual(runs_since(before), {"parse": 0, "dedupe": 0, "clean": 0, "modifiers": 1, "offsets": 1, "rank": 1})
+        self.assertAlmostEqual(scorecards[self.team.id].distance_earned, 7.0, delta=0.05)
+        self.assertEqual(scorecards[self.team.id].rank, 1)
+
+        # A completed challenge only re-ranks, and outranks the riders' distance
+        self.db.add(Challenge(
+            name="Done", description="Completed", latitude=0.0, longitude=0.0,
+            status=ChallengeStatus.COMPLETED, team_id=self.rival.id
+        ))
+        self.db.commit()
+        before = {row["stage"]: row["runs"] for row in SCORING_PIPELINE.report()}
+        scorecards = {scorecard.team_id: scorecard for scorecard in run_scoring_tick(self.db)}
+        self.assertEqual({stage for stage, runs in runs_since(before).items() if runs}, {"rank"})
+        self.assertEqual((scorecards[self.rival.id].rank, scorecards[self.team.id].rank), (1, 2))
+
+    def test_offset_totals_follow_offsets(self):
+        """Triggers keep given and received totals current through inserts, updates and deletes"""
+        steal = Offset(distance=-3, creator_id=self.team.id, receiver_id=self.rival.id)
+        self.db.add_all([steal, Offset(distance=-5, creator_id=self.rival.id, receiver_id=self.rival.id)])
+        self.db.commit()
+        self.assertEqual(get_offset_totals(self.db), {self.team.id: (-3, 0), self.rival.id: (-5, -8)})
+
+        steal.receiver_id = self.team.id
+        steal.distance = -2
+        self.db.commit()
+        self.assertEqual(get_offset_totals(self.db), {self.team.id: (-2, -2), self.rival.id: (-5, -5)})
+
+        self.db.delete(steal)
+        self.db.commit()
+        self.assertEqual(get_offset_totals(self.db), {self.team.id: (0, 0), self.rival.id: (-5, -5)})
+        self.assertEqual(check_offset_totals(self.db), [])
+
+    def test_offset_totals_drift_is_reported(self):
+        """The consistency check finds totals that disagree with the offsets table and a rebuild fixes them"""
+        self.db.add(Offset(distance=-5, creator_id=self.rival.id, receiver_id=self.team.id))
+        self.db.commit()
+        self.db.query(TeamOffsetTotal).filter(TeamOffsetTotal.team_id == self.team.id).update({"received": 1.0})
+        self.db.commit()
+
+        drift = check_offset_totals(self.db)
+        self.assertEqual(drift, [{"team_id": self.team.id, "stored": (0.0, 1.0), "actual": (0.0, -5.0)}])
+
+        rebuild_offset_totals(self.db)
+        self.db.commit()
+        self.assertEqual(check_offset_totals(self.db), [])
+
+
+class TestScoringAtScale(DatabaseTestCase):
+    """Test a scoring tick over a full-size event built with the factories"""
+
+    TEAMS = 40
+
+    def setUp(self):
+        """Set up each test with an hour of riding for every team"""
+        super().setUp()
+        self.start = datetime(2024, 6, 1, 10, 0)
+        self.teams = make_teams(self.db, self.TEAMS, "Scale")
+        make_challenges(self.db, self.teams, 10)
+        # Double distance for the first half hour, then twenty one-mile penalties
+        make_modifiers(self.db, self.teams, self.start, 3, multiplier=2.0, minutes=10)
+        make_offsets(self.db, self.teams, 20, distance=-1.0)
+        make_uploads(self.db, self.teams, self.start, 361)
+        self.db.commit()
+
+    def test_every_team_is_scored(self):
+        """Each team rode 12 miles, earned 18 and lost 20 to offsets"""
+        scorecards = run_scoring_tick(self.db)
+        self.assertEqual(len(scorecards), self.TEAMS)
+        for scorecard in scorecards:
+            self.assertAlmostEqual(scorecard.distance_traveled, 12.0, delta=0.05)
+            self.assertAlmostEqual(scorecard.distance_earned, -2.0, delta=0.1)
+        self.assertEqual(check_offset_totals(self.db), [])
+
+        # Nothing changed, so the second tick is all cache hits
+        SCORING_PIPELINE.clear()
+        run_scoring_tick(self.db)
+        run_scoring_tick(self.db)
+        runs = {row["stage"]: row["runs"] for row in SCORING_PIPELINE.report()}
+        self.assertEqual(runs["parse"], self.TEAMS)
+
+
+class TestLatePenalties(DatabaseTestCase):
+    """Test penalizing teams that miss an hourly submission window"""
+
+    def setUp(self):
+        """Set up each test with a fresh database and two teams"""
+        super().setUp()
+
+        self.team = Team(name="Punctual", members=json.dumps(["A"]), color="red", secret_code="ON1")
+        self.rival = Team(name="Tardy", members=json.dumps(["B"]), color="blue", secret_code="LATE1")
+        self.db.add_all([self.team, self.rival])
+        self.db.commit()
+
+        self.event_start = datetime(2024, 6, 1, 10, 0)
+        self.event_end = datetime(2024, 6, 1, 18, 0)
+
+    def upload(self, team, uploaded_at):
+        self.db.add(GpxUpload(team_id=team.id, gpx_data=make_gpx([]), uploaded_at=uploaded_at))
+        self.db.commit()
+
+    def tick(self, now):
+        return run_penalty_tick(self.db, self.event_start, self.event_end, now)
+
+    def test_submission_deadlines(self):
+        """Only closed windows inside the event are checked"""
+        self.assertEqual(submission_deadlines(self.event_start, self.event_end, datetime(2024, 6, 1, 10, 59)), [])
+        self.assertEqual(
+            submission_deadlines(self.event_start, self.event_end, datetime(2024, 6, 1, 12, 10)),
+            [datetime(2024, 6, 1, 11, 0), datetime(2024, 6, 1, 12, 0)]
+        )
+        # A window is only judged once its grace period has passed
+        self.assertEqual(
+            submission_deadlines(self.event_start, self.event_end, datetime(2024, 6, 1, 12, 9)),
+            [datetime(2024, 6, 1, 11, 0)]
+        )
+        self.assertEqual(len(submission_deadlines(self.event_start, self.event_end, datetime(2024, 6, 2))), 8)
+
+    def test_missed_windows_are_penalized(self):
+        """Uploads between :50 and :00 count; early or missing uploads are penalized"""
+        self.upload(self.team, datetime(2024, 6, 1, 10, 55))
+        self.upload(self.team, datetime(2024, 6, 1, 12, 0))
+        self.upload(self.rival, datetime(2024, 6, 1, 10, 40))
+
+        self.assertEqual(self.tick(datetime(2024, 6, 1, 12, 10)), 2)
+
+        penalties = self.db.query(Offset).order_by(Offset.created_at).all()
+        self.assertEqual([(offset.receiver_id, offset.created_at.hour) for offset in penalties],
+                         [(self.rival.id, 11), (self.rival.id, 12)])
+        self.assertEqual(penalties[0].distance, -LATE_PENALTY_MILES)
+
+    def test_penalties_are_idempotent(self):
+        """Rerunning a tick, or catching up later, never penalizes the same miss twice"""
+        self.upload(self.team, datetime(2024, 6, 1, 10, 55))
+        self.assertEqual(self.tick(datetime(2024, 6, 1, 11, 10)), 1)
+        self.assertEqual(self.tick(datetime(2024, 6, 1, 11, 11)), 0)
+        self.assertEqual(self.tick(datetime(2024, 6, 1, 13, 10)), 4)
+        self.assertEqual(self.db.query(Offset).count(), 5)
+
+    def test_queued_upload_is_not_penalized(self):
+        """An on-time upload still being ingested when its window closes isn't counted as missed"""
+        self.assertEqual(self.tick(datetime(2024, 6, 1, 11, 5)), 0)
+        self.upload(self.team, datetime(2024, 6, 1, 10, 58))
+        self.assertEqual(self.tick(datetime(2024, 6, 1, 11, 10)), 1)
+        self.assertEqual([offset.receiver_id for offset in self.db.query(Offset)], [self.rival.id])
+
+    def test_no_event_window(self):
+        """Without an event window in the config nothing is penalized"""
+        self.assertEqual(run_penalty_tick(self.db, now=datetime(2024, 6, 2)), 0)
+        self.assertEqual(self.db.query(Offset).count(), 0)
+
+    def test_penalties_reduce_score(self):
+        """Penalties are applied like any other offset at the next scoring tick"""
+        self.tick(datetime(2024, 6, 1, 11, 10))
+        run_scoring_tick(self.db)
+
+        standings = {team.name: scorecard for team, scorecard in get_latest_scorecards(self.db)}
+        self.assertEqual(standings["Tardy"].distance_earned, -LATE_PENALTY_MILES)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
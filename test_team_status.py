@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the live team status cache
+"""
+
+import unittest
+import json
+from datetime import datetime, timedelta
+
+from sqlalchemy import update
+
+import team_status
+from database import bump_version
+from models import Team, Challenge, ChallengeStatus, Modifier
+from testing import DatabaseTestCase
+
+
+class TestTeamStatus(DatabaseTestCase):
+    """Test the cached per-team status"""
+
+    def setUp(self):
+        """Set up each test with a fresh database session and an empty cache"""
+        super().setUp()
+        self.team = Team(
+            name="Status Team",
+            members=json.dumps(["Rider", "Navigator"]),
+            color="orange",
+            secret_code="STATUS123"
+        )
+        self.rival = Team(
+            name="Rival Team",
+            members=json.dumps(["Saboteur"]),
+            color="black",
+            secret_code="RIVAL123"
+        )
+        self.db.add_all([self.team, self.rival])
+        self.db.commit()
+
+    def _challenge(self, name="Status Challenge"):
+        challenge = Challenge(
+            name=name,
+            description="Testing live status",
+            latitude=0.0,
+            longitude=0.0,
+            status=ChallengeStatus.AVAILABLE,
+            team_id=self.team.id
+        )
+        self.db.add(challenge)
+        self.db.flush()
+        return challenge
+
+    def test_default_status(self):
+        """A team with no challenges or modifiers rides at 1x"""
+        status = team_status.get_team_status(self.team.id, self.db)
+        self.assertIsNone(status.active_challenge_id)
+        self.assertEqual(status.multiplier, 1.0)
+        self.assertIsNone(status.expires_at)
+
+    def test_challenge_lifecycle_updates_status(self):
+        """Starting a challenge pauses distance and completing it restores the multiplier"""
+        team_status.get_team_status(self.team.id, self.db)
+        challenge = self._challenge()
+
+        challenge.start_challenge(self.team.id, self.db)
+        self.db.commit()
+        status = team_status.get_team_status(self.team.id)
+        self.assertEqual(status.active_challenge_id, challenge.id)
+        self.assertEqual(status.active_challenge_name, "Status Challenge")
+        self.assertEqual(status.multiplier, 0)
+
+        challenge.complete_challenge(self.db)
+        status = team_status.get_team_status(self.team.id)
+        self.assertIsNone(status.active_challenge_id)
+        self.assertEqual(status.multiplier, 1.0)
+
+    def test_forfeit_clears_active_challenge(self):
+        """Forfeiting a challenge clears the active challenge"""
+        challenge = self._challenge()
+        challenge.start_challenge(self.team.id, self.db)
+        self.db.commit()
+        self.assertEqual(team_status.get_team_status(self.team.id, self.db).active_challenge_id, challenge.id)
+
+        challenge.forfeit_challenge(self.db)
+        status = team_status.get_team_status(self.team.id)
+        self.assertIsNone(status.active_challenge_id)
+        self.assertEqual(status.multiplier, 1.0)
+
+    def test_rolled_back_challenge_start_is_ignored(self):
+        """A challenge start only reaches the cache once its transaction commits"""
+        team_status.get_team_status(self.team.id, self.db)
+        challenge = self._challenge()
+        challenge.start_challenge(self.team.id, self.db)
+        self.assertIsNone(team_status.get_team_status(self.team.id).active_challenge_id)
+
+        self.db.rollback()
+        status = team_status.get_team_status(self.team.id)
+        self.assertIsNone(status.active_challenge_id)
+        self.assertEqual(status.multiplier, 1.0)
+
+    def test_savepoint_rollback_keeps_outer_changes(self):
+        """Rolling back a SAVEPOINT only drops the changes made inside it"""
+        team_status.get_team_status(self.team.id, self.db)
+        challenge = self._challenge()
+        challenge.start_challenge(self.team.id, self.db)
+        self.db.flush()
+
+        savepoint = self.db.begin_nested()
+        self.db.add(Modifier(multiplier=3, creator_id=self.rival.id, receiver_id=self.team.id, start=datetime.now()))
+        self.db.flush()
+        savepoint.rollback()
+        self.db.commit()
+
+        status = team_status.get_team_status(self.team.id)
+        self.assertEqual(status.active_challenge_id, challenge.id)
+        self.assertEqual(status.multiplier, 0)
+        self.assertEqual(len(status.modifiers), 1)
+
+    def test_writes_from_other_processes_invalidate(self):
+        """A change committed elsewhere is seen once the version row is checked again"""
+        challenge = self._challenge()
+        self.db.commit()
+        self.assertIsNone(team_status.get_team_status(self.team.id, self.db).active_challenge_id)
+
+        # Another process: no listeners here fire, only its version bump reaches this one
+        self.db.execute(update(Challenge).where(Challenge.id == challenge.id).values(status=ChallengeStatus.ACTIVE))
+        bump_version(self.db, team_status.TEAM_STATUS_VERSION)
+        self.db.commit()
+        self.assertIsNone(team_status.get_team_status(self.team.id, self.db).active_challenge_id)
+        self.assertEqual(team_status.get_team_status(self.team.id, self.db, max_age=0).active_challenge_id, challenge.id)
+
+    def test_modifier_insert_updates_multiplier_and_expiry(self):
+        """Committed modifiers stack and expire at their end time"""
+        team_status.get_team_status(self.team.id, self.db)
+        now = datetime.now()
+        boost_end = now + timedelta(minutes=30)
+        self.db.add(Modifier(multiplier=2, creator_id=self.team.id, receiver_id=self.team.id, start=now, end=boost_end))
+        self.db.add(Modifier(multiplier=0.5, creator_id=self.rival.id, receiver_id=self.team.id, start=now))
+        self.db.commit()
+
+        status = team_status.get_team_status(self.team.id)
+        self.assertEqual(status.multiplier, 1.0)
+        self.assertEqual(status.expires_at, boost_end)
+
+        status.refresh(boost_end)
+        self.assertEqual(status.multiplier, 0.5)
+        self.assertIsNone(status.expires_at)
+
+    def test_pending_modifier_sets_expiry(self):
+        """A modifier starting in the future does not apply yet but marks when the status changes"""
+        now = datetime.now()
+        later = now + timedelta(minutes=15)
+        self.db.add(Modifier(multiplier=3, creator_id=self.team.id, receiver_id=self.team.id, start=later))
+        self.db.commit()
+
+        status = team_status.get_team_status(self.team.id, self.db)
+        self.assertEqual(status.multiplier, 1.0)
+        self.assertEqual(status.expires_at, later)
+
+    def test_rolled_back_modifier_is_ignored(self):
+        """Modifiers from a rolled back transaction never reach the cache"""
+        team_status.get_team_status(self.team.id, self.db)
+        self.db.add(Modifier(multiplier=0, creator_id=self.rival.id, receiver_id=self.team.id, start=datetime.now()))
+        self.db.flush()
+        self.db.rollback()
+
+        self.assertEqual(team_status.get_team_status(self.team.id).multiplier, 1.0)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the background job queue and worker
+"""
+
+import unittest
+import json
+from datetime import datetime, timedelta
+from unittest import mock
+
+from sqlalchemy import create_mock_engine
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+
+from database import SessionLocal, insert_for
+from models import Team, GpxUpload, GpxCleanup, Scorecard, Job, JobStatus
+from testing import DatabaseTestCase, make_gpx, straight_ride
+from worker import MAX_ATTEMPTS, enqueue, schedule_periodic_jobs, claim_job, renew_lease, run_job
+
+
+class TestWorker(DatabaseTestCase):
+    """Test leasing, running and retrying jobs"""
+
+    def setUp(self):
+        """Set up each test with a fresh database and one team"""
+        super().setUp()
+        self.team = Team(name="Workers", members=json.dumps(["A"]), color="red", secret_code="WORK1")
+        self.db.add(self.team)
+        self.db.commit()
+        self.now = datetime.now()
+
+    def test_each_job_is_claimed_once(self):
+        """Two workers polling the same queue never lease the same job"""
+        for _ in range(3):
+            enqueue(self.db, "score")
+        self.db.commit()
+
+        def claim_id(db, worker_id):
+            job = claim_job(db, worker_id)
+            job_id = job.id if job is not None else None
+            db.commit()  # End the read so the two sessions' transactions don't overlap
+            return job_id
+
+        other = SessionLocal()
+        try:
+            ids = [claim_id(self.db, "a"), claim_id(other, "b"), claim_id(self.db, "a"), claim_id(other, "b")]
+        finally:
+            other.close()
+        self.assertNotIn(None, ids[:3])
+        self.assertEqual(len(set(ids[:3])), 3)
+        self.assertIsNone(ids[3])
+
+    def test_expired_lease_is_reclaimed(self):
+        """A job whose worker died is picked up again once its lease runs out"""
+        enqueue(self.db, "score", run_after=self.now)
+        self.db.commit()
+        job = claim_job(self.db, "dead", now=self.now, lease_seconds=60)
+        self.assertIsNone(claim_job(self.db, "alive", now=self.now + timedelta(seconds=30)))
+
+        again = claim_job(self.db, "alive", now=self.now + timedelta(seconds=90))
+        self.assertEqual(again.id, job.id)
+        self.assertEqual(again.leased_by, "alive")
+        self.assertEqual(again.attempts, 2)
+
+    def test_abandoned_last_attempt_fails(self):
+        """A job whose lease expires on its last attempt is marked failed rather than left running"""
+        enqueue(self.db, "score", run_after=self.now)
+        self.db.commit()
+        for attempt in range(MAX_ATTEMPTS):
+            job = claim_job(self.db, "dead", now=self.now + timedelta(seconds=90 * attempt), lease_seconds=60)
+        self.assertEqual(job.attempts, MAX_ATTEMPTS)
+
+        self.assertIsNone(claim_job(self.db, "alive", now=self.now + timedelta(seconds=90 * MAX_ATTEMPTS)))
+        self.db.refresh(job)
+        self.assertEqual(job.status, JobStatus.FAILED)
+        self.assertIsNone(job.leased_by)
+        self.assertIn("Lease expired", job.error)
+
+    def test_lease_renewal(self):
+        """Only the worker holding a lease can renew it"""
+        enqueue(self.db, "score", run_after=self.now)
+        self.db.commit()
+        job = claim_job(self.db, "slow", now=self.now, lease_seconds=60)
+        self.assertFalse(renew_lease(self.db, job.id, "other", now=self.now + timedelta(seconds=50)))
+        self.assertTrue(renew_lease(self.db, job.id, "slow", now=self.now + timedelta(seconds=50)))
+        self.assertEqual(job.lease_expires_at, self.now + timedelta(seconds=50 + 300))
+        self.assertIsNone(claim_job(self.db, "other", now=self.now + timedelta(seconds=90)))
+
+    def test_lost_lease_discards_result(self):
+        """A worker whose job was reclaimed doesn't commit its work or overwrite the new lease"""
+        enqueue(self.db, "ingest", {
+            "team_id": self.team.id,
+            "gpx_data": make_gpx(straight_ride(self.now - timedelta(hours=1), 10))
+        }, run_after=self.now)
+        self.db.commit()
+        job = claim_job(self.db, "stalled", now=self.now, lease_seconds=60)
+        claim_job(self.db, "alive", now=self.now + timedelta(seconds=90))
+
+        self.assertIsNone(run_job(self.db, job, "stalled"))
+        self.assertEqual(job.status, JobStatus.RUNNING)
+        self.assertEqual(job.leased_by, "alive")
+        self.assertEqual(self.db.query(GpxUpload).count(), 0)
+
+        self.assertIsNotNone(run_job(self.db, job, "alive"), job.error)
+        self.assertEqual(job.status, JobStatus.DONE)
+        self.assertEqual(self.db.query(GpxUpload).count(), 1)
+
+        # The same goes for handlers that write scorecards
+        enqueue(self.db, "score", run_after=self.now)
+        self.db.commit()
+        job = claim_job(self.db, "stalled", now=self.now, lease_seconds=60)
+        claim_job(self.db, "alive", now=self.now + timedelta(seconds=90))
+        self.assertIsNone(run_job(self.db, job, "stalled"))
+        self.assertEqual(self.db.query(Scorecard).count(), 0)
+
+    def test_ingest_and_score_jobs(self):
+        """Queued uploads are ingested with their submission time and scored"""
+        uploaded_at = self.now - timedelta(minutes=5)
+        enqueue(self.db, "ingest", {
+            "team_id": self.team.id,
+            "gpx_data": make_gpx(straight_ride(self.now - timedelta(hours=1), 361)),
+            "uploaded_at": uploaded_at.isoformat()
+        })
+        enqueue(self.db, "score")
+        self.db.commit()
+
+        while (job := claim_job(self.db, "worker")) is not None:
+            self.assertIsNotNone(run_job(self.db, job, "worker"), job.error)
+
+        upload = self.db.query(GpxUpload).one()
+        self.assertEqual(upload.uploaded_at, uploaded_at)
+        self.assertEqual(self.db.query(GpxCleanup).count(), 1)
+        self.assertAlmostEqual(self.db.query(Scorecard).one().distance_traveled, 12.0, delta=0.05)
+        self.assertEqual({job.status for job in self.db.query(Job)}, {JobStatus.DONE})
+
+    def test_failures(self):
+        """Invalid input fails immediately; other errors are retried with backoff"""
+        enqueue(self.db, "ingest", {"team_id": self.team.id, "gpx_data": "not xml"})
+        enqueue(self.db, "mystery")
+        self.db.commit()
+        for _ in range(2):
+            run_job(self.db, claim_job(self.db, "worker"), "worker")
+        for job in self.db.query(Job):
+            self.assertEqual(job.status, JobStatus.FAILED)
+            self.assertEqual(job.attempts, MAX_ATTEMPTS)
+
+        # A transient error goes back on the queue for later
+        enqueue(self.db, "ingest", {"team_id": self.team.id})
+        self.db.commit()
+        job = claim_job(self.db, "worker")
+        run_job(self.db, job, "worker")
+        self.assertEqual(job.status, JobStatus.QUEUED)
+        self.assertIn("KeyError", job.error)
+        self.assertGreater(job.run_after, datetime.now())
+
+    def test_database_errors_are_retried(self):
+        """A locked database while storing valid GPX requeues the upload instead of failing it"""
+        enqueue(self.db, "ingest", {
+            "team_id": self.team.id,
+            "gpx_data": make_gpx(straight_ride(self.now - timedelta(hours=1), 10))
+        })
+        self.db.commit()
+        job = claim_job(self.db, "worker")
+        locked = OperationalError("INSERT INTO gpx_uploads", {}, Exception("database is locked"))
+        with mock.patch("database.store_gpx_upload", side_effect=locked):
+            self.assertIsNone(run_job(self.db, job, "worker"))
+        self.assertEqual(job.status, JobStatus.QUEUED)
+        self.assertEqual(job.attempts, 1)
+        self.assertIn("database is locked", job.error)
+
+        # The next attempt stores it
+        job = claim_job(self.db, "worker", now=job.run_after)
+        self.assertIsNotNone(run_job(self.db, job, "worker"), job.error)
+        self.assertEqual(job.status, JobStatus.DONE)
+        self.assertEqual(self.db.query(GpxUpload).count(), 1)
+
+    def test_insert_matches_dialect(self):
+        """The job upsert builds for Postgres as well as SQLite"""
+        postgres = Session(bind=create_mock_engine("postgresql://", lambda *args, **kwargs: None))
+        statement = insert_for(postgres, Job).values(kind="score").on_conflict_do_nothing(index_elements=["dedupe_key"])
+        self.assertIn("ON CONFLICT (dedupe_key) DO NOTHING", str(statement.compile(dialect=postgres.get_bind().dialect)))
+        self.assertEqual(type(insert_for(self.db, Job)).__module__, "sqlalchemy.dialects.sqlite.dml")
+
+    def test_periodic_jobs_are_deduplicated(self):
+        """Every worker schedules periodic jobs but each interval gets only one of each"""
+        for _ in range(3):
+            schedule_periodic_jobs(self.db, self.now)
+        self.db.commit()
+        self.assertEqual(sorted(kind for (kind,) in self.db.query(Job.kind)), ["penalties", "score"])
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,188 @@
+"""
+Shared fixtures for the test suite.
+
+The schema is created once per process in an in-memory SQLite database. A DatabaseTestCase test runs
+inside one transaction on that database's only connection. The test's session and every session
+the code under test opens through SessionLocal join it with a SAVEPOINT, so a commit only releases
+the savepoint and the whole test is rolled back afterwards. Nothing is written to the app's database,
+and each pytest-xdist worker is a separate process with its own database. Since every session's
+savepoint is on the same connection, a test that uses two sessions side by side has to end each
+one's transaction before the other starts one. aiosqlite can't reach this in-memory database, so
+the asyncio tests each use a temporary database file instead.
+
+The factories bulk-generate teams, challenges, modifiers, offsets and synthetic GPX rides for tests
+that need more than a handful of rows.
+"""
+
+import json
+import unittest
+from datetime import timedelta, timezone
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.pool import StaticPool
+
+import database
+from database import Base, SessionLocal
+
+# Roughly 0.0145 degrees of latitude per mile
+DEGREES_PER_MILE = 1 / 69.05
+
+_engine = None
+
+
+def get_test_engine():
+    """This process's in-memory engine, with the schema created on first use"""
+    global _engine
+    if _engine is None:
+        import models
+        models.load_models()  # Register every table before creating them
+
+        # One connection shared by every session, so they all see the same in-memory database
+        engine = create_engine("sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False})
+
+        @event.listens_for(engine, "connect")
+        def _disable_implicit_transactions(dbapi_connection, connection_record):
+            # pysqlite's own transaction handling breaks SAVEPOINTs; SQLAlchemy emits BEGIN instead
+            dbapi_connection.isolation_level = None
+
+        @event.listens_for(engine, "begin")
+        def _begin(connection):
+            connection.exec_driver_sql("BEGIN")
+
+        Base.metadata.create_all(bind=engine)
+        _engine = engine
+    return _engine
+
+
+def reset_caches():
+    """Forget every in-process cache derived from database rows"""
+    import admin_metrics
+    import challenge_locks
+    import team_status
+    import track_shards
+    from gpx import clear_track_cache
+    from scoring import SCORING_PIPELINE
+
+    admin_metrics.clear_cache()
+    team_status.invalidate()
+    challenge_locks.clear_cache()
+    track_shards.clear_cache()
+    clear_track_cache()
+    SCORING_PIPELINE.clear()
+
+
+class DatabaseTestCase(unittest.TestCase):
+    """A test on the shared in-memory database whose changes are rolled back afterwards.
+    self.db is a session, and SessionLocal hands out sessions in the same transaction."""
+
+    def setUp(self):
+        self.connection = get_test_engine().connect()
+        self.transaction = self.connection.begin()
+        self._saved_engine = database._engine
+        self._saved_session_kw = dict(SessionLocal.kw)
+        database._engine = get_test_engine()
+        SessionLocal.configure(bind=self.connection, join_transaction_mode="create_savepoint")
+        reset_caches()
+        self.db = SessionLocal()
+
+    def tearDown(self):
+        self.db.close()
+        self.transaction.rollback()
+        self.connection.close()
+        SessionLocal.kw = self._saved_session_kw
+        database._engine = self._saved_engine
+        reset_caches()
+
+
+def make_gpx(points):
+    """Build a GPX document from (lat, lon, ele, datetime) tuples; naive datetimes are local time"""
+    trkpts = "\n".join(
+        f'<trkpt lat="{lat}" lon="{lon}"><ele>{ele}</ele><time>{time.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")}</time></trkpt>'
+        for lat, lon, ele, time in points
+    )
+    return f"""<?xml version="1.0" encoding="UTF-8"?>
+<gpx xmlns="http://www.topografix.com/GPX/1/1" version="1.1" creator="Open GPX Tracker">
+<trk><trkseg>
+{trkpts}
+</trkseg></trk>
+</gpx>"""
+
+
+def straight_ride(start, count, seconds_apart=10, mph=12.0, lat=37.77, lon=-122.42):
+    """Points heading north at a constant speed"""
+    step = mph * seconds_apart / 3600 * DEGREES_PER_MILE
+    return [(lat + i * step, lon, 10.0, start + timedelta(seconds=i * seconds_apart)) for i in range(count)]
+
+
+def make_teams(db, count, prefix="Team"):
+    """Add count teams and flush them"""
+    from models import Team
+
+    teams = [
+        Team(name=f"{prefix} {i}", members=json.dumps([f"Rider {i}"]), color="red", secret_code=f"{prefix.upper()}{i}")
+        for i in range(count)
+    ]
+    db.add_all(teams)
+    db.flush()
+    return teams
+
+
+def make_challenges(db, teams, count):
+    """Add count challenges for every team, as seeding from a config would"""
+    from models import Challenge, ChallengeStatus
+
+    challenges = [
+        Challenge(
+            name=f"Challenge {i}", description=f"Challenge number {i}", latitude=37.77, longitude=-122.42,
+            status=ChallengeStatus.AVAILABLE, team_id=team.id, template_index=i
+        )
+        for team in teams for i in range(count)
+    ]
+    db.add_all(challenges)
+    db.flush()
+    return challenges
+
+
+def make_modifiers(db, teams, start, per_team, multiplier=2.0, minutes=10):
+    """Add per_team back-to-back modifiers of the given length for every team, each created by the next team"""
+    from models import Modifier
+
+    modifiers = [
+        Modifier(
+            multiplier=multiplier, creator_id=teams[(n + 1) % len(teams)].id, receiver_id=team.id, created_at=start,
+            start=start + timedelta(minutes=i * minutes), end=start + timedelta(minutes=(i + 1) * minutes)
+        )
+        for n, team in enumerate(teams) for i in range(per_team)
+    ]
+    db.add_all(modifiers)
+    db.flush()
+    return modifiers
+
+
+def make_offsets(db, teams, per_team, distance=-1.0):
+    """Add per_team offsets for every team, each created by the next team"""
+    from models import Offset
+
+    offsets = [
+        Offset(distance=distance, creator_id=teams[(n + 1) % len(teams)].id, receiver_id=team.id)
+        for n, team in enumerate(teams) for _ in range(per_team)
+    ]
+    db.add_all(offsets)
+    db.flush()
+    return offsets
+
+
+def make_uploads(db, teams, start, points, seconds_apart=10, mph=12.0):
+    """Add one full GPX upload of a straight ride per team, each team on its own meridian"""
+    from models import GpxUpload
+
+    uploads = [
+        GpxUpload(
+            team_id=team.id, uploaded_at=start + timedelta(seconds=points * seconds_apart),
+            gpx_data=make_gpx(straight_ride(start, points, seconds_apart, mph, lon=-122.42 + 0.01 * n))
+        )
+        for n, team in enumerate(teams)
+    ]
+    db.add_all(uploads)
+    db.flush()
+    return uploads
@@ -0,0 +1,169 @@
+"""
+Per-team shard storage for GPX track data.
+
+With the whole event in one SQLite file, every team's hourly upload queues for the same writer lock
+in the last minutes before the hour. When sharding is on (TRACK_SHARD_DIR, set from the
+RIDEATHON_SHARD_DIR environment variable), each team's GPX text is appended to a segments table in
+that team's own SQLite file, so uploads from different teams write their GPX text in parallel. The
+main database keeps the catalog: a sharded GpxUpload records its segment id in place of gpx_data.
+Its cleanup and routes stay in the main database too, since scoring and the map read them across
+all teams, so those small inserts still take the main write lock one upload at a time. A segment is
+written before the main transaction takes its write lock and is never changed afterwards; one whose
+catalog row was rolled back is simply never read. The scoring job prefetches the segments it needs
+from every shard at once.
+
+Shards are found by team id under TRACK_SHARD_DIR, so the directory must stay the same for the life
+of an event.
+"""
+
+import glob
+import os
+import threading
+from collections import OrderedDict, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, create_engine, event, insert, select
+
+TRACK_SHARD_DIR = os.environ.get("RIDEATHON_SHARD_DIR") or None
+SEGMENT_CACHE_SIZE = 256
+SHARD_READ_THREADS = 8
+
+# Shard files have their own schema, kept off Base so it is never created in the main database
+_metadata = MetaData()
+segments = Table(
+    "segments", _metadata,
+    Column("id", Integer, primary_key=True),
+    Column("created_at", DateTime, nullable=False),
+    Column("gpx_data", String, nullable=False),
+)
+
+_engines = {}  # shard path -> engine
+_engines_lock = threading.Lock()
+_segment_cache = OrderedDict()  # (shard path, segment id) -> GPX text
+_cache_lock = threading.Lock()
+
+
+def enabled() -> bool:
+    return TRACK_SHARD_DIR is not None
+
+
+def shard_path(team_id) -> str:
+    return os.path.join(TRACK_SHARD_DIR, f"team_{team_id}.db")
+
+
+def _use_wal(dbapi_connection, connection_record):
+    # Lets the scoring job read a shard while its team is uploading
+    dbapi_connection.execute("PRAGMA journal_mode=WAL")
+
+
+def _engine(path):
+    with _engines_lock:
+        engine = _engines.get(path)
+        if engine is None:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            engine = create_engine(f"sqlite:///{path}")
+            event.listen(engine, "connect", _use_wal)
+            _metadata.create_all(engine)
+            _engines[path] = engine
+        return engine
+
+
+def _remember(path, segment_id, gpx_data):
+    with _cache_lock:
+        _segment_cache[(path, segment_id)] = gpx_data
+        _segment_cache.move_to_end((path, segment_id))
+        while len(_segment_cache) > SEGMENT_CACHE_SIZE:
+            _segment_cache.popitem(last=False)
+
+
+def _cached(path, segment_id):
+    with _cache_lock:
+        return _segment_cache.get((path, segment_id))
+
+
+def write_segment(team_id, gpx_data) -> int:
+    """Append GPX text to a team's shard in its own transaction; returns the segment id"""
+    path = shard_path(team_id)
+    with _engine(path).begin() as connection:
+        segment_id = connection.execute(
+            insert(segments).values(created_at=datetime.now(), gpx_data=gpx_data)
+        ).inserted_primary_key[0]
+    _remember(path, segment_id, gpx_data)
+    return segment_id
+
+
+def read_segment(team_id, segment_id) -> str:
+    path = shard_path(team_id)
+    gpx_data = _cached(path, segment_id)
+    if gpx_data is None:
+        with _engine(path).connect() as connection:
+            gpx_data = connection.execute(
+                select(segments.c.gpx_data).where(segments.c.id == segment_id)
+            ).scalar_one()
+        _remember(path, segment_id, gpx_data)
+    return gpx_data
+
+
+def _read_shard(path, segment_ids):
+    with _engine(path).connect() as connection:
+        rows = connection.execute(
+            select(segments.c.id, segments.c.gpx_data).where(segments.c.id.in_(segment_ids))
+        ).all()
+    for segment_id, gpx_data in rows:
+        _remember(path, segment_id, gpx_data)
+
+
+def prefetch(segment_refs):
+    """Load (team id, segment id) pairs that aren't cached yet, one query per shard, shards in parallel"""
+    wanted = defaultdict(set)
+    for team_id, segment_id in segment_refs:
+        path = shard_path(team_id)
+        if _cached(path, segment_id) is None:
+            wanted[path].add(segment_id)
+    if not wanted:
+        return
+    with ThreadPoolExecutor(max_workers=min(SHARD_READ_THREADS, len(wanted))) as pool:
+        # list() surfaces the first read error
+        list(pool.map(_read_shard, wanted, [sorted(ids) for ids in wanted.values()]))
+
+
+def prefetch_uploads(db, uploads):
+    """Prefetch every segment needed to rebuild these uploads' tracks, following base uploads"""
+    from models import GpxUpload
+
+    team_ids = {upload.team_id for upload in uploads}
+    if not enabled() or not team_ids:
+        return
+    # One catalog query; the chains are walked here rather than through lazy loads
+    catalog = {
+        row.id: row for row in db.query(
+            GpxUpload.id, GpxUpload.base_upload_id, GpxUpload.team_id, GpxUpload.shard_segment_id
+        ).filter(GpxUpload.team_id.in_(team_ids))
+    }
+    refs = []
+    for upload in uploads:
+        upload_id = upload.id
+        while upload_id is not None and upload_id in catalog:
+            row = catalog[upload_id]
+            if row.shard_segment_id is not None:
+                refs.append((row.team_id, row.shard_segment_id))
+            upload_id = row.base_upload_id
+    prefetch(refs)
+
+
+def clear_cache():
+    with _cache_lock:
+        _segment_cache.clear()
+
+
+def clear_shards():
+    """Close every shard and delete the shard files, along with the segment cache"""
+    with _engines_lock:
+        for engine in _engines.values():
+            engine.dispose()
+        _engines.clear()
+    clear_cache()
+    if enabled():
+        for path in glob.glob(os.path.join(TRACK_SHARD_DIR, "team_*.db*")):
+            os.remove(path)
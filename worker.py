@@ -0,0 +1,299 @@
+#!/usr/bin/env python3
+"""
+Background worker for Floatpack Rideathon.
+
+Runs GPX ingest, cleanup backfill, scoring and late penalty jobs outside the Streamlit server so page
+rendering never waits on them. Jobs live in the jobs table. A worker claims the oldest runnable job
+with a single UPDATE ... WHERE id = (SELECT ... FOR UPDATE SKIP LOCKED) ... RETURNING. SQLite
+serializes the write and ignores the row lock clause; Postgres skips rows another worker holds.
+Either way, each job is leased by exactly one worker. While a job runs, a heartbeat thread renews
+its lease; a job whose lease runs out (its worker died) is claimed again, so any number of workers
+can run side by side. Handlers leave their writes uncommitted; finish_job commits them together with
+the job's outcome, and only while the worker still holds the lease.
+
+    python worker.py            # run until interrupted
+    python worker.py --once     # drain the queue and exit
+"""
+
+import argparse
+import json
+import os
+import socket
+import threading
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import and_, or_, select, update
+
+from database import SessionLocal, insert_for
+
+LEASE_SECONDS = 5 * 60
+HEARTBEAT_SECONDS = LEASE_SECONDS / 3
+MAX_ATTEMPTS = 3
+RETRY_BACKOFF_SECONDS = 30
+POLL_SECONDS = 2
+# How often the worker queues each periodic job kind
+PERIODIC_JOBS = {"score": 60, "penalties": 60}
+
+
+class InvalidJob(Exception):
+    """A job whose input won't get any better on a retry"""
+
+
+def default_worker_id():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def enqueue(db, kind, payload=None, run_after=None, dedupe_key=None):
+    """Queue a job (the caller commits). Jobs with a dedupe key that is already queued are skipped."""
+    from models import Job, JobStatus
+
+    statement = insert_for(db, Job).values(
+        kind=kind,
+        payload=json.dumps(payload or {}),
+        dedupe_key=dedupe_key,
+        status=JobStatus.QUEUED,
+        attempts=0,
+        run_after=run_after or datetime.now(),
+        created_at=datetime.now()
+    )
+    if dedupe_key is not None:
+        statement = statement.on_conflict_do_nothing(index_elements=["dedupe_key"])
+    db.execute(statement)
+
+
+def enqueue_gpx_upload(team_id, gpx_data, uploaded_at=None):
+    """Hand a team's GPX submission to the workers; the upload time is the time of submission"""
+    try:
+        db = SessionLocal()
+        try:
+            enqueue(db, "ingest", {
+                "team_id": team_id,
+                "gpx_data": gpx_data,
+                "uploaded_at": (uploaded_at or datetime.now()).isoformat()
+            })
+            db.commit()
+        finally:
+            db.close()
+        return True, "GPX upload received and queued for processing"
+    except Exception as e:
+        return False, f"Error queueing GPX upload: {str(e)}"
+
+
+def schedule_periodic_jobs(db, now=None):
+    """Queue this interval's periodic jobs; every worker calls this and the dedupe key keeps one of each"""
+    now = now or datetime.now()
+    for kind, interval in PERIODIC_JOBS.items():
+        bucket = int(now.timestamp() // interval)
+        enqueue(db, kind, run_after=now, dedupe_key=f"{kind}:{bucket}")
+
+
+def claim_job(db, worker_id, now=None, lease_seconds=LEASE_SECONDS):
+    """Lease the oldest runnable job to this worker and return it, or None if there is nothing to do.
+    Jobs whose lease expired on their last attempt are marked FAILED first."""
+    from models import Job, JobStatus
+
+    now = now or datetime.now()
+    # A job whose worker died on its last attempt would otherwise stay RUNNING forever
+    db.execute(
+        update(Job)
+        .where(Job.status == JobStatus.RUNNING, Job.lease_expires_at < now, Job.attempts >= MAX_ATTEMPTS)
+        .values(
+            status=JobStatus.FAILED,
+            leased_by=None,
+            lease_expires_at=None,
+            finished_at=now,
+            error=f"Lease expired on the last of {MAX_ATTEMPTS} attempts"
+        )
+        .execution_options(synchronize_session=False)
+    )
+    runnable = or_(
+        and_(Job.status == JobStatus.QUEUED, Job.run_after <= now),
+        and_(Job.status == JobStatus.RUNNING, Job.lease_expires_at < now, Job.attempts < MAX_ATTEMPTS)
+    )
+    next_job = (
+        select(Job.id).where(runnable).order_by(Job.run_after, Job.id).limit(1)
+        .with_for_update(skip_locked=True).scalar_subquery()
+    )
+    job_id = db.execute(
+        update(Job).where(Job.id == next_job).where(runnable).values(
+            status=JobStatus.RUNNING,
+            leased_by=worker_id,
+            lease_expires_at=now + timedelta(seconds=lease_seconds),
+            attempts=Job.attempts + 1
+        ).returning(Job.id)
+    ).scalar()
+    db.commit()
+    return db.get(Job, job_id, populate_existing=True) if job_id is not None else None
+
+
+def renew_lease(db, job_id, worker_id, now=None, lease_seconds=LEASE_SECONDS):
+    """Extend a job's lease; returns False if the worker no longer holds it"""
+    from models import Job, JobStatus
+
+    now = now or datetime.now()
+    renewed = db.execute(
+        update(Job)
+        .where(Job.id == job_id, Job.leased_by == worker_id, Job.status == JobStatus.RUNNING)
+        .values(lease_expires_at=now + timedelta(seconds=lease_seconds))
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    db.commit()
+    return renewed == 1
+
+
+class LeaseHeartbeat:
+    """Renews a job's lease from a background thread, with its own session, while the job runs"""
+
+    def __init__(self, job_id, worker_id, interval=HEARTBEAT_SECONDS):
+        self.job_id = job_id
+        self.worker_id = worker_id
+        self.interval = interval
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._beat, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stopped.set()
+        self._thread.join()
+
+    def _beat(self):
+        while not self._stopped.wait(self.interval):
+            db = SessionLocal()
+            try:
+                if not renew_lease(db, self.job_id, self.worker_id):
+                    return
+            except Exception as e:
+                # A locked database only delays the renewal; the next beat tries again
+                print(f"[{self.worker_id}] Could not renew the lease on job {self.job_id}: {str(e)}")
+            finally:
+                db.close()
+
+
+def finish_job(db, job, worker_id, error=None, retry=True, now=None):
+    """Record the outcome of a job this worker holds, together with any uncommitted work of its handler.
+    Failures are retried with backoff until MAX_ATTEMPTS unless retry is False. Returns False, rolling
+    everything back, if the lease was lost to another worker."""
+    from models import Job, JobStatus
+
+    now = now or datetime.now()
+    values = {"leased_by": None, "lease_expires_at": None, "error": error}
+    if error is None:
+        values.update(status=JobStatus.DONE, finished_at=now)
+    elif retry and job.attempts < MAX_ATTEMPTS:
+        values.update(status=JobStatus.QUEUED, run_after=now + timedelta(seconds=RETRY_BACKOFF_SECONDS * job.attempts))
+    else:
+        values.update(status=JobStatus.FAILED, finished_at=now, attempts=max(job.attempts, MAX_ATTEMPTS))
+    finished = db.execute(
+        update(Job)
+        .where(Job.id == job.id, Job.leased_by == worker_id, Job.status == JobStatus.RUNNING)
+        .values(**values)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    if finished != 1:
+        db.rollback()
+        return False
+    db.commit()
+    return True
+
+
+def run_ingest(db, payload):
+    """Store a queued upload. Only invalid GPX fails the job outright; database errors are retried."""
+    from database import clean_gpx_data, gpx_upload_message, store_gpx_upload
+
+    uploaded_at = datetime.fromisoformat(payload["uploaded_at"]) if payload.get("uploaded_at") else None
+    try:
+        cleaned = clean_gpx_data(payload["gpx_data"])
+    except ValueError as e:
+        raise InvalidJob(str(e)) from e
+    upload = store_gpx_upload(db, payload["team_id"], payload["gpx_data"], cleaned, uploaded_at)
+    return gpx_upload_message(upload, cleaned)
+
+
+def run_cleanup(db, payload):
+    """Store the missing GpxCleanup and map routes of every upload that has none"""
+    from models import GpxUpload, GpxCleanup
+    from gpx import clean_track, upload_track
+    from routes import build_missing_routes
+
+    uploads = db.query(GpxUpload).outerjoin(GpxCleanup).filter(GpxCleanup.id.is_(None)).all()
+    for upload in uploads:
+        db.add(clean_track(upload_track(upload)).to_cleanup(upload.id))
+    routed = build_missing_routes(db)
+    return f"Cleaned {len(uploads)} uploads and routed {routed}"
+
+
+def run_score(db, payload):
+    from scoring import pipeline_summary, run_scoring_tick
+
+    return f"Scored {len(run_scoring_tick(db, commit=False))} teams; pipeline so far: {pipeline_summary()}"
+
+
+def run_penalties(db, payload):
+    from penalties import run_penalty_tick
+
+    return f"Applied {run_penalty_tick(db, commit=False)} late submission penalties"
+
+
+JOB_HANDLERS = {
+    "ingest": run_ingest,
+    "cleanup": run_cleanup,
+    "score": run_score,
+    "penalties": run_penalties,
+}
+
+
+def run_job(db, job, worker_id, heartbeat_seconds=HEARTBEAT_SECONDS):
+    """Run a job leased to worker_id and record the outcome; returns the handler's summary, or None on
+    failure or if the lease was lost"""
+    job_id, kind, payload = job.id, job.kind, job.payload
+    handler = JOB_HANDLERS.get(kind)
+    try:
+        if handler is None:
+            raise InvalidJob(f"Unknown job kind: {kind}")
+        with LeaseHeartbeat(job_id, worker_id, heartbeat_seconds):
+            result = handler(db, json.loads(payload))
+    except InvalidJob as e:
+        db.rollback()
+        finish_job(db, job, worker_id, error=str(e), retry=False)
+        return None
+    except Exception as e:
+        db.rollback()
+        finish_job(db, job, worker_id, error=f"{type(e).__name__}: {str(e)}")
+        return None
+    if not finish_job(db, job, worker_id):
+        print(f"[{worker_id}] Lost the lease on {kind} job {job_id}; its result was discarded")
+        return None
+    return result
+
+
+def run_worker(worker_id=None, once=False, poll_seconds=POLL_SECONDS):
+    """Claim and run jobs until interrupted (or, with once, until the queue is empty)"""
+    worker_id = worker_id or default_worker_id()
+    db = SessionLocal()
+    try:
+        while True:
+            if not once:
+                schedule_periodic_jobs(db)
+                db.commit()
+            job = claim_job(db, worker_id)
+            if job is None:
+                if once:
+                    return
+                time.sleep(poll_seconds)
+                continue
+            result = run_job(db, job, worker_id)
+            print(f"[{worker_id}] {job.kind} job {job.id}: {result or job.error}")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run background jobs for the rideathon")
+    parser.add_argument("--once", action="store_true", help="Drain the queue and exit instead of polling")
+    parser.add_argument("--worker-id", help="Name recorded on leased jobs (default: host:pid)")
+    args = parser.parse_args()
+    run_worker(args.worker_id, once=args.once)